@@ -0,0 +1,135 @@
+"""
+admission.py
+推論路徑的流量控制（admission control）與預測快取
+
+AdmissionController：
+  - 同時進行的推論最多 max_inflight 個，其餘在小型等待佇列中排隊
+  - 優先序：interactive（/api/predict、/api/similar）先於 batch（背景工作）；
+    batch 最多只能用 max_inflight − 1 個名額，永遠保留一個給互動請求
+  - 佇列已滿 → 立即 429；排隊超過 deadline → 503；兩者都附 Retry-After
+    （以近期平均服務時間 × 前方排隊數估計），客戶端不會馬上重試把過載放大
+  - 便宜的端點（/api/diseases、快取命中的預測）完全不經過這裡
+
+PredictionCache：同一張圖片（位元組 sha256，與上傳儲存共用）+ 同樣選項 + 同一模型版本 → 直接回傳上次結果。
+"""
+import math
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from metrics import metrics
+
+PRIORITIES      = ("interactive", "batch")
+MAX_RETRY_AFTER = 30
+
+
+class Overloaded(Exception):
+    def __init__(self, status: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status      = status        # 429 佇列已滿 / 503 等待逾時
+        self.retry_after = retry_after   # 秒
+        self.reason      = reason
+
+
+class AdmissionController:
+    def __init__(self, max_inflight: int = 4, max_queue: int = 16, deadline: float = 2.0):
+        self.max_inflight = max_inflight
+        self.max_queue    = max_queue
+        self.deadline     = deadline
+        self.inflight     = 0
+        self.waiting      = {p: 0 for p in PRIORITIES}
+        self._cond        = threading.Condition()
+
+    def _limit(self, priority: str) -> int:
+        return self.max_inflight if priority == "interactive" else max(self.max_inflight - 1, 1)
+
+    def _can_enter(self, priority: str) -> bool:
+        if self.inflight >= self._limit(priority):
+            return False
+        return priority == "interactive" or self.waiting["interactive"] == 0
+
+    def retry_after(self) -> int:
+        """前方排隊數 × 平均服務時間 / 並行數，限制在 1–MAX_RETRY_AFTER 秒"""
+        service = (metrics.mean("admission.service_ms") or 500) / 1000
+        ahead   = sum(self.waiting.values()) + self.inflight
+        return min(max(1, math.ceil(ahead * service / self.max_inflight)), MAX_RETRY_AFTER)
+
+    @contextmanager
+    def slot(self, priority: str = "interactive", deadline: float | None = -1):
+        """
+        取得一個推論名額。deadline：最多排隊幾秒（-1 = 預設值，None = 不限，batch 用）
+        """
+        deadline = self.deadline if deadline == -1 else deadline
+        t0 = time.perf_counter()
+        with self._cond:
+            if not self._can_enter(priority):
+                if priority == "interactive" and self.waiting["interactive"] >= self.max_queue:
+                    metrics.inc("admission.shed.429")
+                    raise Overloaded(429, self.retry_after(), "queue_full")
+                self.waiting[priority] += 1
+                try:
+                    end = None if deadline is None else t0 + deadline
+                    while not self._can_enter(priority):
+                        remaining = None if end is None else end - time.perf_counter()
+                        if remaining is not None and remaining <= 0:
+                            metrics.inc("admission.shed.503")
+                            raise Overloaded(503, self.retry_after(), "deadline")
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting[priority] -= 1
+            self.inflight += 1
+        metrics.observe(f"admission.wait_ms.{priority}", (time.perf_counter() - t0) * 1000)
+        metrics.inc(f"admission.admitted.{priority}")
+
+        t1 = time.perf_counter()
+        try:
+            yield
+        finally:
+            metrics.observe("admission.service_ms", (time.perf_counter() - t1) * 1000)
+            with self._cond:
+                self.inflight -= 1
+                self._cond.notify_all()
+
+    def snapshot(self) -> dict:
+        return {
+            "max_inflight": self.max_inflight,
+            "max_queue":    self.max_queue,
+            "deadline_sec": self.deadline,
+            "inflight":     self.inflight,
+            "queue_depth":  dict(self.waiting),
+            "shed":         {"429": metrics.counter("admission.shed.429"),
+                             "503": metrics.counter("admission.shed.503")},
+        }
+
+
+class PredictionCache:
+    """LRU：key = sha256(圖片位元組) + 選項 + 模型版本（雜湊由呼叫端算一次，上傳儲存共用）"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._items      = OrderedDict()
+        self._lock       = threading.Lock()
+
+    @staticmethod
+    def key(digest: str, options: dict, version: str | None) -> str:
+        opts = "&".join(f"{k}={options[k]}" for k in sorted(options))
+        return f"{digest}|{opts}|{version}"
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is not None:
+                self._items.move_to_end(key)
+        metrics.inc("cache.predict.hits" if hit is not None else "cache.predict.misses")
+        return hit
+
+    def put(self, key: str, result: dict):
+        with self._lock:
+            self._items[key] = result
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
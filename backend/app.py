@@ -1,63 +1,205 @@
 """
 app.py  ─  PhytoScan Flask 後端 API
 """
-import os, io, json, base64, time, re
+import os, io, json, base64, time, re, threading, uuid, hashlib, queue
 from pathlib import Path
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, g
 from flask_cors import CORS
+from flask_sock import Sock
+from simple_websocket import ConnectionClosed
 import numpy as np
 from PIL import Image
 
-app = Flask(__name__)
+from kb_store import KB_COMPILED, normalize_kaggle_class, load_compiled_kb
+from kb_compiled import DiseaseKB, KBWatcher
+from kb_views import KBViews, PrecomputedResponse
+from model_serving import Cascade, image_to_array, image_to_uint8, parse_shape, compact_to_uint8
+import model_registry
+from model_registry import ModelHandle, ModelManager
+from model_routing import Router, QueueFull
+from vector_index import EmbeddingStore
+from metrics import metrics
+from leaf_gate import LeafGate
+from tta import tta_views, tta_average, should_tta
+from tiling import build_pyramid, classify_tiles
+from jobs import JobStore, JobRunner, JobQueueFull, MAX_IMAGES_PER_JOB
+from admission import AdmissionController, Overloaded, PredictionCache
+from decode_pool import DecodePool, DecoderRestarted
+from history import HistoryStore, record_from_result
+from upload_store import UploadStore, UPLOAD_DIR
+from explain import TensorCache, LRUBytes, ExplainBatcher, overlay_png
+from stream import StreamSession, MAX_FRAME_BYTES
+
+app = Flask(__name__, static_folder=None)   # /static 由下方 static_files 送出（含快取標頭）
 CORS(app)
+sock = Sock(app)
 
 BASE_DIR     = Path(__file__).parent
-MODEL_PATH   = BASE_DIR / "models" / "plant_disease_model.keras"
-ALT_MODEL    = BASE_DIR / "models" / "best_model.keras"
+EMBED_DIR    = BASE_DIR / "models" / "embeddings"
 CLASS_JSON   = BASE_DIR / "data"   / "class_names.json"
 DISEASE_JSON = BASE_DIR / "scraped_data" / "diseases.json"
-UPLOAD_DIR   = BASE_DIR / "uploads"
-UPLOAD_DIR.mkdir(exist_ok=True)
+STATIC_DIR   = BASE_DIR / "static"
+TFJS_CURRENT = STATIC_DIR / "tfjs" / "current.json"
 
 IMG_SIZE = (224, 224)
+MAX_SIMILAR_K      = 50
+MAX_SIMILAR_IMAGES = 16   # /api/similar 一次最多幾張查詢圖
+KB_WATCH = os.environ.get("PHYTOSCAN_KB_WATCH", "1") != "0"   # 編譯檔變動時自動切換
+CASCADE  = os.environ.get("PHYTOSCAN_CASCADE", "1") != "0"     # 有校正過的 student 時先跑 student
+GATE     = os.environ.get("PHYTOSCAN_LEAF_GATE", "1") != "0"   # 推論前先擋掉明顯不是葉片的圖片
+MODEL_WATCH = os.environ.get("PHYTOSCAN_MODEL_WATCH", "1") != "0"   # registry CURRENT 變動時自動切換
+ADMIN_TOKEN = os.environ.get("PHYTOSCAN_ADMIN_TOKEN")               # 未設定時停用 /api/admin/*
+# 第二模型：PHYTOSCAN_SECONDARY=<registry 版本>，MODE=shadow|ab，AB_FRACTION=0.1
+SECONDARY      = os.environ.get("PHYTOSCAN_SECONDARY")
+SECONDARY_MODE = os.environ.get("PHYTOSCAN_SECONDARY_MODE", "shadow")
+AB_FRACTION    = float(os.environ.get("PHYTOSCAN_AB_FRACTION", "0.1"))
+TTA_AUTO_BELOW = float(os.environ.get("PHYTOSCAN_TTA_AUTO_BELOW", "0.6"))   # 單一視角信心低於此值自動 TTA；0 = 關閉
+# 流量控制：同時推論數、等待佇列長度、排隊期限（秒）、預測快取筆數
+MAX_INFLIGHT   = int(os.environ.get("PHYTOSCAN_MAX_INFLIGHT", "16"))   # 與批次器 MAX_BATCH 相同：同時 16 個只需一次 forward
+MAX_QUEUE      = int(os.environ.get("PHYTOSCAN_MAX_QUEUE", "32"))
+QUEUE_DEADLINE = float(os.environ.get("PHYTOSCAN_QUEUE_DEADLINE", "2.0"))
+PREDICT_CACHE  = int(os.environ.get("PHYTOSCAN_PREDICT_CACHE", "512"))
+DECODE_WORKERS = int(os.environ.get("PHYTOSCAN_DECODE_WORKERS", "0"))   # 解碼子行程數；0 = 在 request 執行緒解碼
+HISTORY        = os.environ.get("PHYTOSCAN_HISTORY", "1") != "0"       # 辨識紀錄寫入 data/history.sqlite3
+# 上傳圖片保存（uploads/，以 sha256 命名）：容量上限（MB）、保留天數、是否轉成 WebP
+UPLOAD_STORE    = os.environ.get("PHYTOSCAN_UPLOAD_STORE", "1") != "0"
+UPLOAD_MAX_MB   = int(os.environ.get("PHYTOSCAN_UPLOAD_MAX_MB", "2048"))
+UPLOAD_MAX_DAYS = float(os.environ.get("PHYTOSCAN_UPLOAD_MAX_DAYS", "30"))
+UPLOAD_WEBP     = os.environ.get("PHYTOSCAN_UPLOAD_WEBP", "1") != "0"
+# Grad-CAM：保留幾張前處理後的圖（每張 147 KB）、PNG 快取上限（MB）
+EXPLAIN_TENSORS  = int(os.environ.get("PHYTOSCAN_EXPLAIN_TENSORS", "256"))
+EXPLAIN_CACHE_MB = int(os.environ.get("PHYTOSCAN_EXPLAIN_CACHE_MB", "64"))
+# 即時串流（/api/stream）：同時連線數上限、每連線每秒最多推論幾張
+STREAM_MAX_CONN = int(os.environ.get("PHYTOSCAN_STREAM_MAX_CONN", "8"))
+STREAM_MAX_FPS  = float(os.environ.get("PHYTOSCAN_STREAM_MAX_FPS", "4"))
+
+# ─── 全域模型 (lazy load) ──────────────────────────────────────────────────────
+_models      = ModelManager(watch_interval=5.0 if MODEL_WATCH else None)
+_router      = Router()  # 主模型 / shadow / A/B 共用的批次推論
+_class_names = None
+_diseases_db = None      # DiseaseKB: kaggle_class（原始 / normalized）→ disease record
+_kb_watcher  = None
+_kb_views    = None      # (模型版本, KBViews)：綁定目前 KB 與模型版本的預先計算回應
+_similar     = None      # (meta.json 簽章, EmbeddingStore)
+_cascade     = None      # (模型版本, Cascade | None, student 的 ModelHandle | None)
+_leaf_gate   = None
+_jobs        = None      # JobRunner（伺服器啟動時，或第一次用到 /api/jobs 時啟動）
+_load_lock   = threading.Lock()   # 背景 worker 與請求執行緒可能同時觸發首次載入
+_admission   = AdmissionController(MAX_INFLIGHT, MAX_QUEUE, QUEUE_DEADLINE)
+_pred_cache  = PredictionCache(PREDICT_CACHE)
+_decoder     = None      # DecodePool（DECODE_WORKERS > 0 時第一次解碼前建立）
+_history     = None      # HistoryStore（背景批次寫入）
+_uploads     = None      # UploadStore（背景寫入）
+_tensors     = TensorCache(EXPLAIN_TENSORS)       # image hash → 前處理後的 uint8 陣列
+_explain_png = LRUBytes(EXPLAIN_CACHE_MB << 20)   # (image hash, 版本, 類別) → PNG
+_explainers  = {}        # 模型版本 → ExplainBatcher
+_recent_preds = LRUBytes(4096, size=lambda _: 1)  # prediction_id → (image hash, 版本, kaggle_class)，紀錄尚未寫入時用
+_streams     = 0         # 目前的 /api/stream 連線數
+_stream_lock = threading.Lock()
+_stats_resp  = None      # (KBViews, 紀錄 revision, 日期, PrecomputedResponse)
 
-# ─── 工具：統一 kaggle_class 格式 ─────────────────────────────────────────────
-def normalize_kaggle_class(cls: str) -> str:
+def get_model_handle() -> ModelHandle | None:
     """
-    將各種格式統一成 diseases.json 的三底線格式
-    例如：
-      Tomato_Early_blight   → Tomato___Early_blight
-      Tomato__Early_blight  → Tomato___Early_blight
-      Tomato___Early_blight → Tomato___Early_blight（不變）
+    目前上線的模型版本（registry CURRENT，或舊路徑模型）；沒有任何模型時為 None（DEMO）。
+    請求開頭取一次並全程使用，切換發生時仍以同一版本跑完。
     """
-    # 先把所有連續底線壓成單底線
-    cls = re.sub(r'_+', '_', cls)
-    # 再把「植物名_病害名」的分隔改成三底線
-    # 規則：大寫開頭的第二個單字前改成 ___
-    # 例如 Tomato_Early → Tomato___Early
-    cls = re.sub(r'_([A-Z])', r'___\1', cls)
-    return cls
+    handle = _models.current
+    if handle is None and not _models.initialized:
+        with _load_lock:
+            if _models.initialized:
+                return _models.current
+            handle = _models.load_initial()
+            if handle:
+                print(f"✅ 模型載入：{handle.version}")
+                if SECONDARY:
+                    _router.set_secondary(SECONDARY, SECONDARY_MODE, AB_FRACTION)
+            else:
+                print("⚠️  模型未訓練，使用 DEMO 模式")
+    return handle
 
-# ─── 全域模型 (lazy load) ──────────────────────────────────────────────────────
-_model       = None
-_class_names = None
-_diseases_db = None      # dict: normalized_kaggle_class → disease record
-_diseases_by_id = None   # dict: id → disease record
+def _on_model_swap(handle: ModelHandle):
+    """主模型切換後停掉舊版本的批次器（佇列中剩下的請求仍會以舊版跑完）"""
+    keep = {handle.version} | ({_router.secondary.version} if _router.secondary else set())
+    _router.prune(keep)
+    with _load_lock:
+        for version in [v for v in _explainers if v not in keep]:
+            _explainers.pop(version).stop()
+
+_models.on_swap = _on_model_swap
 
 def get_model():
-    global _model
-    if _model is None:
-        path = MODEL_PATH if MODEL_PATH.exists() else (ALT_MODEL if ALT_MODEL.exists() else None)
-        if path:
-            from tensorflow import keras
-            _model = keras.models.load_model(path)
-            print(f"✅ 模型載入：{path.name}")
-        else:
-            _model = "DEMO"
-            print("⚠️  模型未訓練，使用 DEMO 模式")
-    return _model
+    """ServedModel（一次 forward 同時輸出機率與 embedding），沒有模型檔時為 "DEMO" """
+    handle = get_model_handle()
+    return handle.model if handle else "DEMO"
+
+def _cascade_entry(handle: ModelHandle) -> tuple:
+    """(模型版本, Cascade | None, student 的 ModelHandle | None)；模型切換後重新檢查"""
+    global _cascade
+    entry = _cascade
+    if entry is None or entry[0] != handle.version:
+        with _load_lock:
+            if _cascade is None or _cascade[0] != handle.version:
+                cascade  = Cascade.load(handle.model)
+                student  = ModelHandle(cascade.student, handle.class_names, {"role": "student"}) if cascade else None
+                _cascade = (handle.version, cascade, student)
+                if cascade:
+                    print(f"✅ cascade 啟用：min_top1={cascade.min_top1}  min_margin={cascade.min_margin}")
+            entry = _cascade
+    return entry
+
+def get_cascade(handle: ModelHandle | None = None) -> Cascade | None:
+    """student + 校正門檻（models/cascade.json）；未啟用、DEMO 或版本不符時為 None"""
+    handle = handle or get_model_handle()
+    if not CASCADE or handle is None:
+        return None
+    return _cascade_entry(handle)[1]
+
+def cascade_classify(handle: ModelHandle, arr: np.ndarray) -> tuple[np.ndarray, list[str]]:
+    """cascade 的 student 與 full 都經由批次器推論（與其他請求共用 micro-batch 與有上限的佇列）"""
+    _, cascade, student = _cascade_entry(handle)
+    return cascade.classify(arr, lambda b: _router.infer(student, b)[0],
+                            lambda b: _router.infer(handle, b)[0])
+
+def get_decoder() -> DecodePool | None:
+    global _decoder
+    if DECODE_WORKERS > 0 and _decoder is None:
+        with _load_lock:
+            if _decoder is None:
+                _decoder = DecodePool(DECODE_WORKERS)
+                _decoder.warmup()
+                print(f"✅ 解碼子行程：{DECODE_WORKERS} 個（共享記憶體 {_decoder.n_slots} 槽）")
+    return _decoder
+
+def get_history() -> HistoryStore | None:
+    global _history
+    if HISTORY and _history is None:
+        with _load_lock:
+            if _history is None:
+                _history = HistoryStore()
+    return _history
+
+def get_uploads() -> UploadStore | None:
+    global _uploads
+    if UPLOAD_STORE and _uploads is None:
+        with _load_lock:
+            if _uploads is None:
+                _uploads = UploadStore(UPLOAD_DIR, UPLOAD_MAX_MB << 20, UPLOAD_MAX_DAYS, UPLOAD_WEBP)
+    return _uploads
+
+def current_model_version() -> str | None:
+    """不觸發模型載入的版本號（/api/stats 等不需要推論的端點使用）"""
+    handle = _models.current
+    return handle.version if handle else model_registry.expected_version()
+
+def get_leaf_gate() -> LeafGate:
+    global _leaf_gate
+    if _leaf_gate is None:
+        _leaf_gate = LeafGate.load()
+    return _leaf_gate
 
-def get_class_names():
+def get_class_names(handle: ModelHandle | None = None):
+    if handle and handle.class_names:
+        return handle.class_names
     global _class_names
     if _class_names is None:
         if CLASS_JSON.exists():
@@ -67,36 +209,98 @@ def get_class_names():
             _class_names = list(get_diseases_db().keys())
     return _class_names
 
-def get_diseases_db():
-    """回傳以 normalized kaggle_class 為 key 的字典"""
-    global _diseases_db, _diseases_by_id
+def _swap_diseases_db(kb: DiseaseKB):
+    """單一參照替換即為原子切換；進行中的請求仍持有舊物件"""
+    global _diseases_db
+    _diseases_db = kb
+
+def get_diseases_db() -> DiseaseKB:
+    """回傳以 kaggle_class（原始與 normalized 皆可）為 key 的唯讀知識庫"""
+    global _diseases_db, _kb_watcher
     if _diseases_db is None:
-        if DISEASE_JSON.exists():
+        kb = load_compiled_kb(KB_COMPILED)
+        if kb is None and DISEASE_JSON.exists():
             with open(DISEASE_JSON, encoding="utf-8") as f:  # ← 修正編碼
-                data = json.load(f)
-            _diseases_db    = {}
-            _diseases_by_id = {}
-            for d in data["diseases"]:
-                # 同時建立原始 key 和 normalized key，確保兩種格式都能找到
-                original_key   = d.get("kaggle_class", "")
-                normalized_key = normalize_kaggle_class(original_key)
-                _diseases_db[original_key]   = d
-                _diseases_db[normalized_key] = d
-                # 以 id 為 key 的備用字典
-                if d.get("id"):
-                    _diseases_by_id[d["id"]] = d
-        else:
+                kb = DiseaseKB.from_records(json.load(f)["diseases"])
+        elif kb is None:
             from scrape_diseases import STATIC_DISEASES
-            _diseases_db    = {}
-            _diseases_by_id = {}
-            for d in STATIC_DISEASES:
-                key = d.get("kaggle_class", "")
-                _diseases_db[key]                          = d
-                _diseases_db[normalize_kaggle_class(key)]  = d
-                if d.get("id"):
-                    _diseases_by_id[d["id"]] = d
+            kb = DiseaseKB.from_records(STATIC_DISEASES)
+        _diseases_db = kb
+
+        # 編譯檔（build_kb.py 產生）更新時自動切換，不需重啟
+        if KB_WATCH and _kb_watcher is None:
+            _kb_watcher = KBWatcher(KB_COMPILED, _swap_diseases_db)
+            _kb_watcher.start()
     return _diseases_db
 
+def get_kb_views() -> KBViews:
+    """KB 版本變更時重建 /api/diseases、/api/stats 的預先計算回應"""
+    global _kb_views
+    db      = get_diseases_db()
+    version = current_model_version()
+    if _kb_views is None or _kb_views[1].kb is not db or _kb_views[0] != version:
+        meta = model_registry.read_metadata(version) if version in model_registry.list_versions() else {}
+        acc  = meta.get("val_accuracy")
+        # 只回報 registry 實際量測 / 記錄的值；沒有時為 None（前端顯示「—」）
+        _kb_views = version, KBViews(db, stats_extra={
+            "accuracy":              f"{acc * 100:.1f}%" if acc is not None else None,
+            "model_version":         version or "DEMO",
+            "dataset":               meta.get("dataset"),
+        })
+    return _kb_views[1]
+
+def send_precomputed(entry: PrecomputedResponse) -> Response:
+    """
+    強 ETag + If-None-Match → 304；用戶端接受 gzip（q > 0）時直接送預先壓縮的內容。
+    gzip 與原文是不同的 content-coding，強 ETag 必須不同（RFC 7232）：gzip 版加上 -gz；
+    If-None-Match 帶任一個都視為未變更（內容相同，只差編碼）
+    """
+    gz      = request.accept_encodings["gzip"] > 0   # 「gzip;q=0」表示不接受
+    etag    = f"{entry.etag}-gz" if gz else entry.etag
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if request.if_none_match.contains(entry.etag) or request.if_none_match.contains(f"{entry.etag}-gz"):
+        return Response(status=304, headers=headers)
+    if gz:
+        headers["Content-Encoding"] = "gzip"
+        return Response(entry.gzipped, mimetype="application/json", headers=headers)
+    return Response(entry.body, mimetype="application/json", headers=headers)
+
+def get_similar_store() -> EmbeddingStore | None:
+    """相似案例向量庫；build_embeddings.py 重建（meta.json 變動）時重新載入"""
+    global _similar
+    meta = EMBED_DIR / "meta.json"
+    try:
+        st = meta.stat()
+    except FileNotFoundError:
+        return None
+    sig = (st.st_mtime_ns, st.st_size)
+    if _similar is None or _similar[0] != sig:
+        store = EmbeddingStore.load(EMBED_DIR)
+        _similar = (sig, store)
+        print(f"✅ 相似案例向量庫：{len(store)} 筆（{store.index_type}）")
+    return _similar[1]
+
+def similar_matches(store: EmbeddingStore, embeddings: np.ndarray, k: int,
+                    exact: bool = False) -> list[list[dict]]:
+    """每個 embedding 的前 k 筆相似參考圖"""
+    idx, scores = store.search(embeddings, k, exact=exact)
+    out = []
+    for row_idx, row_scores in zip(idx, scores):
+        matches = []
+        for i, score in zip(row_idx, row_scores):
+            if i < 0:
+                continue
+            item = store.items[i]
+            rec  = lookup_disease(item.get("kaggle_class") or "")
+            matches.append({
+                **item,
+                "disease_id":   item.get("disease_id") or rec.get("id"),
+                "disease_name": rec.get("name_zh"),
+                "score":        round(float(score), 4),
+            })
+        out.append(matches)
+    return out
+
 def lookup_disease(kaggle_class: str) -> dict:
     """用 kaggle_class 查詢病害，找不到時嘗試 normalized 版本"""
     db = get_diseases_db()
@@ -108,9 +312,17 @@ def lookup_disease(kaggle_class: str) -> dict:
 
 # ─── 圖片預處理 ────────────────────────────────────────────────────────────────
 def preprocess_image(img: Image.Image) -> np.ndarray:
-    img = img.convert("RGB").resize(IMG_SIZE)
-    arr = np.array(img, dtype=np.float32) / 255.0
-    return np.expand_dims(arr, axis=0)
+    return np.expand_dims(image_to_array(img, IMG_SIZE), axis=0)
+
+def decode_base64(raw: str) -> bytes:
+    """base64（可含 data URL 前綴）→ 原始位元組"""
+    if "," in raw:
+        raw = raw.split(",", 1)[1]
+    return base64.b64decode(raw)
+
+def decode_image_data(raw: str) -> Image.Image:
+    """base64（可含 data URL 前綴）→ PIL 圖片"""
+    return Image.open(io.BytesIO(decode_base64(raw)))
 
 def demo_predict(img_array: np.ndarray):
     db      = get_diseases_db()
@@ -138,38 +350,168 @@ def home():
 
 
 
+@app.after_request
+def add_model_version(resp: Response) -> Response:
+    """用到模型的回應都在標頭標明是哪個版本算出來的"""
+    version = g.get("model_version")
+    if version:
+        resp.headers["X-Model-Version"] = version
+    return resp
+
+# 內容雜湊命名的檔案（disease_images/<32 碼>.jpg、thumbs/<16 碼>-<寬度>.webp）內容永不改變
+HASHED_ASSET  = re.compile(r"(disease_images|thumbs)/[0-9a-f]{16,}(-\d+)?\.\w+"
+                           r"|tfjs/[0-9a-f]{16}/[\w.-]+")   # 瀏覽器模型：目錄名即內容雜湊（export_tfjs.py）
+IMMUTABLE_AGE = 365 * 24 * 3600
+
+@app.route("/static/<path:filename>")
+def static_files(filename):
+    """內容雜湊命名的檔案以 immutable 長效快取送出；其他檔案每次重新驗證（ETag / Last-Modified）"""
+    hashed = HASHED_ASSET.fullmatch(filename) is not None
+    # manifest / current.json 與寫到一半的暫存檔不對外（瀏覽器模型目錄內的 json 除外）
+    if filename.endswith(".tmp") or (filename.endswith(".json") and not hashed):
+        return jsonify({"error": "找不到檔案"}), 404
+    resp = send_from_directory(STATIC_DIR, filename, max_age=IMMUTABLE_AGE if hashed else 0)
+    resp.headers["Cache-Control"] = (f"public, max-age={IMMUTABLE_AGE}, immutable" if hashed
+                                     else "no-cache")
+    return resp
+
+@app.route("/api/model/browser")
+def browser_model():
+    """瀏覽器本機辨識用的 TF.js 模型（export_tfjs.py 產生）：網址、類別 / 病害對照、升級到 /api/predict 的門檻"""
+    try:
+        info = json.loads(TFJS_CURRENT.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return jsonify({"error": "尚未匯出瀏覽器模型（python export_tfjs.py）"}), 404
+    resp = jsonify({**info, "server_model_version": current_model_version()})
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
 @app.route("/api/health")
 def health():
-    return jsonify({"status": "ok", "model": "DEMO" if get_model() == "DEMO" else "loaded"})
+    handle = get_model_handle()
+    return jsonify({"status": "ok", "model": "loaded" if handle else "DEMO",
+                    "model_version": handle.version if handle else None})
+
+def _admin_denied():
+    """PHYTOSCAN_ADMIN_TOKEN 未設定時停用；請求需帶 Authorization: Bearer <token>"""
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "管理端點未啟用（未設定 PHYTOSCAN_ADMIN_TOKEN）"}), 403
+    auth = request.headers.get("Authorization", "")
+    if auth != f"Bearer {ADMIN_TOKEN}":
+        return jsonify({"error": "未授權"}), 401
+    return None
+
+@app.route("/api/admin/uploads/<digest>")
+def admin_upload(digest):
+    """以紀錄的 image_hash 取回保存的上傳圖片（重新標註 / 除錯用）"""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    uploads = get_uploads()
+    if uploads is None or not re.fullmatch(r"[0-9a-f]{64}", digest):
+        return jsonify({"error": "找不到此圖片"}), 404
+    path = uploads.path(digest)
+    if not path.exists():
+        return jsonify({"error": "找不到此圖片（可能已超過保留期限）"}), 404
+    return send_from_directory(path.parent, path.name,
+                               mimetype="image/webp" if uploads.reencode else "application/octet-stream")
+
+@app.route("/api/admin/model", methods=["GET"])
+def admin_model_status():
+    denied = _admin_denied()
+    if denied:
+        return denied
+    handle = _models.current
+    return jsonify({
+        "current":   handle.version if handle else None,
+        "metadata":  handle.metadata if handle else None,
+        "loaded_at": handle.loaded_at if handle else None,
+        "registry":  {"CURRENT": model_registry.current_version(),
+                      "versions": model_registry.list_versions()},
+        "swap":      _models.status,
+        "history":   _models.history,
+    })
+
+@app.route("/api/admin/model", methods=["POST"])
+def admin_model_swap():
+    """{"version": "v20250101-120000"}：設為 CURRENT 並在背景載入、預熱後切換（202）"""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    version = (request.get_json(silent=True) or {}).get("version")
+    if version:
+        try:
+            model_registry.set_current(version)   # 寫回 CURRENT，watcher 才不會切回舊版
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 404
+    if not _models.swap(version):
+        return jsonify({"error": "已有切換進行中", "swap": _models.status}), 409
+    return jsonify({"accepted": True, "swap": _models.status}), 202
+
+@app.route("/api/admin/secondary", methods=["GET", "POST", "DELETE"])
+def admin_secondary():
+    """
+    GET：shadow / A/B 狀態（一致率、各模型延遲與 batch 大小）
+    POST {"version": ..., "mode": "shadow" | "ab", "fraction": 0.1}：背景載入後開始分流（202）
+    DELETE：停用 secondary
+    """
+    denied = _admin_denied()
+    if denied:
+        return denied
+    if request.method == "POST":
+        body    = request.get_json(silent=True) or {}
+        version = body.get("version")
+        if version not in model_registry.list_versions():
+            return jsonify({"error": f"registry 中沒有版本 {version}"}), 404
+        try:
+            _router.set_secondary(version, body.get("mode", "shadow"), float(body.get("fraction", 0.1)))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"accepted": True, "status": _router.status}), 202
+    if request.method == "DELETE":
+        _router.clear_secondary()
+    return jsonify(_router.report(_models.current))
 
 @app.route("/api/diseases")
 def diseases():
-    db = get_diseases_db()
-    seen = set()
-    result = []
-    for d in db.values():
-        did = d.get("id")
-        if did in seen:
-            continue
-        seen.add(did)
-        result.append({
-            "id":             d.get("id"),
-            "name_zh":        d.get("name_zh"),
-            "name_en":        d.get("name_en"),
-            "pathogen":       d.get("pathogen"),
-            "category":       d.get("category"),
-            "severity":       d.get("severity"),
-            "severity_level": d.get("severity_level"),
-            "host_plants":    d.get("host_plants", []),
-            "images":         d.get("images", [])[:1],
-        })
-    return jsonify({"diseases": result, "total": len(result)})
+    # ?page=&per_page= 分頁、?fields=id,name_zh 投影；皆由預先計算的摘要清單切出
+    fields = tuple(f.strip() for f in request.args.get("fields", "").split(",") if f.strip())
+    try:
+        entry = get_kb_views().diseases(
+            page=request.args.get("page", type=int),
+            per_page=request.args.get("per_page", type=int),
+            fields=fields or None,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return send_precomputed(entry)
+
+@app.route("/api/diseases/search")
+def disease_search():
+    # ?q=關鍵字&category=&severity=&limit=
+    q = request.args.get("q", "").strip()
+    if not q:
+        return jsonify({"error": "請提供查詢字串 q"}), 400
+    views = get_kb_views()
+    index = views.search_index   # 每個 KB 版本只建一次
+    t0    = time.perf_counter()
+    hits, total = index.search(
+        q,
+        category=request.args.get("category") or None,
+        severity=request.args.get("severity") or None,
+        limit=request.args.get("limit", 20, type=int),
+    )
+    results = [dict(views.summaries[doc], score=round(score, 3)) for doc, score in hits]
+    return jsonify({
+        "query":   q,
+        "results": results,
+        "total":   total,
+        "took_ms": round((time.perf_counter() - t0) * 1000, 3),
+    })
 
 @app.route("/api/diseases/<disease_id>")
 def disease_detail(disease_id):
-    global _diseases_by_id
-    get_diseases_db()  # 確保已初始化
-    record = _diseases_by_id.get(disease_id)
+    record = get_diseases_db().by_id(disease_id)
     if not record:
         # fallback：用 kaggle_class 查
         record = lookup_disease(disease_id)
@@ -179,58 +521,320 @@ def disease_detail(disease_id):
 
 @app.route("/api/stats")
 def stats():
-    db   = get_diseases_db()
-    seen = set()
-    unique = []
-    for d in db.values():
-        if d.get("id") not in seen:
-            seen.add(d.get("id"))
-            unique.append(d)
+    """KB 部分每個版本預先計算；辨識次數來自紀錄的計數器，每批寫入後才重建一次"""
+    global _stats_resp
+    views, history = get_kb_views(), get_history()
+    if history is None:
+        return send_precomputed(views.stats())
+    key = (views, history.revision, time.strftime("%Y-%m-%d"))
+    if _stats_resp is None or _stats_resp[:3] != key:
+        _stats_resp = (*key, PrecomputedResponse({**views.stats_payload, **history.summary()}))
+    return send_precomputed(_stats_resp[3])
+
+@app.route("/api/history")
+def history_view():
+    """
+    辨識紀錄：最近 limit 筆（以 before=<created_at> 往前翻頁）+ 依類別 / 日期 / 模型版本的累計。
+    累計值由寫入執行緒增量維護，不掃描紀錄表。
+    """
+    history = get_history()
+    if history is None:
+        return jsonify({"error": "辨識紀錄未啟用"}), 404
+    limit = min(max(_int_option(request.args, "limit") or 20, 1), 100)
+    days  = min(max(_int_option(request.args, "days") or 30, 1), 366)
+    try:
+        before = float(request.args["before"]) if "before" in request.args else None
+    except ValueError:
+        return jsonify({"error": "before 必須是時間戳記"}), 400
+    items = history.recent(limit, before)
     return jsonify({
-        "total_diseases":        len(unique),
-        "total_identifications": 1389,
-        "accuracy":              "94.3%",
-        "model_version":         "v2.1",
-        "dataset":               "PlantVillage (Kaggle) — 54,305 張",
-        "categories": {
-            "真菌性病害": sum(1 for d in unique if d.get("category") == "真菌性病害"),
-            "細菌性病害": sum(1 for d in unique if d.get("category") == "細菌性病害"),
-            "卵菌性病害": sum(1 for d in unique if d.get("category") == "卵菌性病害"),
-            "健康":       sum(1 for d in unique if d.get("category") == "健康"),
-        }
+        "items":       items,
+        "next_before": items[-1]["created_at"] if len(items) == limit else None,
+        **history.aggregates(days),
     })
 
+@app.route("/api/metrics")
+def metrics_view():
+    snap = metrics.snapshot()
+    cascade = get_cascade()
+    answered = {s: metrics.counter(f"predict.stage.{s}") for s in ("student", "full")}
+    snap["cascade"] = {
+        "enabled":          cascade is not None,
+        "min_top1":         cascade.min_top1 if cascade else None,
+        "min_margin":       cascade.min_margin if cascade else None,
+        "answered":         answered,
+        "student_fraction": round(answered["student"] / max(sum(answered.values()), 1), 4),
+    }
+    checked = metrics.counter("gate.checked")
+    snap["leaf_gate"] = {
+        "enabled":                GATE,
+        "classifier":             bool(GATE and get_leaf_gate().classifier),
+        "checked":                checked,
+        "rejected":               metrics.counter("gate.rejected"),
+        "short_circuit_fraction": round(metrics.counter("gate.rejected") / max(checked, 1), 4),
+        "saved_ms_estimate":      metrics.counter("gate.saved_ms"),
+    }
+    snap["routing"] = _router.report(_models.current)
+    snap["stream"] = {
+        "connections":   _streams,
+        "max_conn":      STREAM_MAX_CONN,
+        "max_fps":       STREAM_MAX_FPS,
+        **{k: metrics.counter(f"stream.frames_{k}")
+           for k in ("received", "inferred", "skipped", "dropped", "rate_limited")},
+    }
+    uploads = get_uploads()
+    snap["uploads"] = {
+        "enabled":      uploads is not None,
+        "stored":       metrics.counter("uploads.stored"),
+        "dedup":        metrics.counter("uploads.dedup"),
+        "dropped":      metrics.counter("uploads.dropped"),
+        "evicted":      metrics.counter("uploads.evicted"),
+        "write_errors": metrics.counter("uploads.write_errors"),
+        "bytes_in":     metrics.counter("uploads.bytes_in"),
+        "bytes_stored": metrics.counter("uploads.bytes_stored"),
+        "disk_bytes":   uploads.total if uploads else None,
+    }
+    history = get_history()
+    snap["history"] = {
+        "enabled":      history is not None,
+        "rows":         metrics.counter("history.rows"),
+        "batches":      metrics.counter("history.batches"),
+        "dropped":      metrics.counter("history.dropped"),
+        "write_errors": metrics.counter("history.write_errors"),
+    }
+    hits, misses = metrics.counter("cache.predict.hits"), metrics.counter("cache.predict.misses")
+    snap["admission"] = {
+        **_admission.snapshot(),
+        "predict_cache": {
+            "entries":  len(_pred_cache),
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+        },
+    }
+    return jsonify(snap)
+
 @app.route("/api/predict", methods=["POST"])
 def predict():
+    """
+    圖片可為 multipart image、JSON image_data（base64），或 application/octet-stream 的 body。
+    用戶端已縮成 224×224 時加上 X-Image-Shape: 224,224,3（JSON 可改用 image_shape 欄位）：
+    內容為 224×224×3 的 RGB uint8，或剛好 224×224 的 JPEG / WebP，伺服器跳過縮放（raw 連解碼都省掉）。
+    """
     # ── 取得圖片 ────────────────────────────────────────────────────────────────
+    shape = request.headers.get("X-Image-Shape")
     try:
         if "image" in request.files:
-            img = Image.open(request.files["image"].stream)
+            data = request.files["image"].read()
         elif request.is_json and "image_data" in request.json:
-            raw = request.json["image_data"]
-            if "," in raw:
-                raw = raw.split(",", 1)[1]
-            img = Image.open(io.BytesIO(base64.b64decode(raw)))
+            data  = decode_base64(request.json["image_data"])
+            shape = request.json.get("image_shape") or shape
+        elif request.mimetype == "application/octet-stream":
+            data = request.get_data()
         else:
-            return jsonify({"error": "請提供圖片（multipart image 或 JSON image_data）"}), 400
+            return jsonify({"error": "請提供圖片（multipart image、JSON image_data 或 octet-stream body）"}), 400
+        if shape is not None:
+            shape = parse_shape(str(shape))
     except Exception as e:
         return jsonify({"error": f"圖片解析失敗：{e}"}), 400
+    if not data:
+        return jsonify({"error": "圖片內容為空"}), 400
+
+    result, status, headers = predict_bytes(data, request.args, shape=shape)
+    if "model_version" in result:
+        g.model_version = result["model_version"]
+    resp = jsonify(result)
+    resp.status_code = status
+    resp.headers.update(headers)
+    return resp
+
+PREDICT_OPTIONS = ("tta", "tiles", "similar", "skip_gate")
+
+def _overloaded_body(e: Overloaded) -> tuple[dict, int, dict]:
+    return ({"error": "伺服器忙碌中，請稍後再試", "reason": e.reason, "retry_after": e.retry_after},
+            e.status, {"Retry-After": str(e.retry_after)})
+
+def predict_bytes(data: bytes, opts, priority: str = "interactive",
+                  shape: tuple[int, ...] | None = None) -> tuple[dict, int, dict]:
+    """
+    快取 → 流量控制 → identify。回傳 (回應 dict, HTTP 狀態碼, 額外 headers)。
+    priority="batch"（背景工作）不設排隊期限，但互動請求等待時會讓位。
+    shape：用戶端宣告的已縮小圖片形狀（見 predict），有的話不走解碼子行程、不縮放
+    """
+    options = {k: str(opts[k]) for k in PREDICT_OPTIONS if k in opts}
+    if shape is not None and options.get("tiles") == "1":
+        return {"error": "切塊辨識（tiles=1）需要原始尺寸的圖片"}, 400, {}
+    version = current_model_version()
+    digest  = hashlib.sha256(data).hexdigest()   # 快取 key、上傳檔名、紀錄的 image_hash 共用
+    key     = _pred_cache.key(digest, {**options, "shape": shape} if shape else options, version)
+    hit     = _pred_cache.get(key)
+    stored  = data
+    if shape is not None and len(data) == np.prod(shape):
+        # raw 像素沒有檔頭：上傳儲存改收 (H, W, 3) 陣列，由寫入執行緒編碼
+        stored = np.frombuffer(data, dtype=np.uint8).reshape(shape)
+    if hit is not None:
+        return _record({**hit, "cached": True}, priority, digest, stored), 200, {}
+
+    try:
+        with _admission.slot(priority, deadline=-1 if priority == "interactive" else None):
+            decoder = get_decoder() if options.get("tiles") != "1" and shape is None else None   # 切塊需要原圖
+            try:
+                if shape is not None:
+                    tensor, kind = compact_to_uint8(data, shape, IMG_SIZE)
+                    img, arr = None, tensor[None].astype(np.float32) / 255.0
+                    metrics.inc(f"predict.compact.{kind}")
+                else:
+                    img, arr = (None, decoder.decode(data)) if decoder else (Image.open(io.BytesIO(data)), None)
+            except TimeoutError:
+                return {"error": "伺服器忙碌中，請稍後再試"}, 503, {"Retry-After": "1"}
+            except DecoderRestarted:   # 解碼子行程異常結束（pool 已重建），不是圖片格式錯誤
+                metrics.inc("decode.worker_restarts")
+                return {"error": "圖片解碼失敗，請稍後再試"}, 503, {"Retry-After": "1"}
+            except Exception as e:
+                return {"error": f"圖片解析失敗：{e}"}, 400, {}
+            result, status = identify(img, options, arr, digest)
+    except Overloaded as e:
+        return _overloaded_body(e)
+
+    if status == 503:   # 批次器佇列已滿
+        return result, status, {"Retry-After": str(_admission.retry_after())}
+    # DEMO 是隨機結果、A/B 的 secondary 回答不代表主模型，都不快取
+    if status == 200 and result.get("mode") == "MODEL" and result.get("model_version") == version:
+        _pred_cache.put(key, result)
+    if status == 200:
+        result = _record(result, priority, digest, stored)
+    return result, status, {}
+
+def _record(result: dict, priority: str, digest: str, data: bytes | np.ndarray) -> dict:
+    """
+    模型的回答排入辨識紀錄、圖片排入上傳儲存（都不等寫入），並附上 prediction_id；
+    DEMO 結果不記錄。兩者以 digest 連結：紀錄的 image_hash 即上傳檔名。
+    """
+    if result.get("mode") != "MODEL":
+        return result
+    uploads = get_uploads()
+    stored  = uploads is not None and uploads.put(digest, data)
+    pid     = uuid.uuid4().hex
+    _recent_preds.put(pid, (digest, result["model_version"], result["primary"]["kaggle_class"]))
+    history = get_history()
+    if history is not None:
+        history.add(record_from_result(pid, result, "job" if priority == "batch" else "api",
+                                       digest if stored else None))
+    return {**result, "prediction_id": pid}
+
+def _int_option(opts, key: str) -> int:
+    try:
+        return int(opts.get(key) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def identify(img: Image.Image | None, opts, arr: np.ndarray | None = None,
+             digest: str | None = None) -> tuple[dict, int]:
+    """
+    單張圖片的完整辨識流程（/api/predict 與背景工作共用）。
+    opts：查詢參數（tta / tiles / similar / skip_gate，值為字串）；回傳 (回應 dict, HTTP 狀態碼)
+    arr：已由解碼子行程前處理好的 (1, 224, 224, 3)，有的話 img 可為 None（不支援 tiles）
+    digest：圖片 sha256；有的話把前處理後的陣列留給 /api/explain
+    """
+    busy = {"error": "伺服器忙碌中，請稍後再試"}
+    try:
+        # tiles=1：大圖切塊，只縮小解碼一次成金字塔，整張縮圖也從金字塔取
+        pyramid = build_pyramid(img) if opts.get("tiles") == "1" else None
+        if arr is None:
+            arr = preprocess_image(pyramid.thumbnail() if pyramid else img)
+    except Exception as e:
+        return {"error": f"圖片解析失敗：{e}"}, 400
 
-    # ── 推論 ─────────────────────────────────────────────────────────────────────
-    t0    = time.time()
-    arr   = preprocess_image(img)
-    model = get_model()
+    # ── 葉片篩選：明顯不是植物的圖片不進模型（?skip_gate=1 可略過）─────────────────
+    if GATE and opts.get("skip_gate") != "1":
+        tg   = time.perf_counter()
+        gate = get_leaf_gate().check(arr[0])
+        metrics.observe("gate.check_ms", (time.perf_counter() - tg) * 1000)
+        metrics.inc("gate.checked")
+        if not gate.ok:
+            metrics.inc("gate.rejected")
+            metrics.inc(f"gate.reason.{gate.reason}")
+            # 省下的運算以近期實際推論延遲的平均估計
+            metrics.inc("gate.saved_ms", round(metrics.mean("predict.infer_ms") or 0))
+            return {
+                "success":  False,
+                "rejected": True,
+                "reason":   gate.reason,
+                "error":    gate.message,
+                "features": {k: round(v, 4) for k, v in gate.features.items()},
+                "score":    gate.score,
+            }, 422
 
-    if model == "DEMO":
+    handle  = get_model_handle()   # 整個請求使用同一版本，切換中也不受影響
+    cascade = get_cascade(handle)  # 模型載入不計入推論延遲
+    answer  = _router.choose(handle) if handle else None   # A/B：部分請求改由 secondary 回答
+    version = answer.version if answer else "DEMO"
+    t0      = time.time()
+
+    embedding, tiled = None, None
+    want_similar = _int_option(opts, "similar")
+    if answer is None:
         classes, probs = demo_predict(arr)
-        mode = "DEMO"
+        mode, stage = "DEMO", "demo"
+    elif pyramid is not None and pyramid.tileable:
+        classes = get_class_names(answer)
+        try:
+            tiled = classify_tiles(pyramid, lambda batch: _router.infer(answer, batch)[0], classes)
+            probs = tiled["probs"]
+            if probs is None:   # 所有圖塊都是背景：退回整張縮圖
+                probs = _router.infer(answer, arr)[0][0][:len(classes)]
+        except QueueFull:
+            return busy, 503
+        mode, stage = "MODEL", "tiles"
+    elif cascade and answer is handle and not want_similar:   # 相似案例需要主模型的 embedding
+        try:
+            raw_pred, stages = cascade_classify(handle, arr)
+        except QueueFull:
+            return busy, 503
+        classes  = get_class_names(handle)
+        probs    = raw_pred[0][:len(classes)]
+        mode, stage = "MODEL", stages[0]
     else:
-        raw_pred = model.predict(arr, verbose=0)[0]
-        classes  = get_class_names()
-        probs    = raw_pred[:len(classes)]
-        mode     = "MODEL"
+        try:
+            raw_pred, embedding = _router.infer(answer, arr)
+        except QueueFull:
+            return busy, 503
+        classes  = get_class_names(answer)
+        probs    = raw_pred[0][:len(classes)]
+        mode, stage = "MODEL", "full" if answer is handle else "ab"
+
+    # ── TTA：?tta=1 強制、?tta=0 關閉，否則單一視角信心不足時自動啟用 ─────────────────
+    tta_arg, tta = opts.get("tta"), None
+    single_top1  = int(np.argsort(probs)[-1])
+    single_stage = stage   # 單一視角由哪個模型回答（shadow 依此分開統計一致率）
+    if mode == "MODEL" and stage != "tiles" and tta_arg != "0" and (tta_arg == "1" or should_tta(probs, TTA_AUTO_BELOW)):
+        views = tta_views(arr)
+        reuse = stage != "student"   # 單一視角已由主模型算過時只補跑其他視角
+        try:
+            extra, _ = _router.infer(answer, views[1:] if reuse else views)
+        except QueueFull:
+            return busy, 503
+        stacked = np.concatenate([raw_pred[:1], extra]) if reuse else extra
+        tta = {
+            "views":                  len(views),
+            "trigger":                "forced" if tta_arg == "1" else "auto",
+            "single_view_confidence": round(float(probs[single_top1]), 4),
+            "single_view_stage":      single_stage,
+        }
+        if not reuse:   # 所有視角都由主模型重算：最終機率來自主模型
+            stage = "full"
+        probs = tta_average(stacked[:, :len(classes)])
+        metrics.inc(f"predict.tta.{tta['trigger']}")
 
-    elapsed = round(time.time() - t0, 2)
+    infer_ms = (time.time() - t0) * 1000
+    elapsed  = round(infer_ms / 1000, 2)
+    metrics.inc("predict.requests")
+    metrics.inc(f"predict.stage.{stage}")
+    metrics.observe("predict.infer_ms", infer_ms)
+    metrics.observe(f"predict.stage.{stage}_ms", infer_ms)
+    if tta:
+        metrics.observe("predict.tta_ms", infer_ms)
+    if tiled:
+        metrics.inc("predict.tiles.total", tiled["stats"]["tiles_total"])
+        metrics.inc("predict.tiles.evaluated", tiled["stats"]["tiles_evaluated"])
 
     # ── 整理結果 ─────────────────────────────────────────────────────────────────
     top_idx = np.argsort(probs)[::-1]
@@ -259,15 +863,305 @@ def predict():
             "value": float(probs[i]) * 100,
         })
 
-    return jsonify({
+    result = {
         "success":        True,
         "mode":           mode,
+        "model_version":  version,
+        "stage":          stage,
         "elapsed_sec":    elapsed,
         "primary":        primary,
         "top3":           top3,
         "distribution":   distribution,
         "disease_detail": detail,
-    })
+    }
+    if tta:
+        result["tta"] = tta
+    if tiled:
+        result["tiles"] = {"heat": tiled["heat"], "tiles": tiled["tiles"], **tiled["stats"]}
+
+    # ?similar=k：沿用同一次 forward 的 embedding 查相似案例，不再推論一次
+    if want_similar > 0 and embedding is not None:
+        store = get_similar_store()
+        if store is not None and store.model_version == answer.version:
+            result["similar"] = similar_matches(store, embedding, min(want_similar, MAX_SIMILAR_K))[0]
+
+    # shadow：同一個已前處理的陣列複製給 secondary，回應不等它（以單一視角結果比對，
+    # 標明該結果來自 student 或主模型，一致率分開計算）
+    if answer is not None and answer is handle:
+        _router.shadow(handle, arr, classes[single_top1], single_stage)
+    if digest and answer is not None:
+        _tensors.put(digest, arr)
+    return result, 200
+
+# ─── Grad-CAM ──────────────────────────────────────────────────────────────────
+def get_explainer(handle: ModelHandle) -> ExplainBatcher:
+    with _load_lock:
+        ex = _explainers.get(handle.version)
+        if ex is None:
+            ex = _explainers[handle.version] = ExplainBatcher(handle.model)
+    return ex
+
+def _served_handle(version: str) -> ModelHandle | None:
+    """目前仍在服務的版本（主模型或 secondary）"""
+    for handle in (get_model_handle(), _router.secondary):
+        if handle is not None and handle.version == version:
+            return handle
+    return None
+
+def _explain_tensor(digest: str) -> np.ndarray | None:
+    """預測時留下的前處理陣列；已被擠出時從上傳儲存的圖片重建"""
+    tensor = _tensors.get(digest)
+    if tensor is None and digest:
+        uploads = get_uploads()
+        path    = uploads.path(digest) if uploads else None
+        if path is None or not path.exists():
+            return None
+        with Image.open(path) as img:
+            tensor = image_to_uint8(img, IMG_SIZE)
+        _tensors.put(digest, tensor)
+        metrics.inc("explain.tensor_reloaded")
+    return tensor
+
+@app.route("/api/explain/<prediction_id>")
+def explain(prediction_id):
+    """
+    Grad-CAM 熱度圖（PNG，疊在 224×224 前處理後的圖上），只在被要求時計算。
+    預設解釋該次預測的 top-1；?class=<kaggle_class> 可改看其他類別。
+    同一張圖 + 模型版本 + 類別的結果會快取，同時到達的請求合併成一個 batch。
+    """
+    pred = _recent_preds.get(prediction_id)
+    if pred is None and get_history() is not None:
+        row  = get_history().get(prediction_id)
+        pred = (row["image_hash"], row["model_version"], row["kaggle_class"]) if row else None
+    if pred is None:
+        return jsonify({"error": "找不到此預測"}), 404
+    digest, version, predicted = pred
+
+    handle = _served_handle(version)
+    if handle is None:
+        return jsonify({"error": f"模型版本 {version} 已不在服務中，無法產生解釋"}), 409
+    classes = get_class_names(handle)
+    target  = request.args.get("class") or predicted
+    if target not in classes:
+        return jsonify({"error": f"未知的類別：{target}"}), 400
+    cls = classes.index(target)
+
+    key     = (digest, version, cls)
+    headers = {"Cache-Control": "private, max-age=86400", "X-Model-Version": version,
+               "X-Explained-Class": target}
+    png = _explain_png.get(key)
+    if png is not None:
+        metrics.inc("explain.cache_hits")
+        return Response(png, mimetype="image/png", headers=headers)
+
+    tensor = _explain_tensor(digest)
+    if tensor is None:
+        return jsonify({"error": "原始圖片已不在快取或保存期限內"}), 410
+    t0 = time.perf_counter()
+    try:
+        with _admission.slot("batch", deadline=QUEUE_DEADLINE):   # 解釋讓位給辨識請求
+            heat = get_explainer(handle).submit(key, tensor, cls).result(timeout=30)
+    except Overloaded as e:
+        body, status, extra = _overloaded_body(e)
+        return jsonify(body), status, extra
+    except (queue.Full, TimeoutError):   # 佇列已滿 / 30 秒內沒輪到（Future 仍在跑，之後的請求可共用）
+        return jsonify({"error": "伺服器忙碌中，請稍後再試"}), 503, {"Retry-After": str(_admission.retry_after())}
+    except Exception as e:   # worker 經 Future 傳回的錯誤（例如模型 head 不是 GAP → Dense 的單線結構）
+        metrics.inc("explain.errors")
+        return jsonify({"error": f"無法產生解釋：{e}"}), 500
+    png = overlay_png(tensor, heat)
+    _explain_png.put(key, png)
+    metrics.observe("explain.ms", (time.perf_counter() - t0) * 1000)
+    return Response(png, mimetype="image/png", headers=headers)
+
+# ─── 即時串流 ──────────────────────────────────────────────────────────────────
+def _stream_infer(img: Image.Image):
+    """串流的一張畫面：葉片篩選 → 單一視角推論（不排隊：沒有名額就回 busy，讓位給 /api/predict）"""
+    arr = preprocess_image(img)
+    if GATE:
+        gate = get_leaf_gate().check(arr[0])
+        if not gate.ok:
+            return "no_leaf", {"reason": gate.reason, "error": gate.message}
+    handle = get_model_handle()
+    if handle is None:
+        classes, probs = demo_predict(arr)
+        return "prediction", (probs, classes)
+    try:
+        with _admission.slot("batch", deadline=0):
+            raw, _ = _router.infer(handle, arr)
+    except (Overloaded, QueueFull):
+        return "busy", None
+    classes = get_class_names(handle)
+    return "prediction", (raw[0][:len(classes)], classes)
+
+def _describe(kaggle_class: str) -> dict:
+    rec = lookup_disease(kaggle_class)
+    return {"disease_id": rec.get("id"), "disease_name": rec.get("name_zh"), "severity": rec.get("severity")}
+
+@sock.route("/api/stream")
+def stream(ws):
+    """
+    即時相機辨識：用戶端以 binary message 送出縮小後的畫面（JPEG / WebP，建議 224–320 px），
+    伺服器以 JSON 回傳平滑後的 top-3（格式見 stream.py）。
+    """
+    global _streams
+    with _stream_lock:
+        full = _streams >= STREAM_MAX_CONN
+        if not full:
+            _streams += 1
+    if full:
+        ws.send(json.dumps({"type": "error", "error": "即時辨識連線數已滿，請稍後再試"}, ensure_ascii=False))
+        ws.close(reason=1013)   # Try Again Later
+        return
+
+    session = StreamSession(_stream_infer, lambda msg: ws.send(json.dumps(msg, ensure_ascii=False)),
+                            _describe, max_fps=STREAM_MAX_FPS)
+    metrics.inc("stream.connections")
+    try:
+        while True:
+            data = ws.receive()
+            if isinstance(data, str):   # 文字訊息只當作 keepalive
+                continue
+            if len(data) > MAX_FRAME_BYTES:
+                ws.send(json.dumps({"type": "error", "error": "畫面過大，請先縮小"}, ensure_ascii=False))
+                continue
+            session.feed(data)
+    except ConnectionClosed:
+        pass
+    finally:
+        session.close()
+        with _stream_lock:
+            _streams -= 1
+
+# ─── 非同步工作 ────────────────────────────────────────────────────────────────
+def get_jobs() -> JobRunner:
+    """只建立一個 JobRunner：第二個 runner 的 requeue_running 會把第一個正在處理的 item 放回佇列"""
+    global _jobs
+    if _jobs is None:
+        with _load_lock:
+            if _jobs is None:
+                _jobs = JobRunner(JobStore(), _run_job_item).start()
+    return _jobs
+
+def _run_job_item(image: bytes, options: dict) -> tuple[dict, int, dict]:
+    """429 / 503（含 Retry-After）由 JobRunner 延後重試"""
+    return predict_bytes(image, options, priority="batch")
+
+@app.route("/api/jobs", methods=["POST"])
+def submit_job():
+    """
+    非同步辨識：multipart image（可重複）或 JSON {"images": [base64, ...], "options": {...}}
+    選項（tta / tiles / similar / skip_gate）可放查詢參數或 JSON options，與 /api/predict 相同。
+    立即回傳 202 + job id，之後以 GET /api/jobs/<id> 輪詢。
+    """
+    try:
+        if request.files:
+            images = [f.read() for f in request.files.getlist("image")]
+            extra  = {}
+        elif request.is_json:
+            images = [decode_base64(raw) for raw in request.json.get("images") or [] if raw]
+            extra  = request.json.get("options") or {}
+        else:
+            images, extra = [], {}
+    except Exception as e:
+        return jsonify({"error": f"圖片解析失敗：{e}"}), 400
+    if not images:
+        return jsonify({"error": "請提供圖片（multipart image 或 JSON images）"}), 400
+    if len(images) > MAX_IMAGES_PER_JOB:
+        return jsonify({"error": f"一個工作最多 {MAX_IMAGES_PER_JOB} 張"}), 400
+
+    merged  = {**request.args.to_dict(), **extra}
+    options = {k: str(merged[k]) for k in PREDICT_OPTIONS if k in merged}
+    try:
+        job_id = get_jobs().submit(images, options)
+    except JobQueueFull:
+        return jsonify({"error": "工作佇列已滿，請稍後再試"}), 503
+    resp = jsonify({"job_id": job_id, "status": "queued", "total": len(images),
+                    "status_url": f"/api/jobs/{job_id}"})
+    resp.status_code = 202
+    resp.headers["Location"] = f"/api/jobs/{job_id}"
+    return resp
+
+@app.route("/api/jobs/<job_id>")
+def job_status(job_id):
+    """進度與已完成的部分結果（results 依圖片順序，只含已完成的項目）"""
+    job = get_jobs().store.get(job_id)
+    if job is None:
+        return jsonify({"error": "找不到此工作（可能已過期）"}), 404
+    return jsonify(job)
+
+@app.route("/api/similar", methods=["POST"])
+def similar():
+    """
+    相似案例檢索（可一次多張）：multipart image（可重複）或 JSON {"images": [base64, ...]}
+    ?k=5 取前幾筆；?exact=1 強制暴力搜尋；?compare=1 同時跑暴力搜尋回報延遲與 recall
+    """
+    handle = get_model_handle()
+    if handle is None:
+        return jsonify({"error": "DEMO 模式不支援相似案例檢索"}), 503
+    model = handle.model
+    g.model_version = model.version
+    store = get_similar_store()
+    if store is None:
+        return jsonify({"error": "尚未建立相似案例向量庫（請執行 build_embeddings.py）"}), 503
+    if store.model_version != model.version:
+        return jsonify({"error": "向量庫與目前模型版本不符，請重新執行 build_embeddings.py",
+                        "index_model_version": store.model_version,
+                        "model_version":       model.version}), 503
+
+    try:
+        if request.files:
+            imgs = [Image.open(f.stream) for f in request.files.getlist("image")]
+        elif request.is_json:
+            data = request.json.get("images") or [request.json.get("image_data")]
+            imgs = [decode_image_data(raw) for raw in data if raw]
+        else:
+            imgs = []
+    except Exception as e:
+        return jsonify({"error": f"圖片解析失敗：{e}"}), 400
+    if not imgs:
+        return jsonify({"error": "請提供圖片（multipart image 或 JSON images）"}), 400
+    if len(imgs) > MAX_SIMILAR_IMAGES:
+        return jsonify({"error": f"一次最多 {MAX_SIMILAR_IMAGES} 張"}), 400
+
+    k     = min(max(request.args.get("k", 5, type=int), 1), MAX_SIMILAR_K)
+    exact = request.args.get("exact") == "1"
+
+    t0 = time.perf_counter()
+    batch = np.concatenate([preprocess_image(img) for img in imgs])
+    try:
+        with _admission.slot():
+            _, embeddings = _router.infer(handle, batch)   # 整批一次 forward（與 predict 共用批次器）
+    except Overloaded as e:
+        body, status, headers = _overloaded_body(e)
+        return jsonify(body), status, headers
+    except QueueFull:
+        return jsonify({"error": "伺服器忙碌中，請稍後再試"}), 503, {"Retry-After": str(_admission.retry_after())}
+    t1 = time.perf_counter()
+    results = similar_matches(store, embeddings, k, exact=exact)
+    t2 = time.perf_counter()
+
+    took = {"embed": round((t1 - t0) * 1000, 3), "search": round((t2 - t1) * 1000, 3)}
+    payload = {
+        "results":       results,
+        "k":             k,
+        "index":         "brute" if exact else store.index_type,
+        "indexed":       len(store),
+        "model_version": model.version,
+        "took_ms":       took,
+    }
+    if request.args.get("compare") == "1" and store.ivf is not None and not exact:
+        t3 = time.perf_counter()
+        brute_idx, _ = store.search(embeddings, k, exact=True)
+        took["brute_search"] = round((time.perf_counter() - t3) * 1000, 3)
+        approx_idx, _ = store.search(embeddings, k)
+        payload["recall_at_k"] = round(float(np.mean([
+            len(set(a) & set(b)) / len(b) for a, b in zip(approx_idx, brute_idx)
+        ])), 4)
+    return jsonify(payload)
 
 if __name__ == "__main__":
+    # 啟動時就接續上次留下的排隊工作；debug 的 reloader 父行程只負責監看檔案，不處理工作
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        get_jobs()
     app.run(debug=True, host="0.0.0.0", port=5000)
\ No newline at end of file
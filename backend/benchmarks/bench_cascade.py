@@ -0,0 +1,79 @@
+"""
+benchmarks/bench_cascade.py
+單張推論延遲：只用主模型 vs cascade（student → 信心不足才交給主模型）
+
+以 data/val 的圖片逐張推論（batch=1，與 /api/predict 相同），
+回報兩種模式的準確率、平均與 p99 延遲，以及 student 放行比例。
+門檻取自 models/cascade.json（calibrate_cascade.py 產生）。
+
+執行方式：python benchmarks/bench_cascade.py [--per-class 20]
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from calibrate_cascade import CLASS_JSON, VAL_DIR, iter_batches, labeled_files   # noqa: E402
+from model_registry import load_handle                                             # noqa: E402
+from model_serving import CASCADE_JSON, Cascade                                      # noqa: E402
+
+
+def run(fn, images: np.ndarray) -> tuple[list[float], list[int], list[str]]:
+    lat, preds, stages = [], [], []
+    for img in images:
+        t = time.perf_counter()
+        probs, stage = fn(img[None])
+        lat.append((time.perf_counter() - t) * 1000)
+        preds.append(int(probs[0].argmax()))
+        stages.append(stage)
+    return lat, preds, stages
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--per-class", type=int, default=20)
+    args = ap.parse_args()
+
+    handle = load_handle()
+    if handle is None:
+        raise SystemExit("❌ 找不到主模型")
+    full    = handle.model
+    cascade = Cascade.load(full)
+    if cascade is None:
+        raise SystemExit(f"❌ cascade 不可用：請先執行 train_student.py 與 calibrate_cascade.py（{CASCADE_JSON}）")
+    class_names = handle.class_names
+    if not class_names:
+        with open(CLASS_JSON, encoding="utf-8") as f:
+            class_names = json.load(f)["classes"]
+
+    batches = list(iter_batches(labeled_files(VAL_DIR, class_names, args.per_class), full.input_hw[::-1]))
+    if not batches:
+        raise SystemExit(f"❌ {VAL_DIR} 沒有驗證圖片")
+    images = np.concatenate([b[0] for b in batches])
+    labels = np.concatenate([b[1] for b in batches])
+
+    # 預熱（tf.function trace）
+    full.predict_probs(images[:1])
+    cascade.student.predict_probs(images[:1])
+
+    modes = {
+        "full only": lambda x: (full.predict_probs(x), "full"),
+        "cascade":   lambda x: (lambda p, s: (p, s[0]))(*cascade.classify(x)),
+    }
+    print(f"images={len(labels)}  min_top1={cascade.min_top1}  min_margin={cascade.min_margin}\n")
+    print(f"{'mode':<12} {'accuracy':>9} {'mean ms':>9} {'p99 ms':>9} {'student %':>10}")
+    print("─" * 53)
+    for name, fn in modes.items():
+        lat, preds, stages = run(fn, images)
+        acc = float(np.mean(np.asarray(preds) == labels))
+        frac = stages.count("student") / len(stages)
+        print(f"{name:<12} {acc:>9.4f} {np.mean(lat):>9.2f} {np.percentile(lat, 99):>9.2f} {frac:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+benchmarks/bench_compact.py
+/api/predict 的上傳大小與伺服器 CPU：原圖 vs 用戶端縮好的 224×224（X-Image-Shape）
+
+  full      手機原圖 JPEG（4032×3024），伺服器解碼 + 縮放
+  jpeg224   用戶端縮成 224×224 的 JPEG（quality 0.85，與 api.js 預設相同），只解碼不縮放
+  raw224    224×224×3 uint8，不解碼也不縮放
+每種格式量：
+  bytes        上傳位元組數
+  prep cpu     位元組 → (1, 224, 224, 3) float32 的 CPU 時間（process_time，單執行緒）
+  request cpu  經 Flask test client 走完整 /api/predict（含葉片篩選與推論）的 CPU 時間
+每次請求在快取 key 上都不同（清空預測快取），不會命中快取。
+
+執行方式：python benchmarks/bench_compact.py [--requests 30]
+"""
+import io
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# 辨識紀錄與上傳儲存的背景執行緒也會算進 process_time，量測時關掉
+os.environ.setdefault("PHYTOSCAN_HISTORY", "0")
+os.environ.setdefault("PHYTOSCAN_UPLOAD_STORE", "0")
+
+import app as server                           # noqa: E402
+from model_serving import compact_to_uint8     # noqa: E402
+from bench_decode import make_jpeg             # noqa: E402
+
+SHAPE = (224, 224, 3)
+
+
+def payloads() -> dict[str, tuple[bytes, tuple | None]]:
+    full  = make_jpeg((4032, 3024))
+    small = Image.open(io.BytesIO(full)).convert("RGB").resize(server.IMG_SIZE, Image.BICUBIC)
+    buf   = io.BytesIO()
+    small.save(buf, "JPEG", quality=85)
+    return {
+        "full":    (full, None),
+        "jpeg224": (buf.getvalue(), SHAPE),
+        "raw224":  (np.asarray(small).tobytes(), SHAPE),
+    }
+
+
+def cpu_ms(fn, n: int) -> float:
+    t0 = time.process_time()
+    for _ in range(n):
+        fn()
+    return (time.process_time() - t0) * 1000 / n
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=30)
+    args = ap.parse_args()
+
+    server.DECODE_WORKERS = 0   # 解碼留在 request 執行緒，CPU 時間才量得到
+    client = server.app.test_client()
+    cases  = payloads()
+    client.post("/api/predict", data=cases["raw224"][0], content_type="application/octet-stream",
+                headers={"X-Image-Shape": "224,224,3"})   # 模型載入與 tf.function trace
+
+    print(f"{'payload':<9} {'bytes':>10} {'vs full':>8} {'prep cpu ms':>12} {'request cpu ms':>15}")
+    print("─" * 58)
+    full_bytes = len(cases["full"][0])
+    for name, (data, shape) in cases.items():
+        if shape is None:
+            prep = lambda: server.preprocess_image(Image.open(io.BytesIO(data)))   # noqa: E731
+        else:
+            prep = lambda: compact_to_uint8(data, shape, server.IMG_SIZE)[0][None].astype(np.float32) / 255.0  # noqa: E731
+        headers = {"X-Image-Shape": ",".join(map(str, shape))} if shape else {}
+
+        def request():
+            server._pred_cache._items.clear()
+            r = client.post("/api/predict", data=data, content_type="application/octet-stream", headers=headers)
+            assert r.status_code in (200, 422), r.json
+
+        prep_ms = cpu_ms(prep, args.requests)
+        req_ms  = cpu_ms(request, args.requests)
+        print(f"{name:<9} {len(data):>10,} {len(data) / full_bytes:>7.1%} {prep_ms:>12.2f} {req_ms:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+benchmarks/bench_decode.py
+圖片解碼：request 執行緒 vs 解碼子行程（decode_pool.py）
+
+以 --threads 個執行緒模擬 threaded server 同時處理上傳，每張都是手機尺寸的 JPEG
+（每個請求在 EOI 後附加不同位元組，內容相同但不會命中預測快取）。
+  decode  只量 位元組 → (1, 224, 224, 3) float32
+  predict 走完整的 app.predict_bytes（解碼 + 葉片篩選 + 推論）
+回報 requests/sec 與每個 CPU 核心的 requests/sec。
+
+執行方式：python benchmarks/bench_decode.py [--threads 8] [--workers 2] [--requests 200]
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import threading
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as server                 # noqa: E402
+from decode_pool import DecodePool   # noqa: E402
+
+
+def make_jpeg(size: tuple[int, int] = (3000, 2250), seed: int = 0) -> bytes:
+    """平滑漸層 + 雜訊（壓縮率接近真實照片，不是純雜訊）"""
+    rng  = np.random.default_rng(seed)
+    w, h = size
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    base = np.stack([60 + 40 * np.sin(xx / 300), 120 + 60 * np.cos(yy / 250), 50 + 30 * np.sin((xx + yy) / 400)], -1)
+    arr  = (base + rng.normal(0, 8, base.shape)).clip(0, 255).astype(np.uint8)
+    buf  = io.BytesIO()
+    Image.fromarray(arr).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def run(fn, payloads: list[bytes], threads: int) -> float:
+    it, lock = iter(payloads), threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                p = next(it, None)
+            if p is None:
+                return
+            fn(p)
+
+    t0 = time.perf_counter()
+    ts = [threading.Thread(target=worker) for _ in range(threads)]
+    [t.start() for t in ts]
+    [t.join() for t in ts]
+    return len(payloads) / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--workers", type=int, default=2, help="解碼子行程數")
+    ap.add_argument("--requests", type=int, default=200)
+    args = ap.parse_args()
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    jpeg  = make_jpeg()
+    print(f"cores={cores}  threads={args.threads}  decode workers={args.workers}  "
+          f"image=3000×2250 JPEG ({len(jpeg) / 1024:.0f} KB)\n")
+
+    pool = DecodePool(args.workers)
+    pool.warmup()
+    opts = {"tta": "0", "skip_gate": "1"}
+    server.predict_bytes(jpeg, opts)   # 模型載入與 tf.function trace
+
+    def thread_decode(data):
+        return server.preprocess_image(Image.open(io.BytesIO(data)))
+
+    def predict(data):
+        server._pred_cache._items.clear()
+        return server.predict_bytes(data, opts)
+
+    print(f"{'stage':<9} {'decode in':<12} {'req/s':>8} {'req/s/core':>11}")
+    print("─" * 44)
+    seq = iter(range(10 ** 9))
+    for stage, fn in (("decode", None), ("predict", predict)):
+        for where, decoder in (("thread", None), ("processes", pool)):
+            server._decoder = decoder
+            server.DECODE_WORKERS = args.workers if decoder else 0
+            payloads = [jpeg + next(seq).to_bytes(8, "little") for _ in range(args.requests)]
+            target = fn or (pool.decode if decoder else thread_decode)
+            rps = run(target, payloads, args.threads)
+            print(f"{stage:<9} {where:<12} {rps:>8.1f} {rps / cores:>11.1f}")
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+benchmarks/bench_history.py
+辨識紀錄寫入吞吐量：背景批次寫入（history.py）vs 每筆一個交易
+
+  batched   --threads 個執行緒不間斷呼叫 HistoryStore.add，量 request 端的 add() 延遲，
+            以及全部寫入磁碟（flush 完成）為止實際寫入的筆數 / 秒。
+            產生速度遠超過寫入速度時佇列會滿、多出的紀錄被丟棄（dropped），
+            此時的 rows/s 就是寫入執行緒的上限
+  per-row   同樣的資料每筆各自 INSERT + 更新計數器 + COMMIT（WAL、synchronous=NORMAL）
+最後以 SQL 重新彙總 predictions，確認增量維護的 counters 與實際資料一致。
+資料庫寫在暫存目錄，不影響 data/history.sqlite3。
+
+執行方式：python benchmarks/bench_history.py [--rows 50000] [--threads 8]
+"""
+import sys
+import time
+import uuid
+import sqlite3
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import history                                         # noqa: E402
+from history import HistoryStore, record_from_result   # noqa: E402
+
+CLASSES = [f"Class_{i}" for i in range(10)]
+
+
+def make_records(n: int, seed: int = 0) -> list[tuple]:
+    rng = np.random.default_rng(seed)
+    out = []
+    for i in range(n):
+        cls  = CLASSES[rng.integers(len(CLASSES))]
+        conf = float(rng.uniform(0.3, 1.0))
+        out.append(record_from_result(uuid.uuid4().hex, {
+            "model_version": "bench", "stage": "full",
+            "primary": {"kaggle_class": cls, "confidence": conf},
+            "top3":    [{"kaggle_class": cls, "confidence": conf}] * 3,
+        }, "api"))
+    return out
+
+
+def bench_batched(path: Path, records: list[tuple], threads: int) -> tuple[float, np.ndarray, HistoryStore]:
+    store = HistoryStore(path)
+    lat   = [[] for _ in range(threads)]
+    chunk = len(records) // threads
+
+    def worker(k):
+        for r in records[k * chunk:(k + 1) * chunk]:
+            t = time.perf_counter()
+            store.add(r)
+            lat[k].append(time.perf_counter() - t)
+
+    t0 = time.perf_counter()
+    ts = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+    [t.start() for t in ts]
+    [t.join() for t in ts]
+    store.flush(timeout=600)
+    elapsed = time.perf_counter() - t0
+    written = chunk * threads - store.dropped
+    return written / elapsed, np.concatenate([np.array(x) for x in lat]) * 1e6, store
+
+
+def bench_per_row(path: Path, records: list[tuple]) -> float:
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(history.SCHEMA)
+    upsert = ("INSERT INTO counters VALUES (?, ?, 1, ?) ON CONFLICT (dim, key) DO UPDATE SET "
+              "count = count + 1, conf_sum = conf_sum + excluded.conf_sum")
+    t0 = time.perf_counter()
+    for r in records:
+        conn.execute("BEGIN")
+        conn.execute("INSERT INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", r)
+        for dim, key in (("total", ""), ("class", r[4]), ("day", r[2]), ("version", r[3])):
+            conn.execute(upsert, (dim, key, r[5]))
+        conn.execute("COMMIT")
+    conn.close()
+    return len(records) / (time.perf_counter() - t0)
+
+
+def verify(store: HistoryStore) -> bool:
+    with sqlite3.connect(store.path) as conn:
+        actual = dict(conn.execute("SELECT kaggle_class, COUNT(*) FROM predictions GROUP BY kaggle_class"))
+    counted = {r["kaggle_class"]: r["count"] for r in store.aggregates()["by_class"]}
+    return actual == counted and sum(actual.values()) == store.summary()["total_identifications"]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=50000)
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--per-row", type=int, default=5000, help="每筆一個交易的對照組筆數")
+    args = ap.parse_args()
+
+    records = make_records(args.rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        rate, lat, store = bench_batched(Path(tmp) / "batched.sqlite3", records, args.threads)
+        naive = bench_per_row(Path(tmp) / "per_row.sqlite3", records[:args.per_row])
+
+        print(f"rows={args.rows}  threads={args.threads}  batch≤{history.BATCH_MAX}  "
+              f"flush every {history.FLUSH_INTERVAL * 1000:.0f} ms\n")
+        print(f"{'mode':<10} {'rows/s':>10}")
+        print("─" * 21)
+        print(f"{'batched':<10} {rate:>10.0f}")
+        print(f"{'per-row':<10} {naive:>10.0f}")
+        print(f"\nadd() on request path: p50 {np.percentile(lat, 50):.1f} µs  "
+              f"p99 {np.percentile(lat, 99):.1f} µs  max {lat.max():.0f} µs")
+        print(f"dropped (queue full): {store.dropped}")
+        print(f"counters match predictions: {verify(store)}")
+
+
+if __name__ == "__main__":
+    main()
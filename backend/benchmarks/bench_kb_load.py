@@ -0,0 +1,111 @@
+"""
+benchmarks/bench_kb_load.py
+比較兩種知識庫載入方式的啟動時間與每個 worker 的 RSS：
+  - json     ：舊做法，json.load(diseases.json) 後建立 original / normalized 兩份 dict
+  - compiled ：kb_compiled.DiseaseKB.open(diseases.kb)，mmap + 延遲解碼
+
+以 STATIC_DISEASES 複製出 N 筆合成記錄，同時啟動 W 個子行程模擬 gunicorn workers，
+每個 worker 載入後查詢全部 kaggle_class 一次，回報：
+  load_ms   載入耗時
+  anon_kb   私有記憶體增量（RssAnon，每個 worker 各自一份）
+  file_kb   檔案映射記憶體（RssFile，可在 worker 間共用的 page cache）
+
+執行方式：python benchmarks/bench_kb_load.py [--records 5000] [--workers 4]
+"""
+import sys
+import json
+import time
+import copy
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+
+
+def rss_kb() -> dict:
+    out = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                key, val = line.split(":")
+                out[key] = int(val.split()[0])
+    return out
+
+
+def worker(mode: str, path: str):
+    import kb_store
+    from kb_compiled import DiseaseKB
+    before = rss_kb()
+    t0 = time.perf_counter()
+    if mode == "json":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        db = {}
+        for d in data["diseases"]:
+            db[d["kaggle_class"]] = d
+            db[kb_store.normalize_kaggle_class(d["kaggle_class"])] = d
+    else:
+        db = DiseaseKB.open(Path(path))
+    load_ms = (time.perf_counter() - t0) * 1000
+    for key in list(db.keys()):
+        db[key]
+    after = rss_kb()
+    print(json.dumps({
+        "load_ms": load_ms,
+        "anon_kb": after["RssAnon"] - before["RssAnon"],
+        "file_kb": after["RssFile"] - before["RssFile"],
+    }))
+
+
+def synthetic_kb(n: int) -> list[dict]:
+    from scrape_diseases import STATIC_DISEASES
+    out = []
+    for i in range(n):
+        d = copy.deepcopy(STATIC_DISEASES[i % len(STATIC_DISEASES)])
+        d["id"] = f"{d['id']}_{i}"
+        d["kaggle_class"] = f"Plant{i}___{d['kaggle_class'].split('___')[-1]}"
+        out.append(d)
+    return out
+
+
+def run_workers(mode: str, path: Path, n: int) -> list[dict]:
+    procs = [subprocess.Popen([sys.executable, __file__, "--worker", mode, str(path)],
+                              stdout=subprocess.PIPE, text=True, cwd=BACKEND)
+             for _ in range(n)]
+    return [json.loads(p.communicate()[0]) for p in procs]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--records", type=int, default=5000)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--worker", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.worker:
+        return worker(*args.worker)
+
+    import kb_store
+    tmp       = Path(tempfile.mkdtemp())
+    diseases  = synthetic_kb(args.records)
+    json_path = tmp / "diseases.json"
+    kb_path   = tmp / "diseases.kb"
+    kb_store.save_diseases(diseases, json_path)
+    kb_store.compile_kb(diseases, kb_path)
+    print(f"records={args.records}  json={json_path.stat().st_size / 1024:.0f} KB  "
+          f"kb={kb_path.stat().st_size / 1024:.0f} KB  workers={args.workers}\n")
+
+    print(f"{'mode':<10} {'load ms':>9} {'anon KB/worker':>15} {'file KB/worker':>15} {'total private KB':>17}")
+    print("─" * 70)
+    for mode, path in (("json", json_path), ("compiled", kb_path)):
+        res  = run_workers(mode, path, args.workers)
+        load = sum(r["load_ms"] for r in res) / len(res)
+        anon = sum(r["anon_kb"] for r in res) / len(res)
+        file = sum(r["file_kb"] for r in res) / len(res)
+        print(f"{mode:<10} {load:>9.1f} {anon:>15.0f} {file:>15.0f} {anon * len(res):>17.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+benchmarks/bench_search.py
+倒排索引搜尋效能：以 STATIC_DISEASES 混合出 N 筆合成病害（預設 10k），
+量測建索引時間與各類查詢（中文 bigram / 英文 / 單字 / 篩選）的 p50 / p99 延遲。
+
+執行方式：python benchmarks/bench_search.py [--records 10000] [--rounds 200]
+"""
+import sys
+import copy
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from kb_search import SearchIndex                 # noqa: E402
+from scrape_diseases import STATIC_DISEASES       # noqa: E402
+
+QUERIES = [
+    ("早疫病", {}),
+    ("番茄 晚疫", {}),
+    ("葉片 黃色 病斑", {}),
+    ("alternaria solani", {}),
+    ("blight", {}),
+    ("病", {}),
+    ("病斑", {"category": "真菌性病害"}),
+    ("葉", {"severity": "3"}),
+]
+
+
+def synthetic_records(n: int, seed: int = 42) -> list[dict]:
+    rnd    = random.Random(seed)
+    hosts  = sorted({h for d in STATIC_DISEASES for h in d.get("host_plants", [])})
+    sympts = [s for d in STATIC_DISEASES for s in d.get("symptoms", [])]
+    out = []
+    for i in range(n):
+        d = copy.deepcopy(rnd.choice(STATIC_DISEASES))
+        d["id"]          = f"{d['id']}_{i}"
+        d["name_en"]     = f"{d['name_en']} variant {i}"
+        d["host_plants"] = rnd.sample(hosts, k=min(3, len(hosts)))
+        d["symptoms"]    = rnd.sample(sympts, k=4)
+        out.append(d)
+    return out
+
+
+def percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--records", type=int, default=10000)
+    ap.add_argument("--rounds", type=int, default=200)
+    args = ap.parse_args()
+
+    records = synthetic_records(args.records)
+    t0 = time.perf_counter()
+    index = SearchIndex(records)
+    print(f"records={args.records}  tokens={len(index.postings)}  "
+          f"build={time.perf_counter() - t0:.2f}s\n")
+
+    print(f"{'query':<24} {'filters':<22} {'hits':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    print("─" * 72)
+    for q, filters in QUERIES:
+        lat = []
+        for _ in range(args.rounds):
+            t = time.perf_counter()
+            _, total = index.search(q, limit=20, **filters)
+            lat.append((time.perf_counter() - t) * 1000)
+        flt = ",".join(f"{k}={v}" for k, v in filters.items())
+        print(f"{q:<24} {flt:<22} {total:>6} {percentile(lat, 50):>8.3f} {percentile(lat, 99):>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+benchmarks/bench_similar.py
+相似案例檢索：暴力搜尋（matmul）vs IVF-PQ 的延遲與 recall@k
+
+預設以合成的分群向量（模擬同病害的 embedding 聚在一起）量測；
+--store 時改用 build_embeddings.py 產生的 models/embeddings/（查詢取庫內向量加雜訊）。
+
+執行方式：python benchmarks/bench_similar.py [--n 100000] [--dim 256] [--queries 200] [--store]
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from vector_index import BruteForceIndex, IVFPQIndex, normalize   # noqa: E402
+
+PROBES = [(4, 64), (8, 64), (16, 128), (32, 256)]   # (nprobe, rerank)
+
+
+def synthetic(n: int, dim: int, clusters: int = 500, seed: int = 0) -> np.ndarray:
+    rng     = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return normalize(centers[rng.integers(clusters, size=n)] + 0.35 * rng.normal(size=(n, dim)))
+
+
+def percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def timed(fn, queries: np.ndarray) -> tuple[list[float], np.ndarray]:
+    """逐筆查詢的延遲（ms）與所有結果"""
+    lat, out = [], []
+    for q in queries:
+        t = time.perf_counter()
+        idx, _ = fn(q[None])
+        lat.append((time.perf_counter() - t) * 1000)
+        out.append(idx[0])
+    return lat, np.stack(out)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=100000)
+    ap.add_argument("--dim", type=int, default=256)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--nlist", type=int, default=256)
+    ap.add_argument("--m", type=int, default=32)
+    ap.add_argument("--store", action="store_true", help="改用 models/embeddings/ 的實際向量")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(1)
+    if args.store:
+        from build_embeddings import EMBED_DIR
+        vectors = np.load(EMBED_DIR / "vectors.npy").astype(np.float32)
+    else:
+        vectors = synthetic(args.n, args.dim)
+    queries = normalize(vectors[rng.integers(len(vectors), size=args.queries)]
+                        + 0.1 * rng.normal(size=(args.queries, vectors.shape[1])))
+    print(f"vectors={vectors.shape}  queries={len(queries)}  k={args.k}\n")
+
+    brute = BruteForceIndex(vectors)
+    t0 = time.perf_counter()
+    ivf = IVFPQIndex.build(vectors, nlist=min(args.nlist, max(len(vectors) // 39, 1)), m=args.m)
+    print(f"IVF-PQ build: {time.perf_counter() - t0:.1f}s  "
+          f"codes={ivf.codes.nbytes / 1e6:.1f} MB  float16={brute.vectors.nbytes / 1e6:.1f} MB\n")
+
+    brute.search(queries[:1], args.k)   # 先建立 float32 工作副本
+    lat, truth = timed(lambda q: brute.search(q, args.k), queries)
+    t = time.perf_counter()
+    brute.search(queries, args.k)
+    batched = (time.perf_counter() - t) * 1000 / len(queries)
+
+    print(f"{'index':<22} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} {'batched ms/q':>13}")
+    print("─" * 64)
+    print(f"{'brute force':<22} {1.0:>9.3f} {percentile(lat, 50):>8.3f} "
+          f"{percentile(lat, 99):>8.3f} {batched:>13.3f}")
+    for nprobe, rerank in PROBES:
+        search = lambda q: ivf.search(q, args.k, nprobe=nprobe, rerank=rerank)   # noqa: E731
+        lat, got = timed(search, queries)
+        t = time.perf_counter()
+        search(queries)
+        batched = (time.perf_counter() - t) * 1000 / len(queries)
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(got, truth)])
+        print(f"{f'ivfpq p={nprobe} r={rerank}':<22} {recall:>9.3f} {percentile(lat, 50):>8.3f} "
+              f"{percentile(lat, 99):>8.3f} {batched:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
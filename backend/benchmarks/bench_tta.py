@@ -0,0 +1,100 @@
+"""
+benchmarks/bench_tta.py
+測試時增強（TTA）：準確率提升 vs 延遲
+
+以 data/val 的圖片逐張推論（與 /api/predict 相同），比較：
+  single        只用原圖
+  flips×3       原圖 + 水平 / 垂直翻轉，疊成一個 batch
+  all×6         翻轉 + 裁切，疊成一個 batch
+  all×6 loop    同上但逐個視角各 forward 一次（對照：batch 化省下多少）
+  auto          單一視角 top-1 < 門檻才補跑 all×6（app.py 的預設行為）
+
+執行方式：python benchmarks/bench_tta.py [--per-class 20] [--threshold 0.6]
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from calibrate_cascade import CLASS_JSON, VAL_DIR, iter_batches, labeled_files   # noqa: E402
+from model_registry import load_handle                                             # noqa: E402
+from tta import DEFAULT_VIEWS, FLIP_VIEWS, should_tta, tta_average, tta_views     # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--per-class", type=int, default=20)
+    ap.add_argument("--threshold", type=float, default=0.6, help="auto 模式的單一視角信心門檻")
+    args = ap.parse_args()
+
+    handle = load_handle()
+    if handle is None:
+        raise SystemExit("❌ 找不到主模型")
+    model       = handle.model
+    class_names = handle.class_names
+    if not class_names:
+        with open(CLASS_JSON, encoding="utf-8") as f:
+            class_names = json.load(f)["classes"]
+
+    batches = list(iter_batches(labeled_files(VAL_DIR, class_names, args.per_class), model.input_hw[::-1]))
+    if not batches:
+        raise SystemExit(f"❌ {VAL_DIR} 沒有驗證圖片")
+    images = np.concatenate([b[0] for b in batches])
+    labels = np.concatenate([b[1] for b in batches])
+
+    # 預熱各種 batch 大小（tf.function 固定 signature，不會重新 trace，但第一次呼叫較慢）
+    for n in (1, len(FLIP_VIEWS), len(DEFAULT_VIEWS) - 1, len(DEFAULT_VIEWS)):
+        model.predict_probs(np.repeat(images[:1], n, axis=0))
+
+    def single(x):
+        return model.predict_probs(x)[0], False
+
+    def batched(views):
+        def fn(x):
+            return tta_average(model.predict_probs(tta_views(x, views))), True
+        return fn
+
+    def looped(x):
+        stacked = tta_views(x)
+        return tta_average(np.concatenate([model.predict_probs(v[None]) for v in stacked])), True
+
+    def auto(x):
+        p = model.predict_probs(x)
+        if not should_tta(p[0], args.threshold):
+            return p[0], False
+        extra = model.predict_probs(tta_views(x)[1:])   # 與 app.py 相同：沿用已算的原圖結果
+        return tta_average(np.concatenate([p, extra])), True
+
+    modes = {
+        "single":                         single,
+        f"flips×{len(FLIP_VIEWS)}":       batched(FLIP_VIEWS),
+        f"all×{len(DEFAULT_VIEWS)}":      batched(DEFAULT_VIEWS),
+        f"all×{len(DEFAULT_VIEWS)} loop": looped,
+        f"auto<{args.threshold}":         auto,
+    }
+    print(f"images={len(labels)}  views={','.join(DEFAULT_VIEWS)}\n")
+    print(f"{'mode':<14} {'accuracy':>9} {'Δacc':>7} {'mean ms':>9} {'p99 ms':>9} {'× single':>9} {'tta %':>7}")
+    print("─" * 70)
+    base_acc = base_ms = None
+    for name, fn in modes.items():
+        lat, preds, used = [], [], []
+        for img in images:
+            t = time.perf_counter()
+            probs, did = fn(img[None])
+            lat.append((time.perf_counter() - t) * 1000)
+            preds.append(int(probs.argmax()))
+            used.append(did)
+        acc, mean = float(np.mean(np.asarray(preds) == labels)), float(np.mean(lat))
+        if base_acc is None:
+            base_acc, base_ms = acc, mean
+        print(f"{name:<14} {acc:>9.4f} {acc - base_acc:>+7.4f} {mean:>9.2f} "
+              f"{np.percentile(lat, 99):>9.2f} {mean / base_ms:>8.2f}× {np.mean(used):>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
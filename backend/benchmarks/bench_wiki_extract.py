@@ -0,0 +1,147 @@
+"""
+benchmarks/bench_wiki_extract.py
+比較 Wikipedia 頁面兩種摘要擷取方式的解析時間與記憶體峰值（每篇文章）：
+  - full_soup ：舊做法，BeautifulSoup(lxml) 建整棵樹再 find
+  - streaming ：scrape_diseases.extract_wiki_lead，串流解析、拿到即停
+
+記憶體是峰值 RSS 的增量：每次量測在全新的子行程中執行一次（模組已載入、暖身後），
+以 /proc/self/clear_refs 重設峰值後讀 VmHWM，包含 libxml2 / lxml 的 C 配置
+（tracemalloc 只看得到 Python 物件，會大幅低估 lxml 的樹）。非 Linux 時退回 ru_maxrss，
+峰值無法重設（含暖身與載入模組時的峰值），數字只是上限（表中以 ≤ 標示）。
+
+頁面來源：HTTP 快取（先跑過一次 scrape_diseases.py），沒有快取則用合成文章。
+執行方式：python benchmarks/bench_wiki_extract.py [--repeat 20]
+"""
+import re
+import sys
+import time
+import argparse
+import resource
+import multiprocessing as mp
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import http_cache                                          # noqa: E402
+from scrape_diseases import STATIC_DISEASES, extract_wiki_lead   # noqa: E402
+
+
+def full_soup_extract(html: bytes) -> dict:
+    """舊版 scrape_wikipedia 的解析流程（保留作為比較基準）"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "lxml")
+    content = soup.find("div", class_="mw-parser-output")
+    summary, img_url = "", ""
+    if content:
+        paras = []
+        for p in content.find_all("p", recursive=False):
+            text = re.sub(r"\[.*?\]", "", p.get_text()).strip()
+            if len(text) > 80:
+                paras.append(text)
+            if len(paras) >= 2:
+                break
+        summary = " ".join(paras)[:800]
+        infobox = soup.find("table", class_=re.compile("infobox"))
+        if infobox:
+            img_tag = infobox.find("img")
+            if img_tag and img_tag.get("src"):
+                img_url = img_tag["src"]
+    return {"wiki_summary": summary, "wiki_img": img_url}
+
+
+def synthetic_article(n_sections: int = 60) -> bytes:
+    """約 300 KB 的合成頁面，結構仿照 Wikipedia（infobox + 多段落 + 大量內文）"""
+    para = "<p>" + ("Alternaria solani causes target-like lesions on leaves. " * 6) + "<sup>[1]</sup></p>"
+    body = ['<table class="infobox biota"><tr><td><img src="//upload.wikimedia.org/x/220px-Leaf.jpg"></td></tr></table>']
+    for i in range(n_sections):
+        body.append(f"<h2>Section {i}</h2>" + para * 4 + "<ul>" + "<li>item</li>" * 30 + "</ul>")
+    html = ("<html><head><meta charset='utf-8'><title>T</title></head><body>"
+            "<div id='content'><div class='mw-parser-output'>" + "".join(body) + "</div></div>"
+            + "<div id='footer'>" + "<a href='#'>link</a>" * 500 + "</div></body></html>")
+    return html.encode("utf-8")
+
+
+def load_pages() -> list[tuple[str, bytes]]:
+    http_cache.set_offline(True)
+    pages = []
+    for d in STATIC_DISEASES:
+        url = f"https://en.wikipedia.org/wiki/{d['name_en'].replace(' ', '_')}"
+        try:
+            r = http_cache.cached_get(url)
+            if r.status_code == 200:
+                pages.append((d["name_en"], r.content))
+        except http_cache.OfflineCacheMiss:
+            pass
+    return pages or [("synthetic", synthetic_article())]
+
+
+def _rss_kb(field: str) -> int | None:
+    """/proc/self/status 的 VmRSS / VmHWM（KB）；非 Linux 時為 None"""
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith(field + ":"))
+    except (OSError, StopIteration):
+        return None
+
+
+def _peak_rss_delta(fn, html: bytes) -> tuple[float, bool]:
+    """子行程內執行：回傳（fn 執行期間 RSS 峰值 − 執行前 RSS（KB），是否為精確值）"""
+    fn(synthetic_article(2))   # 載入 lxml / bs4 並暖身，不計入
+    before = _rss_kb("VmRSS")
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")       # 把 VmHWM 重設為目前的 RSS
+        exact = True
+    except OSError:
+        exact = False
+    fn(html)
+    if exact:
+        peak = _rss_kb("VmHWM")
+    else:   # ru_maxrss：Linux 為 KB、macOS 為 bytes；含暖身前的峰值
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak / 1024 if sys.platform == "darwin" else peak
+        before = before or 0
+    return max(peak - before, 0), exact
+
+
+def measure(fn, html: bytes, repeat: int) -> tuple[float, float, bool]:
+    """回傳（平均毫秒, RSS 峰值增量 KB, 峰值是否精確）；記憶體在全新的子行程中量"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+        peak_kb, exact = pool.submit(_peak_rss_delta, fn, html).result()
+
+    fn(html)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(html)
+    return (time.perf_counter() - t0) / repeat * 1000, peak_kb, exact
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    pages = load_pages()
+    print(f"{'article':<28} {'KB':>6} │ {'soup ms':>8} {'soup RSS':>9} │ {'stream ms':>9} {'stream RSS':>10}")
+    print("─" * 81)
+    totals, all_exact = [0.0, 0.0, 0.0, 0.0], True
+    for name, html in pages:
+        soup_ms, soup_kb, e1     = measure(full_soup_extract, html, args.repeat)
+        stream_ms, stream_kb, e2 = measure(extract_wiki_lead, html, args.repeat)
+        all_exact = all_exact and e1 and e2
+        for i, v in enumerate((soup_ms, soup_kb, stream_ms, stream_kb)):
+            totals[i] += v
+        kb = lambda v, exact: f"{'' if exact else '≤'}{v:.0f}"
+        print(f"{name[:28]:<28} {len(html) / 1024:>6.0f} │ {soup_ms:>8.2f} {kb(soup_kb, e1):>9} │ "
+              f"{stream_ms:>9.2f} {kb(stream_kb, e2):>10}")
+    n = len(pages)
+    print("─" * 81)
+    print(f"{'mean per article':<28} {'':>6} │ {totals[0] / n:>8.2f} {totals[1] / n:>9.0f} │ "
+          f"{totals[2] / n:>9.2f} {totals[3] / n:>10.0f}")
+    print("RSS：子行程中單次執行的峰值 RSS 增量（KB），含 libxml2 / lxml 的 C 配置"
+          + ("" if all_exact else "；≤ 表示無法重設峰值，只是上限"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+benchmarks/load_predict.py
+/api/predict 過載測試：有 / 沒有流量控制時的 p99 延遲
+
+流程：
+  1. 在本機背景執行緒啟動 app（werkzeug threaded server）
+  2. 以 max_inflight 個並行客戶端量測容量（每秒可完成的請求數）
+  3. 以容量的 --overload 倍（預設 3×）開放式送出請求（不等回應，固定到達率），持續 --seconds 秒，
+     分別在「流量控制開啟」與「關閉（不限並行）」下各跑一次
+回報成功請求的 p50 / p99、被拒絕（429 / 503）與失敗（逾時 / 連線被拒）數量、有效吞吐量。
+每個請求都是不同的圖片，避免預測快取命中。
+注意：負載產生器與伺服器在同一台機器上，CPU 核心少時拒絕請求本身的開銷也會壓低有效吞吐量；
+要看的是 p99：有流量控制時受 deadline + 服務時間限制，沒有時隨測試時間持續增長。
+
+執行方式：python benchmarks/load_predict.py [--seconds 20] [--overload 3]
+"""
+import io
+import sys
+import time
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from PIL import Image
+from werkzeug.serving import make_server
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as server                           # noqa: E402
+from admission import AdmissionController      # noqa: E402
+
+CLIENT_TIMEOUT = 30.0   # 與前端 axios timeout 相同
+PARAMS         = {"tta": "0", "skip_gate": "1"}
+
+
+def make_payloads(n: int, seed: int = 0) -> list[bytes]:
+    rng, out = np.random.default_rng(seed), []
+    for _ in range(n):
+        arr = rng.integers(0, 255, (224, 224, 3), dtype=np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(arr).save(buf, "JPEG", quality=85)
+        out.append(buf.getvalue())
+    return out
+
+
+def post(url: str, payload: bytes) -> tuple[int, float]:
+    t = time.perf_counter()
+    try:
+        r = requests.post(url, params=PARAMS, files={"image": ("x.jpg", payload, "image/jpeg")},
+                          timeout=CLIENT_TIMEOUT)
+        status = r.status_code
+    except (requests.Timeout, requests.ConnectionError):   # 逾時或連線被拒（listen backlog 滿）
+        status = 0
+    return status, (time.perf_counter() - t) * 1000
+
+
+def measure_capacity(url: str, payloads: list[bytes], clients: int, n: int) -> float:
+    it, lock = iter(payloads), threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                p = next(it, None)
+            if p is None:
+                return
+            post(url, p)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    return n / (time.perf_counter() - t0)
+
+
+def open_loop(url: str, payloads: list[bytes], rate: float,
+              seconds: float) -> tuple[list[tuple[int, float]], float]:
+    """回傳 (各請求 (狀態碼, 延遲 ms), 從第一個請求送出到最後一個回應的秒數)"""
+    n = int(rate * seconds)
+    futures = []
+    with ThreadPoolExecutor(max_workers=512) as pool:
+        t0 = time.perf_counter()
+        for i in range(n):
+            delay = t0 + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(post, url, payloads[i % len(payloads)]))
+    return [f.result() for f in futures], time.perf_counter() - t0
+
+
+def report(name: str, results: list[tuple[int, float]], seconds: float):
+    """goodput = 成功數 / 實際耗時（沒有流量控制時，排隊的請求會拖到送完之後才完成）"""
+    ok   = np.array([ms for s, ms in results if s == 200])
+    shed = {c: sum(1 for s, _ in results if s == c) for c in (429, 503)}
+    to   = sum(1 for s, _ in results if s == 0)
+    p50, p99 = (np.percentile(ok, 50), np.percentile(ok, 99)) if len(ok) else (float("nan"),) * 2
+    print(f"{name:<14} {len(results):>6} {len(ok):>6} {shed[429]:>6} {shed[503]:>6} {to:>8} "
+          f"{p50:>9.0f} {p99:>9.0f} {len(ok) / seconds:>9.1f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=20)
+    ap.add_argument("--overload", type=float, default=3.0)
+    ap.add_argument("--port", type=int, default=5055)
+    args = ap.parse_args()
+
+    srv = make_server("127.0.0.1", args.port, server.app, threaded=True)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{args.port}/api/predict"
+
+    limited = server._admission
+    warm    = make_payloads(8, seed=1)
+    for p in warm:                                   # 模型載入與 tf.function trace
+        post(url, p)
+    capacity = measure_capacity(url, make_payloads(limited.max_inflight * 10, seed=2),
+                                limited.max_inflight, limited.max_inflight * 10)
+    rate = capacity * args.overload
+    print(f"capacity≈{capacity:.1f} req/s  →  offered {rate:.1f} req/s ({args.overload:g}×) for {args.seconds:g}s")
+    print(f"admission: max_inflight={limited.max_inflight} max_queue={limited.max_queue} "
+          f"deadline={limited.deadline}s\n")
+    print(f"{'mode':<14} {'sent':>6} {'ok':>6} {'429':>6} {'503':>6} {'failed':>8} "
+          f"{'p50 ms':>9} {'p99 ms':>9} {'goodput':>9}")
+    print("─" * 80)
+
+    payloads = make_payloads(int(rate * args.seconds) + 1, seed=3)
+    modes = {
+        "admission on":  limited,
+        "admission off": AdmissionController(max_inflight=10 ** 6, max_queue=10 ** 6, deadline=None),
+    }
+    for name, controller in modes.items():
+        server._admission = controller
+        server._pred_cache._items.clear()
+        report(name, *open_loop(url, payloads, rate, args.seconds))
+        time.sleep(2)   # 讓上一輪殘留的請求結束
+    srv.shutdown()
+
+
+if __name__ == "__main__":
+    main()
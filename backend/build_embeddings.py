@@ -0,0 +1,162 @@
+"""
+build_embeddings.py
+離線建立「相似案例」向量庫：models/embeddings/
+
+  python build_embeddings.py                    # 參考圖 + 每類最多 200 張訓練圖
+  python build_embeddings.py --per-class 0      # 只收 static/disease_images 參考圖
+  python build_embeddings.py --ivf              # 另建 IVF-PQ 索引（10 萬筆以上建議）
+
+來源：
+  - 知識庫病害的本地參考圖（/static/disease_images/...，由 scrape_disease_images.py 下載）
+  - data/train/<kaggle_class>/ 的訓練圖（每類上限 --per-class）
+以服務中的模型（model_serving.ServedModel）取分類層前的 embedding，
+L2 正規化後存成 float16 矩陣；meta.json 記錄模型版本，
+app.py 只在版本相符時啟用 /api/similar。
+"""
+import sys
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+from kb_store import BASE_DIR, atomic_write_json, load_diseases, normalize_kaggle_class
+from model_registry import load_handle
+from model_serving import ServedModel, image_to_array
+from vector_index import IVFPQIndex, normalize
+
+EMBED_DIR  = BASE_DIR / "models" / "embeddings"
+TRAIN_DIR  = BASE_DIR / "data" / "train"
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+BATCH_SIZE = 64
+
+
+# ─── 收集圖片 ──────────────────────────────────────────────────────────────────
+def reference_items(diseases: list[dict]) -> list[dict]:
+    items = []
+    for d in diseases:
+        for img in d.get("images", []):
+            url = img.get("url", "")
+            if not url.startswith("/static/disease_images/"):
+                continue
+            path = BASE_DIR / url.lstrip("/")
+            if path.exists():
+                items.append({
+                    "source":       "reference",
+                    "path":         str(path.relative_to(BASE_DIR)),
+                    "image_url":    url,
+                    "disease_id":   d.get("id"),
+                    "kaggle_class": d.get("kaggle_class"),
+                })
+    return items
+
+
+def train_items(per_class: int, class_to_id: dict) -> list[dict]:
+    if per_class <= 0 or not TRAIN_DIR.exists():
+        return []
+    items = []
+    for cls_dir in sorted(p for p in TRAIN_DIR.iterdir() if p.is_dir()):
+        files = sorted(p for p in cls_dir.iterdir() if p.suffix.lower() in IMAGE_EXTS)[:per_class]
+        disease_id = class_to_id.get(cls_dir.name) or class_to_id.get(normalize_kaggle_class(cls_dir.name))
+        items.extend({
+            "source":       "train",
+            "path":         str(p.relative_to(BASE_DIR)),
+            "image_url":    None,
+            "disease_id":   disease_id,
+            "kaggle_class": cls_dir.name,
+        } for p in files)
+    return items
+
+
+# ─── 推論 ──────────────────────────────────────────────────────────────────────
+def embed_items(model: ServedModel, items: list[dict]) -> tuple[np.ndarray, list[dict]]:
+    """分批取 embedding；無法開啟的圖片略過"""
+    vectors, kept, batch, batch_items = [], [], [], []
+
+    def flush():
+        if batch:
+            vectors.append(model.infer(np.stack(batch))[1])
+            kept.extend(batch_items)
+            batch.clear()
+            batch_items.clear()
+
+    for i, item in enumerate(items, 1):
+        try:
+            with Image.open(BASE_DIR / item["path"]) as img:
+                batch.append(image_to_array(img, model.input_hw[::-1]))
+            batch_items.append(item)
+        except OSError as e:
+            print(f"  ⚠️  略過 {item['path']}：{e}")
+        if len(batch) >= BATCH_SIZE:
+            flush()
+            print(f"  {i}/{len(items)}", end="\r")
+    flush()
+    if not vectors:
+        return np.zeros((0, model.embed_dim), dtype=np.float16), []
+    return normalize(np.concatenate(vectors)).astype(np.float16), kept
+
+
+# ─── 主流程 ────────────────────────────────────────────────────────────────────
+def build(per_class: int = 200, ivf: bool = False, nlist: int = 256, m: int = 32) -> dict:
+    handle = load_handle()   # registry CURRENT（或舊路徑模型），與 app.py 服務的版本相同
+    if handle is None:
+        raise SystemExit("❌ 找不到模型檔，請先執行 train_model.py")
+    model = handle.model
+    print(f"✅ 模型載入：版本 {model.version}，embedding {model.embed_dim} 維")
+
+    diseases    = load_diseases()
+    class_to_id = {}
+    for d in diseases:
+        cls = d.get("kaggle_class", "")
+        class_to_id.setdefault(cls, d.get("id"))
+        class_to_id.setdefault(normalize_kaggle_class(cls), d.get("id"))
+
+    items = reference_items(diseases) + train_items(per_class, class_to_id)
+    if not items:
+        raise SystemExit("❌ 沒有可用的參考圖或訓練圖")
+    print(f"🖼️  共 {len(items)} 張圖片，開始計算 embedding…")
+
+    t0 = time.time()
+    vectors, items = embed_items(model, items)
+    print(f"✅ embedding 完成：{vectors.shape}，{time.time() - t0:.1f}s")
+
+    EMBED_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = EMBED_DIR / "vectors.tmp.npy"
+    np.save(tmp, vectors)
+    tmp.replace(EMBED_DIR / "vectors.npy")
+    atomic_write_json(items, EMBED_DIR / "items.json", indent=None)
+
+    ivf_path = EMBED_DIR / "ivfpq.npz"
+    if ivf:
+        t0 = time.time()
+        index = IVFPQIndex.build(vectors, nlist=min(nlist, max(len(vectors) // 39, 1)), m=m)
+        index.save(EMBED_DIR / "ivfpq.tmp.npz")
+        (EMBED_DIR / "ivfpq.tmp.npz").replace(ivf_path)
+        print(f"✅ IVF-PQ 索引完成：{time.time() - t0:.1f}s")
+    elif ivf_path.exists():
+        ivf_path.unlink()   # 舊索引對應的是舊向量
+
+    meta = {
+        "model_version": model.version,
+        "dim":           int(vectors.shape[1]),
+        "count":         len(items),
+        "ivf":           bool(ivf),
+        "built_at":      time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    atomic_write_json(meta, EMBED_DIR / "meta.json")   # 最後寫 meta，app 以它判斷是否重新載入
+    print(f"📦 已寫入 {EMBED_DIR}")
+    return meta
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="建立相似案例向量庫")
+    ap.add_argument("--per-class", type=int, default=200, help="每個類別最多收幾張訓練圖（0 = 不收）")
+    ap.add_argument("--ivf", action="store_true", help="另建 IVF-PQ 近似索引")
+    ap.add_argument("--nlist", type=int, default=256)
+    ap.add_argument("--m", type=int, default=32, help="PQ 子向量數（需整除 embedding 維度）")
+    args = ap.parse_args(argv)
+    build(per_class=args.per_class, ivf=args.ivf, nlist=args.nlist, m=args.m)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
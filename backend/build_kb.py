@@ -0,0 +1,164 @@
+"""
+build_kb.py
+一鍵建置病害知識庫：scrape → clean → images → thumbs → compile
+
+  python build_kb.py              # 只重跑過期 / 輸入有變動的階段
+  python build_kb.py --force      # 全部重跑
+  python build_kb.py --offline    # 只用 HTTP 快取（可重現的離線建置）
+  python build_kb.py --from images
+
+每個階段的輸出存在 scraped_data/build/，並在 state.json 記錄
+「輸入雜湊 → 輸出雜湊」；輸入沒變且輸出檔未被改動的階段直接略過。
+可從任何目錄執行（所有路徑都以本檔所在位置為基準）。
+最終產物 scraped_data/diseases.kb 經過驗證，app.py 會 mmap 載入並在檔案更新時自動切換。
+"""
+import sys
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+
+import http_cache
+from kb_store import (
+    BASE_DIR, DISEASE_JSON, KB_COMPILED, STALE_AFTER,
+    load_diseases, compile_kb, atomic_write_json,
+)
+
+BUILD_DIR  = BASE_DIR / "scraped_data" / "build"
+STATE_FILE = BUILD_DIR / "state.json"
+STAGES     = ("scrape", "clean", "images", "thumbs", "compile")
+
+# 階段邏輯有變動時調高對應版本，強制該階段（及其後）重跑
+STAGE_VERSIONS = {"scrape": 1, "clean": 1, "images": 1, "thumbs": 1, "compile": 2}
+
+
+# ─── 雜湊 / 狀態 ───────────────────────────────────────────────────────────────
+def file_hash(path: Path) -> str | None:
+    if not path.exists():
+        return None
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def load_state() -> dict:
+    if STATE_FILE.exists():
+        with open(STATE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def stage_key(stage: str, input_hash: str | None) -> str:
+    return f"v{STAGE_VERSIONS[stage]}:{input_hash}"
+
+
+def up_to_date(state: dict, stage: str, input_hash: str | None, output: Path) -> bool:
+    rec = state.get(stage)
+    return (
+        rec is not None
+        and rec.get("key") == stage_key(stage, input_hash)
+        and rec.get("output") == file_hash(output)
+    )
+
+
+# ─── 各階段 ────────────────────────────────────────────────────────────────────
+def stage_scrape(workers: int, force: bool) -> Path:
+    """增量爬取（只處理過期 / 來源變更的病害），合併寫回 diseases.json"""
+    from scrape_diseases import run_scraper, stale_sources
+    if force or stale_sources(STALE_AFTER) or not DISEASE_JSON.exists():
+        run_scraper(force=force, workers=workers)
+    else:
+        print("  ⚡ 所有病害皆未過期，略過爬取")
+    return DISEASE_JSON
+
+
+def stage_clean(src: Path, dst: Path) -> Path:
+    from clean_images import clean_diseases
+    diseases = load_diseases(src)
+    removed  = clean_diseases(diseases)
+    atomic_write_json({"diseases": diseases, "total": len(diseases)}, dst)
+    print(f"  ✓ 移除 {removed} 筆非圖片 URL")
+    return dst
+
+
+def stage_images(src: Path, dst: Path) -> Path:
+    from scrape_disease_images import localize_disease_images
+    diseases, downloaded = localize_disease_images(load_diseases(src))
+    atomic_write_json({"diseases": diseases, "total": len(diseases)}, dst)
+    print(f"  ✓ 圖片在地化完成，下載 {downloaded} 張")
+    return dst
+
+
+def stage_thumbs(src: Path, dst: Path) -> Path:
+    from thumbnails import add_thumbnails
+    diseases, made = add_thumbnails(load_diseases(src))
+    atomic_write_json({"diseases": diseases, "total": len(diseases)}, dst)
+    print(f"  ✓ 縮圖完成，新處理 {made} 張原圖")
+    return dst
+
+
+def stage_compile(src: Path, dst: Path) -> Path:
+    kb = compile_kb(load_diseases(src), dst)
+    print(f"  ✓ 編譯完成：{kb['total']} 筆，版本 {kb['version']}")
+    return dst
+
+
+# ─── 主流程 ────────────────────────────────────────────────────────────────────
+def build(force: bool = False, start: str = "scrape", workers: int = 4):
+    BUILD_DIR.mkdir(parents=True, exist_ok=True)
+    state   = load_state()
+    outputs = {
+        "scrape":  DISEASE_JSON,
+        "clean":   BUILD_DIR / "02_clean.json",
+        "images":  BUILD_DIR / "03_images.json",
+        "thumbs":  BUILD_DIR / "04_thumbs.json",
+        "compile": KB_COMPILED,
+    }
+    inputs = {"clean": DISEASE_JSON, "images": outputs["clean"], "thumbs": outputs["images"],
+              "compile": outputs["thumbs"]}
+
+    print("=" * 60)
+    print("🏗️  病害知識庫建置")
+    print("=" * 60)
+
+    for stage in STAGES[STAGES.index(start):]:
+        t0 = time.time()
+        print(f"\n[{stage}]")
+        if stage == "scrape":
+            stage_scrape(workers, force)
+            state[stage] = {"key": stage_key(stage, None), "output": file_hash(DISEASE_JSON)}
+            continue
+
+        input_hash = file_hash(inputs[stage])
+        if input_hash is None:
+            print(f"  ❌ 找不到輸入檔 {inputs[stage]}，請從較早的階段開始")
+            sys.exit(1)
+        if not force and up_to_date(state, stage, input_hash, outputs[stage]):
+            print("  ⚡ 輸入未變更，略過")
+            continue
+
+        runner = {"clean": stage_clean, "images": stage_images, "thumbs": stage_thumbs,
+                  "compile": stage_compile}[stage]
+        runner(inputs[stage], outputs[stage])
+        state[stage] = {"key": stage_key(stage, input_hash), "output": file_hash(outputs[stage])}
+        atomic_write_json(state, STATE_FILE)
+        print(f"  ⏱  {time.time() - t0:.1f}s")
+
+    atomic_write_json(state, STATE_FILE)
+    print(f"\n✅ 建置完成：{KB_COMPILED}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="建置病害知識庫")
+    ap.add_argument("--force", action="store_true", help="忽略快取，全部階段重跑")
+    ap.add_argument("--offline", action="store_true", help="只使用 HTTP 快取，不連網")
+    ap.add_argument("--from", dest="start", choices=STAGES, default="scrape", help="從指定階段開始")
+    ap.add_argument("--workers", type=int, default=4, help="爬取階段的平行數")
+    args = ap.parse_args()
+
+    if args.offline:
+        http_cache.set_offline(True)
+    build(force=args.force, start=args.start, workers=args.workers)
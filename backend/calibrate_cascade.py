@@ -0,0 +1,157 @@
+"""
+calibrate_cascade.py
+在 data/val 上為 cascade 選門檻，寫入 models/cascade.json
+
+  python calibrate_cascade.py                    # 目標：cascade 準確率 ≥ 主模型 − 0.5%
+  python calibrate_cascade.py --target 0.95      # 指定絕對準確率
+  python calibrate_cascade.py --tolerance 0.01
+
+student 與主模型各對驗證集推論一次，在 (min_top1, min_margin) 網格上
+計算「student 放行的樣本用 student 答案、其餘用主模型答案」的準確率，
+挑出達標組合中 student 放行比例最高者（同比例取準確率較高者）。
+門檻綁定兩個模型的版本，任一模型更新後 app.py 會停用 cascade 直到重新校正。
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from kb_store import atomic_write_json
+from model_registry import load_handle
+from model_serving import CASCADE_JSON, STUDENT_PATH, ServedModel, escalate_mask, image_to_array
+
+BASE_DIR   = Path(__file__).parent
+VAL_DIR    = BASE_DIR / "data" / "val"
+CLASS_JSON = BASE_DIR / "data" / "class_names.json"
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+BATCH_SIZE = 64
+
+
+# ─── 驗證資料 ──────────────────────────────────────────────────────────────────
+def labeled_files(directory: Path, class_names: list[str], per_class: int = 0) -> list[tuple[Path, int]]:
+    """data/val/<類別>/* → [(路徑, 標籤)]；per_class=0 表示全部"""
+    out = []
+    for label, cls in enumerate(class_names):
+        cls_dir = directory / cls
+        if cls_dir.is_dir():
+            files = sorted(p for p in cls_dir.iterdir() if p.suffix.lower() in IMAGE_EXTS)
+            out.extend((p, label) for p in files[:per_class or None])
+    return out
+
+
+def iter_batches(files: list[tuple[Path, int]], size: tuple[int, int] = (224, 224)):
+    """逐批解碼（不把整個驗證集放進記憶體）→ (影像 (B, H, W, 3)，標籤 (B,))"""
+    arrays, labels = [], []
+    for path, label in files:
+        try:
+            with Image.open(path) as img:
+                arrays.append(image_to_array(img, size))
+            labels.append(label)
+        except OSError as e:
+            print(f"  ⚠️  略過 {path.name}：{e}")
+        if len(arrays) == BATCH_SIZE:
+            yield np.stack(arrays), np.asarray(labels)
+            arrays, labels = [], []
+    if arrays:
+        yield np.stack(arrays), np.asarray(labels)
+
+
+# ─── 門檻搜尋 ──────────────────────────────────────────────────────────────────
+def choose_thresholds(student_probs: np.ndarray, full_probs: np.ndarray, labels: np.ndarray,
+                      target: float, grid: int = 41) -> dict | None:
+    """回傳達到 target 準確率、student 放行比例最高的門檻；都達不到時回傳 None"""
+    student_ok = student_probs.argmax(1) == labels
+    full_ok    = full_probs.argmax(1) == labels
+    best = None
+    for min_top1 in np.linspace(0.0, 1.0, grid):
+        for min_margin in np.linspace(0.0, 1.0, grid):
+            escalate = escalate_mask(student_probs, min_top1, min_margin)
+            accuracy = float(np.where(escalate, full_ok, student_ok).mean())
+            fraction = float(1 - escalate.mean())
+            if accuracy < target:
+                continue
+            if best is None or (fraction, accuracy) > (best["student_fraction"], best["accuracy"]):
+                best = {"min_top1": round(float(min_top1), 4), "min_margin": round(float(min_margin), 4),
+                        "accuracy": accuracy, "student_fraction": fraction}
+    return best
+
+
+def calibrate(target: float | None = None, tolerance: float = 0.005, per_class: int = 0) -> dict:
+    handle = load_handle()   # 與 app.py 服務中的版本相同
+    if handle is None or not STUDENT_PATH.exists():
+        raise SystemExit("❌ 需要主模型與 student 模型（train_model.py / train_student.py）")
+    class_names = handle.class_names
+    if not class_names:
+        with open(CLASS_JSON, encoding="utf-8") as f:
+            class_names = json.load(f)["classes"]
+
+    full    = handle.model
+    student = ServedModel.load(STUDENT_PATH)
+    files = labeled_files(VAL_DIR, class_names, per_class)
+    if not files:
+        raise SystemExit(f"❌ {VAL_DIR} 沒有驗證圖片")
+    print(f"🖼️  驗證集：{len(files)} 張，{len(class_names)} 類")
+
+    student_probs, full_probs, labels = [], [], []
+    t_student = t_full = 0.0
+    for images, batch_labels in iter_batches(files, full.input_hw[::-1]):
+        t0 = time.perf_counter()
+        student_probs.append(student.predict_probs(images))
+        t1 = time.perf_counter()
+        full_probs.append(full.predict_probs(images))
+        t_student += t1 - t0
+        t_full    += time.perf_counter() - t1
+        labels.append(batch_labels)
+    student_probs = np.concatenate(student_probs)
+    full_probs    = np.concatenate(full_probs)
+    labels        = np.concatenate(labels)
+
+    acc_student = float((student_probs.argmax(1) == labels).mean())
+    acc_full    = float((full_probs.argmax(1) == labels).mean())
+    if target is None:
+        target = acc_full - tolerance
+    print(f"   student 準確率 {acc_student:.4f}（{t_student:.1f}s）  主模型 {acc_full:.4f}（{t_full:.1f}s）")
+    print(f"   目標準確率 {target:.4f}")
+
+    best = choose_thresholds(student_probs, full_probs, labels, target)
+    if best is None:   # 全部交給主模型仍達不到目標（target 高於主模型本身）
+        best = {"min_top1": 1.01, "min_margin": 1.01, "accuracy": acc_full, "student_fraction": 0.0}
+        print("⚠️  沒有門檻能達到目標，cascade 將全部交給主模型")
+
+    config = {
+        "model_version":    full.version,
+        "student_version":  student.version,
+        "min_top1":         best["min_top1"],
+        "min_margin":       best["min_margin"],
+        "target_accuracy":  round(target, 4),
+        "val_images":       int(len(labels)),
+        "val_accuracy": {
+            "student": round(acc_student, 4),
+            "full":    round(acc_full, 4),
+            "cascade": round(best["accuracy"], 4),
+        },
+        "student_fraction": round(best["student_fraction"], 4),
+        "calibrated_at":    time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    atomic_write_json(config, CASCADE_JSON)
+    print(f"✅ min_top1={config['min_top1']}  min_margin={config['min_margin']}  "
+          f"cascade 準確率 {best['accuracy']:.4f}  student 放行 {best['student_fraction']:.1%}")
+    print(f"   已寫入 {CASCADE_JSON}")
+    return config
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="在 data/val 上校正 cascade 門檻")
+    ap.add_argument("--target", type=float, help="cascade 最低準確率（預設：主模型 − tolerance）")
+    ap.add_argument("--tolerance", type=float, default=0.005)
+    ap.add_argument("--per-class", type=int, default=0, help="每類最多取幾張（0 = 全部）")
+    args = ap.parse_args(argv)
+    calibrate(target=args.target, tolerance=args.tolerance, per_class=args.per_class)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
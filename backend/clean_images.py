@@ -3,11 +3,10 @@ clean_images.py
 清理 diseases.json 中的非圖片 URL（.pdf、.ogv 等）
 執行方式：python clean_images.py
 """
-import json
-import os
+from kb_store import DISEASE_JSON, load_diseases, save_diseases
 
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg"}
-JSON_PATH  = os.path.join("scraped_data", "diseases.json")
+JSON_PATH  = DISEASE_JSON
 
 
 def is_image_url(url: str) -> bool:
@@ -18,33 +17,36 @@ def is_image_url(url: str) -> bool:
     return ext in IMAGE_EXTS
 
 
-def clean():
-    with open(JSON_PATH, encoding="utf-8") as f:
-        data = json.load(f)
-
+def clean_diseases(diseases: list[dict]) -> int:
+    """就地移除每筆病害的非圖片 URL，回傳移除總數（單次掃描，O(n)）"""
     total_removed = 0
 
-    for disease in data["diseases"]:
-        before = disease.get("images", [])
-        after  = [img for img in before if is_image_url(img.get("url", ""))]
+    for disease in diseases:
+        kept, dropped = [], []
+        for img in disease.get("images", []):
+            (kept if is_image_url(img.get("url", "")) else dropped).append(img)
+
+        if dropped:
+            print(f"  [{disease.get('name_zh', disease.get('id'))}] 移除 {len(dropped)} 筆非圖片：")
+            for img in dropped:
+                print(f"    ✗ {img.get('url', '')[:80]}")
+            total_removed += len(dropped)
 
-        removed = len(before) - len(after)
-        if removed:
-            print(f"  [{disease['name_zh']}] 移除 {removed} 筆非圖片：")
-            for img in before:
-                if img not in after:
-                    print(f"    ✗ {img['url'][:80]}")
-            total_removed += removed
+        disease["images"] = kept
 
-        disease["images"] = after
+    return total_removed
+
+
+def clean():
+    diseases = load_diseases(JSON_PATH)
+    total_removed = clean_diseases(diseases)
 
-    # 存回
-    with open(JSON_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # 存回（原子寫入）
+    save_diseases(diseases, JSON_PATH)
 
     print(f"\n✅ 清理完成！共移除 {total_removed} 筆非圖片 URL")
     print(f"   已存回 {JSON_PATH}")
 
 
 if __name__ == "__main__":
-    clean()
\ No newline at end of file
+    clean()
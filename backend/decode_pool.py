@@ -0,0 +1,131 @@
+"""
+decode_pool.py
+以子行程解碼上傳圖片，避開 GIL
+
+Image.open → convert("RGB") → resize 在 request 執行緒上做時，threaded server 的各請求
+互相搶 GIL，也和回應序列化搶。DecodePool 把原始位元組交給 worker 行程：
+  - 父行程建立一塊共享記憶體，切成 slots 個 224×224×3 uint8 槽位
+  - worker 解碼後直接寫進指定槽位，只回傳一個小的 tuple（原圖尺寸），陣列本身不經過 pickle
+  - 父行程從槽位轉成 float32 / 255 後立刻歸還槽位；槽位用完時等待（有逾時），自然形成背壓
+worker 數（PHYTOSCAN_DECODE_WORKERS）與推論執行緒數分開調整；0 = 停用，維持原本在 request 執行緒解碼。
+worker 以 spawn 啟動（會重新 import 主程式，入口腳本需有 if __name__ == "__main__" 保護；
+app.py 在 import 階段不載入 TensorFlow，子行程啟動很輕）。
+worker 行程異常結束（解壓縮炸彈 OOM、segfault）時 ProcessPoolExecutor 會永久失效：
+偵測到後重建 pool，當下的請求丟出 DecoderRestarted（app.py 回 503），之後的請求不受影響。
+"""
+import io
+import queue
+import atexit
+import warnings
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+IMG_SIZE       = (224, 224)
+SLOT_TIMEOUT   = 10.0
+DECODE_TIMEOUT = 10.0
+MAX_PIXELS     = 64_000_000   # 超過即拒絕解碼（8000×8000；RGB 約 192 MB）
+
+
+class DecoderRestarted(Exception):
+    """worker 行程異常結束，pool 已重建；這次的請求沒有結果"""
+
+# ── worker 行程 ────────────────────────────────────────────────────────────────
+_shm   = None
+_slots = None
+
+
+def _init_worker(shm_name: str, n_slots: int, size: tuple[int, int]):
+    global _shm, _slots
+    from PIL import Image
+    # 像素數超過上限直接丟出 DecompressionBombError（預設在 1–2 倍上限之間只發警告）
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    warnings.simplefilter("error", Image.DecompressionBombWarning)
+    _shm = shared_memory.SharedMemory(name=shm_name)   # 與父行程共用 resource tracker，由父行程 unlink
+    _slots = np.ndarray((n_slots, size[1], size[0], 3), dtype=np.uint8, buffer=_shm.buf)
+
+
+def _decode_into(data: bytes, slot: int, size: tuple[int, int]) -> tuple[int, int]:
+    from PIL import Image
+    from model_serving import image_to_uint8
+
+    img = Image.open(io.BytesIO(data))
+    original = img.size
+    _slots[slot] = image_to_uint8(img, size)
+    return original
+
+
+def _ping(_) -> bool:
+    return True
+
+
+# ── 父行程 ─────────────────────────────────────────────────────────────────────
+class DecodePool:
+    def __init__(self, workers: int, slots: int | None = None, size: tuple[int, int] = IMG_SIZE):
+        self.workers = workers
+        self.size    = size
+        self.n_slots = slots or workers * 4
+        self._shm    = shared_memory.SharedMemory(create=True, size=self.n_slots * size[0] * size[1] * 3)
+        self._slots  = np.ndarray((self.n_slots, size[1], size[0], 3), dtype=np.uint8, buffer=self._shm.buf)
+        self._free   = queue.Queue()
+        for i in range(self.n_slots):
+            self._free.put(i)
+        self._lock = threading.Lock()
+        self._pool = self._new_pool()
+        atexit.register(self.close)
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn：父行程已載入 TensorFlow，fork 出來的子行程不安全
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=mp.get_context("spawn"),
+            initializer=_init_worker, initargs=(self._shm.name, self.n_slots, self.size),
+        )
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        """同一個失效的 pool 只重建一次（同時失敗的其他請求直接沿用新的）"""
+        with self._lock:
+            if self._pool is not broken:
+                return
+            print("⚠️  解碼子行程異常結束，重建 pool")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._new_pool()
+
+    def warmup(self):
+        """先把所有 worker 行程啟動起來（spawn 啟動需要數百毫秒）"""
+        list(self._pool.map(_ping, range(self.workers)))
+
+    def decode(self, data: bytes) -> np.ndarray:
+        """原始位元組 → (1, H, W, 3) float32 0–1（與 preprocess_image 相同）"""
+        try:
+            slot = self._free.get(timeout=SLOT_TIMEOUT)
+        except queue.Empty:
+            raise TimeoutError("解碼槽位已滿") from None
+        pool, release = self._pool, True
+        try:
+            fut = pool.submit(_decode_into, data, slot, self.size)
+            fut.result(timeout=DECODE_TIMEOUT)
+            return self._slots[slot][None].astype(np.float32) / 255.0
+        except BrokenProcessPool:
+            self._restart(pool)
+            raise DecoderRestarted() from None
+        except TimeoutError:
+            # worker 可能還在寫這個槽位：等它結束才歸還，不會蓋掉下一個請求的圖
+            release = False
+            fut.add_done_callback(lambda _: self._free.put(slot))
+            raise TimeoutError("解碼逾時") from None
+        finally:
+            if release:
+                self._free.put(slot)
+
+    def close(self):
+        if self._shm is None:
+            return
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._slots = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
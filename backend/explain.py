@@ -0,0 +1,211 @@
+"""
+explain.py
+Grad-CAM：模型看了葉片的哪些區域（/api/explain/<prediction_id>，只在被要求時計算）
+
+  TensorCache   image sha256 → 該次預測前處理後的 (224, 224, 3) uint8（LRU）；
+                /api/predict 成功時順手放入，explain 不必重新解碼
+  GradCAM       每個模型版本建一次的 tf.function（固定 input signature，不會重新 trace）：
+                最後一個卷積特徵圖 → 分類 head → 目標類別的 logit → 對特徵圖的梯度
+                → 各通道權重 × 特徵圖 → ReLU → 正規化到 0–1（7×7）
+  ExplainBatcher 同時到達的 explain 請求疊成一個 batch 算一次梯度（與 model_routing.MicroBatcher 相同做法），
+                同一張圖 / 版本 / 類別的重複請求共用同一個 Future
+  overlay_png   熱度圖放大後以色階疊在 224×224 原圖上，輸出 PNG
+結果 PNG 以 (image hash, 模型版本, 類別) 為 key 放在另一個 LRUBytes（app.py，以位元組數為上限）。
+"""
+import io
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+from PIL import Image
+
+from metrics import metrics
+
+MAX_BATCH     = 8
+MAX_WAIT_MS   = 10.0
+QUEUE_MAX     = 64
+ALPHA         = 0.45     # 熱度圖疊加的不透明度
+# 熱度色階（低 → 高）：深藍 → 青 → 黃 → 紅
+COLORMAP = np.array([[0, 0, 128], [0, 160, 255], [80, 255, 160], [255, 230, 0], [230, 20, 0]], dtype=np.float32)
+
+
+class LRUBytes:
+    """有總量上限的 LRU；size(value) 為每筆佔用的量（預設 len，即位元組數）"""
+
+    def __init__(self, max_size: int, size=len):
+        self.max_size = max_size
+        self.total    = 0
+        self._size    = size
+        self._items   = OrderedDict()
+        self._lock    = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            if key in self._items:
+                self.total -= self._size(self._items.pop(key))
+            self._items[key] = value
+            self.total += self._size(value)
+            while self.total > self.max_size and len(self._items) > 1:
+                _, old = self._items.popitem(last=False)
+                self.total -= self._size(old)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class TensorCache(LRUBytes):
+    """image sha256 → (H, W, 3) uint8；前處理後的值都是 k/255，存 uint8 不失真、只佔 float32 的 1/4"""
+
+    def __init__(self, max_entries: int = 256):
+        super().__init__(max_entries, size=lambda _: 1)
+
+    def put(self, digest: str, arr: np.ndarray):
+        """arr：(1, H, W, 3) 或 (H, W, 3)，float32 0–1 或 uint8"""
+        arr = np.asarray(arr).reshape(arr.shape[-3:])
+        super().put(digest, arr if arr.dtype == np.uint8 else np.round(arr * 255).astype(np.uint8))
+
+
+# ─── Grad-CAM ──────────────────────────────────────────────────────────────────
+class GradCAM:
+    def __init__(self, served):
+        import tensorflow as tf
+
+        model  = served.model
+        layers = model.layers
+        # 最後一個輸出為 (N, h, w, C) 的層（MobileNetV2 base），之後是 GAP → … → softmax Dense 的單線 head
+        idx = max(i for i, l in enumerate(layers) if len(l.output.shape) == 4)
+        self.conv    = layers[idx]
+        self.head    = layers[idx + 1:-1]
+        self.final   = layers[-1]
+        self.version = served.version
+        self.grid    = tuple(self.conv.output.shape[1:3])
+
+        spec = tf.TensorSpec([None, *served.input_hw, 3], tf.float32)
+
+        @tf.function(input_signature=[spec, tf.TensorSpec([None], tf.int32)])
+        def cam(x, cls):
+            with tf.GradientTape() as tape:
+                feats = self.conv(x, training=False)
+                tape.watch(feats)
+                h = feats
+                for layer in self.head:
+                    h = layer(h, training=False)
+                # softmax 前的 logit（softmax 飽和時梯度趨近 0，熱度圖會幾乎全黑）
+                logits = tf.matmul(h, self.final.kernel) + self.final.bias
+                score  = tf.gather(logits, cls, batch_dims=1)
+            grads   = tape.gradient(score, feats)
+            weights = tf.reduce_mean(grads, axis=(1, 2), keepdims=True)
+            heat    = tf.nn.relu(tf.reduce_sum(weights * feats, axis=-1))
+            return heat / (tf.reduce_max(heat, axis=(1, 2), keepdims=True) + 1e-8)
+
+        self._cam = cam
+
+    def __call__(self, batch: np.ndarray, classes: np.ndarray) -> np.ndarray:
+        """(N, H, W, 3) float32 0–1、(N,) 類別索引 → (N, h, w) 0–1"""
+        return self._cam(np.asarray(batch, dtype=np.float32), np.asarray(classes, dtype=np.int32)).numpy()
+
+
+class ExplainBatcher:
+    """單一模型版本的 Grad-CAM 批次器（一條佇列 + 一個 worker 執行緒）"""
+
+    def __init__(self, served, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+        self.version   = served.version
+        self.max_batch = max_batch
+        self.max_wait  = max_wait_ms / 1000
+        self._served   = served
+        self._gradcam  = None   # 第一個請求時在 worker 執行緒建立
+        self._queue    = queue.Queue(maxsize=QUEUE_MAX)
+        self._inflight = {}     # key → Future（重複請求共用）
+        self._lock     = threading.Lock()
+        self._thread   = threading.Thread(target=self._run, name=f"explain-{self.version}", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, tensor: np.ndarray, cls: int) -> Future:
+        """tensor：(H, W, 3) uint8；回傳 Future → (h, w) 熱度圖。佇列已滿時丟出 queue.Full"""
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                metrics.inc("explain.coalesced")
+                return fut
+            fut = self._inflight[key] = Future()
+        try:
+            self._queue.put_nowait((key, tensor, cls, fut))
+        except queue.Full:
+            with self._lock:
+                self._inflight.pop(key, None)
+            raise
+        return fut
+
+    def stop(self):
+        """模型切換後停掉：佇列中剩下的請求處理完後 worker 結束，不再持有舊模型"""
+        self._queue.put(None)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            items    = [first]
+            deadline = time.perf_counter() + self.max_wait
+            while len(items) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:   # stop()：這批算完就結束
+                    self._queue.put(None)
+                    break
+                items.append(item)
+
+            t0 = time.perf_counter()
+            try:
+                if self._gradcam is None:
+                    self._gradcam = GradCAM(self._served)
+                batch = np.stack([it[1] for it in items]).astype(np.float32) / 255.0
+                heat  = self._gradcam(batch, np.array([it[2] for it in items]))
+            except Exception as e:
+                heat = e
+            metrics.inc("explain.batches")
+            metrics.inc("explain.rows", len(items))
+            metrics.observe("explain.batch_ms", (time.perf_counter() - t0) * 1000)
+            for i, (key, _, _, fut) in enumerate(items):
+                with self._lock:
+                    self._inflight.pop(key, None)
+                if isinstance(heat, Exception):
+                    fut.set_exception(heat)
+                else:
+                    fut.set_result(heat[i])
+
+
+# ─── 疊圖 ──────────────────────────────────────────────────────────────────────
+def colorize(heat: np.ndarray) -> np.ndarray:
+    """(h, w) 0–1 → (h, w, 3) float32 RGB（COLORMAP 線性插值）"""
+    pos = np.clip(heat, 0, 1) * (len(COLORMAP) - 1)
+    lo  = np.floor(pos).astype(int).clip(0, len(COLORMAP) - 2)
+    t   = (pos - lo)[..., None]
+    return COLORMAP[lo] * (1 - t) + COLORMAP[lo + 1] * t
+
+
+def overlay_png(image: np.ndarray, heat: np.ndarray, alpha: float = ALPHA) -> bytes:
+    """image：(H, W, 3) uint8；heat：(h, w) 0–1 → 疊好熱度圖的 PNG bytes"""
+    h, w  = image.shape[:2]
+    up    = np.asarray(Image.fromarray(heat.astype(np.float32)).resize((w, h), Image.BILINEAR))
+    # 熱度低的地方保留原圖，高的地方色階越明顯
+    a     = (alpha * np.clip(up, 0, 1))[..., None]
+    mixed = image.astype(np.float32) * (1 - a) + colorize(up) * a
+    buf   = io.BytesIO()
+    Image.fromarray(mixed.clip(0, 255).astype(np.uint8)).save(buf, "PNG", optimize=False)
+    return buf.getvalue()
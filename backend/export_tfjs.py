@@ -0,0 +1,278 @@
+"""
+export_tfjs.py
+把模型轉成 TensorFlow.js graph model，讓瀏覽器在本機辨識（田間離線 / 減輕伺服器負載）
+
+  python export_tfjs.py                          # 預設：cascade 已校正時用 student，否則用主模型
+  python export_tfjs.py --source full --quantize uint8
+  python export_tfjs.py --check static/tfjs/<目錄>  # 只重跑一致性檢查
+
+輸出 static/tfjs/<16 碼雜湊>/：
+  model.json + group1-shardNofM.bin   weights 以 --shard-kb 切片（預設 float16 量化）
+  class_names.json                    模型輸出的類別順序
+  diseases.json                       kaggle_class → [disease_id, 中文名稱, 嚴重度]（只含模型的類別）
+目錄名由（模型版本, 量化, 切片大小）決定，內容變了網址就變，app.py 以 immutable 長效快取送出；
+瀏覽器經 GET /api/model/browser 讀 static/tfjs/current.json 找到最新一份（不快取）。
+
+用 student 時一併帶出 cascade 門檻：前端明確開啟本機優先時，信心不足的結果改問 /api/predict
+（與伺服器 cascade 相同規則）；其餘情況瀏覽器只在連不上伺服器時才用本機模型。
+
+一致性檢查：以 Python 重建瀏覽器實際載入的 graph（model.json 的 topology + 量化後的 weights），
+對 data/val 比較 top-1 與伺服器（ServedModel）的結果；一致率低於 --min-agreement 時不更新 current.json。
+
+需要 tensorflowjs（pip install tensorflowjs，只有這個離線步驟使用，伺服器不需要）。
+"""
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from kb_store import KB_COMPILED, atomic_write_json, load_compiled_kb
+from model_registry import load_handle
+from model_serving import CASCADE_JSON, STUDENT_PATH, ServedModel, file_fingerprint
+from calibrate_cascade import VAL_DIR, labeled_files, iter_batches
+
+BASE_DIR      = Path(__file__).parent
+TFJS_DIR      = BASE_DIR / "static" / "tfjs"
+CURRENT_JSON  = TFJS_DIR / "current.json"
+CLASS_JSON    = BASE_DIR / "data" / "class_names.json"
+DISEASE_JSON  = BASE_DIR / "scraped_data" / "diseases.json"
+SHARD_KB      = 1024     # 1 MB：單檔小、可平行下載，瀏覽器 / Service Worker 也較容易整檔快取
+KEEP_EXPORTS  = 3        # 保留最近幾份（舊版頁面仍可能在下載）
+MIN_AGREEMENT = 0.98
+QUANTIZE      = ("float16", "uint8", "none")
+
+
+# ─── 模型來源 ──────────────────────────────────────────────────────────────────
+def _class_names(handle) -> list[str]:
+    if handle is not None and handle.class_names:
+        return handle.class_names
+    with open(CLASS_JSON, encoding="utf-8") as f:
+        return json.load(f)["classes"]
+
+
+def _cascade_thresholds(full_version: str) -> dict | None:
+    """cascade.json 是針對目前主模型與 student 校正的才採用（與 model_serving.Cascade.load 相同條件）"""
+    if not CASCADE_JSON.exists() or not STUDENT_PATH.exists():
+        return None
+    with open(CASCADE_JSON, encoding="utf-8") as f:
+        cfg = json.load(f)
+    if cfg.get("model_version") != full_version or cfg.get("student_version") != file_fingerprint(STUDENT_PATH):
+        return None
+    return {"min_top1": cfg["min_top1"], "min_margin": cfg["min_margin"]}
+
+
+def choose_source(source: str) -> tuple[ServedModel, list[str], dict]:
+    """回傳（要轉換的模型, 類別, 瀏覽器的升級門檻）"""
+    handle = load_handle()
+    if handle is None:
+        raise SystemExit("❌ 找不到模型，請先執行 train_model.py")
+    thresholds = _cascade_thresholds(handle.version)
+    if source == "student" and thresholds is None:
+        raise SystemExit("❌ student 未校正或與目前主模型不符，請先執行 calibrate_cascade.py")
+    if source == "student" or (source == "auto" and thresholds is not None):
+        return ServedModel.load(STUDENT_PATH), _class_names(handle), thresholds
+    # 主模型：門檻為 0，瀏覽器只在離線時使用（線上一律由 /api/predict 回答：葉片篩選、紀錄、Grad-CAM）
+    return handle.model, _class_names(handle), {"min_top1": 0.0, "min_margin": 0.0}
+
+
+def disease_lookup(class_names: list[str]) -> dict:
+    """kaggle_class → [disease_id, 中文名稱, 嚴重度]（與 app.lookup_disease 相同的查詢順序）"""
+    from kb_store import normalize_kaggle_class
+    from kb_compiled import DiseaseKB
+
+    kb = load_compiled_kb(KB_COMPILED)
+    if kb is None and DISEASE_JSON.exists():
+        with open(DISEASE_JSON, encoding="utf-8") as f:
+            kb = DiseaseKB.from_records(json.load(f)["diseases"])
+    elif kb is None:
+        from scrape_diseases import STATIC_DISEASES
+        kb = DiseaseKB.from_records(STATIC_DISEASES)
+    out = {}
+    for cls in class_names:
+        rec = kb.get(cls) or kb.get(normalize_kaggle_class(cls)) or {}
+        out[cls] = [rec.get("id"), rec.get("name_zh"), rec.get("severity")]
+    return out
+
+
+# ─── 轉換 ──────────────────────────────────────────────────────────────────────
+def export_dir(version: str, quantize: str, shard_kb: int) -> Path:
+    import tensorflowjs
+    key = f"{version}:{quantize}:{shard_kb}:{tensorflowjs.__version__}"
+    return TFJS_DIR / hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def convert(served: ServedModel, out_dir: Path, quantize: str, shard_kb: int):
+    """Keras → SavedModel（暫存）→ TF.js graph model"""
+    from tensorflowjs.converters.tf_saved_model_conversion_v2 import convert_tf_saved_model
+
+    import tensorflow as tf
+
+    # 只有推論（training=False）的 serving signature，輸出 softmax 機率；BN 不會留下更新 moving stats 的 op
+    model  = served.model
+    module = tf.Module()
+    module.model = model
+    module.serve = tf.function(lambda image: {"probs": model(image, training=False)},
+                               input_signature=[tf.TensorSpec([None, *served.input_hw, 3], tf.float32, name="image")])
+
+    tmp = Path(tempfile.mkdtemp(prefix="tfjs-export-"))
+    try:
+        tf.saved_model.save(module, str(tmp / "saved_model"), signatures={"serving_default": module.serve})
+        convert_tf_saved_model(
+            str(tmp / "saved_model"), str(tmp / "out"),
+            quantization_dtype_map={quantize: True} if quantize != "none" else None,
+            weight_shard_size_bytes=shard_kb * 1024,
+        )
+        if out_dir.exists():
+            shutil.rmtree(out_dir)
+        shutil.move(str(tmp / "out"), out_dir)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ─── 一致性檢查 ────────────────────────────────────────────────────────────────
+# TF.js 自訂的融合 op（TensorFlow 沒有 kernel）：拆回原本的 op 序列
+ACTIVATIONS = {"Relu", "Relu6", "Elu", "Sigmoid", "Tanh"}
+
+
+def _unfuse_depthwise(node) -> list:
+    """FusedDepthwiseConv2dNative(x, filter, bias) → DepthwiseConv2dNative → BiasAdd → 激活函數"""
+    from tensorflow.core.framework import node_def_pb2
+
+    args  = [i for i in node.input[2:] if not i.startswith("^")]
+    dw    = node_def_pb2.NodeDef(name=f"{node.name}/depthwise", op="DepthwiseConv2dNative",
+                                 input=list(node.input[:2]))
+    for k in ("T", "strides", "padding", "dilations", "data_format", "explicit_paddings"):
+        if k in node.attr:
+            dw.attr[k].CopyFrom(node.attr[k])
+    out = [dw]
+    for fused in (s.decode() for s in node.attr["fused_ops"].list.s):
+        if fused == "BiasAdd":
+            n = node_def_pb2.NodeDef(name=f"{node.name}/bias", op="BiasAdd", input=[out[-1].name, args.pop(0)])
+            n.attr["data_format"].CopyFrom(node.attr["data_format"])
+        elif fused in ACTIVATIONS:
+            n = node_def_pb2.NodeDef(name=f"{node.name}/{fused.lower()}", op=fused, input=[out[-1].name])
+        else:
+            raise ValueError(f"一致性檢查不支援融合 op：{fused}（{node.name}）")
+        n.attr["T"].CopyFrom(node.attr["T"])
+        out.append(n)
+    out[-1].name = node.name   # 下游節點照原名稱接上
+    return out
+
+
+def load_browser_model(model_dir: Path):
+    """model.json + shards → 可呼叫的 (N, H, W, 3) float32 → (N, C)；weights 經量化再還原，與瀏覽器相同"""
+    import tensorflow as tf
+    from google.protobuf.json_format import ParseDict
+    from tensorflow.core.framework import graph_pb2
+    from tensorflowjs.read_weights import read_weights
+
+    spec    = json.loads((model_dir / "model.json").read_text(encoding="utf-8"))
+    graph   = ParseDict(spec["modelTopology"], graph_pb2.GraphDef(), ignore_unknown_fields=True)
+    weights = {w["name"]: w["data"] for w in read_weights(spec["weightsManifest"], str(model_dir), flatten=True)}
+
+    nodes = []
+    for node in graph.node:
+        if node.op == "Const" and node.name in weights:
+            node.attr["value"].tensor.CopyFrom(tf.make_tensor_proto(weights[node.name]))
+        nodes.extend(_unfuse_depthwise(node) if node.op == "FusedDepthwiseConv2dNative" else [node])
+    del graph.node[:]
+    graph.node.extend(nodes)
+
+    (in_spec,)  = spec["signature"]["inputs"].values()
+    (out_spec,) = spec["signature"]["outputs"].values()
+    fn = tf.compat.v1.wrap_function(lambda: tf.compat.v1.import_graph_def(graph, name=""), [])
+    run = fn.prune(fn.graph.get_tensor_by_name(in_spec["name"]), fn.graph.get_tensor_by_name(out_spec["name"]))
+    return lambda batch: run(tf.constant(batch, dtype=tf.float32)).numpy()
+
+
+def check_parity(model_dir: Path, served: ServedModel, class_names: list[str], per_class: int = 0) -> dict:
+    """data/val 上瀏覽器格式模型與伺服器模型的 top-1 一致率、機率最大差距"""
+    browser = load_browser_model(model_dir)
+    files   = labeled_files(VAL_DIR, class_names, per_class)
+    if not files:
+        raise SystemExit(f"❌ {VAL_DIR} 沒有驗證圖片")
+    agree, total, max_diff = 0, 0, 0.0
+    for images, _ in iter_batches(files, served.input_hw[::-1]):
+        ref   = served.predict_probs(images)
+        probs = browser(images)
+        agree    += int((ref.argmax(1) == probs.argmax(1)).sum())
+        total    += len(images)
+        max_diff  = float(np.max([max_diff, np.abs(ref - probs).max()]))   # NaN 也要反映出來
+    return {"images": total, "top1_agreement": round(agree / total, 4), "max_prob_diff": round(max_diff, 5)}
+
+
+# ─── 主流程 ────────────────────────────────────────────────────────────────────
+def prune_exports(keep: Path):
+    dirs = sorted((d for d in TFJS_DIR.iterdir() if d.is_dir()), key=lambda d: d.stat().st_mtime, reverse=True)
+    for d in dirs[KEEP_EXPORTS:]:
+        if d != keep:
+            shutil.rmtree(d, ignore_errors=True)
+
+
+def export(source: str = "auto", quantize: str = "float16", shard_kb: int = SHARD_KB,
+           min_agreement: float = MIN_AGREEMENT, per_class: int = 0) -> dict:
+    served, class_names, thresholds = choose_source(source)
+    kind    = "student" if served.path == STUDENT_PATH else "full"
+    out_dir = export_dir(served.version, quantize, shard_kb)
+    print(f"🔄 轉換 {kind} 模型（{served.version}，量化 {quantize}）→ {out_dir.relative_to(BASE_DIR)}")
+
+    t0 = time.perf_counter()
+    convert(served, out_dir, quantize, shard_kb)
+    atomic_write_json({"classes": class_names}, out_dir / "class_names.json", indent=None)
+    atomic_write_json(disease_lookup(class_names), out_dir / "diseases.json", indent=None)
+    shards = sorted(out_dir.glob("*.bin"))
+    size   = sum(p.stat().st_size for p in shards)
+    print(f"   {len(shards)} 個 weight 檔，共 {size / 1024 / 1024:.2f} MB（{time.perf_counter() - t0:.1f}s）")
+
+    parity = check_parity(out_dir, served, class_names, per_class)
+    print(f"🔍 data/val {parity['images']} 張：top-1 一致 {parity['top1_agreement']:.2%}  "
+          f"機率最大差距 {parity['max_prob_diff']}")
+    if parity["top1_agreement"] < min_agreement:
+        raise SystemExit(f"❌ 一致率低於 {min_agreement:.0%}，不更新 current.json（可改用 --quantize float16 / none）")
+
+    base    = f"/static/tfjs/{out_dir.name}"
+    current = {
+        "id":            out_dir.name,
+        "source":        kind,
+        "model_version": served.version,
+        "quantize":      quantize,
+        "input_size":    list(served.input_hw),
+        "model_url":     f"{base}/model.json",
+        "classes_url":   f"{base}/class_names.json",
+        "diseases_url":  f"{base}/diseases.json",
+        "weight_bytes":  size,
+        **thresholds,
+        "parity":        parity,
+        "exported_at":   time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    atomic_write_json(current, CURRENT_JSON)
+    prune_exports(out_dir)
+    print(f"✅ 已更新 {CURRENT_JSON.relative_to(BASE_DIR)}")
+    return current
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="匯出瀏覽器用的 TensorFlow.js 模型")
+    ap.add_argument("--source", choices=("auto", "student", "full"), default="auto")
+    ap.add_argument("--quantize", choices=QUANTIZE, default="float16")
+    ap.add_argument("--shard-kb", type=int, default=SHARD_KB)
+    ap.add_argument("--min-agreement", type=float, default=MIN_AGREEMENT)
+    ap.add_argument("--per-class", type=int, default=0, help="一致性檢查每類最多取幾張（0 = 全部）")
+    ap.add_argument("--check", type=Path, help="只對已匯出的目錄做一致性檢查")
+    args = ap.parse_args(argv)
+
+    if args.check:
+        served, class_names, _ = choose_source(args.source)
+        print(check_parity(args.check, served, class_names, args.per_class))
+        return
+    export(args.source, args.quantize, args.shard_kb, args.min_agreement, args.per_class)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,230 @@
+"""
+history.py
+辨識紀錄（SQLite，WAL）與增量維護的統計
+
+  data/history.sqlite3
+    predictions  每次辨識一列（id、時間、模型版本、top-1 類別與信心、stage、來源、top3、
+                 image_hash = 上傳圖片的 sha256，對應 upload_store 中的檔案）
+    counters     (dim, key) → count / conf_sum；dim 為 total / class / day / version
+
+request 執行緒只把紀錄丟進有上限的佇列（滿了就丟棄並計數，不會等磁碟），
+背景寫入執行緒累積一批（最多 BATCH_MAX 筆或 FLUSH_INTERVAL 秒）後在單一交易內：
+  - executemany 寫入 predictions
+  - 以這批的增量 upsert counters（每批只有幾十列，不是每筆各一次）
+記憶體內保留一份 counters 的鏡像，/api/stats 與 /api/history 直接讀它，不掃描 predictions。
+revision 在每批寫入後遞增，app.py 用來判斷預先計算的 /api/stats 回應是否要重建。
+"""
+import json
+import time
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+from contextlib import closing
+from collections import defaultdict
+
+from metrics import metrics
+
+BASE_DIR       = Path(__file__).parent
+HISTORY_DB     = BASE_DIR / "data" / "history.sqlite3"
+QUEUE_MAX      = 20000
+BATCH_MAX      = 1000
+FLUSH_INTERVAL = 0.2     # 秒
+DIMS           = ("total", "class", "day", "version")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id            TEXT PRIMARY KEY,
+    created_at    REAL NOT NULL,
+    day           TEXT NOT NULL,
+    model_version TEXT,
+    kaggle_class  TEXT,
+    confidence    REAL,
+    stage         TEXT,
+    source        TEXT,
+    top3          TEXT,
+    image_hash    TEXT
+);
+CREATE INDEX IF NOT EXISTS predictions_created ON predictions (created_at);
+CREATE TABLE IF NOT EXISTS counters (
+    dim      TEXT NOT NULL,
+    key      TEXT NOT NULL,
+    count    INTEGER NOT NULL,
+    conf_sum REAL NOT NULL,
+    PRIMARY KEY (dim, key)
+) WITHOUT ROWID;
+"""
+
+
+def record_from_result(prediction_id: str, result: dict, source: str, image_hash: str | None = None) -> tuple:
+    """/api/predict 的回應 → predictions 的一列"""
+    now     = time.time()
+    primary = result.get("primary") or {}
+    top3    = [[t.get("kaggle_class"), round(t.get("confidence", 0.0), 4)] for t in result.get("top3", [])]
+    return (
+        prediction_id, now, time.strftime("%Y-%m-%d", time.localtime(now)),
+        result.get("model_version"), primary.get("kaggle_class"), primary.get("confidence"),
+        result.get("stage"), source, json.dumps(top3, ensure_ascii=False), image_hash,
+    )
+
+
+class HistoryStore:
+    def __init__(self, path: Path = HISTORY_DB):
+        self.path     = path
+        self.revision = 0
+        self.dropped  = 0
+        self._queue   = queue.Queue(maxsize=QUEUE_MAX)
+        self._lock    = threading.Lock()
+        self._flushed = threading.Condition()
+        self._pending = 0   # 已排入但尚未寫入的筆數
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")   # WAL 下只在 checkpoint 時 fsync
+        self._conn.executescript(SCHEMA)
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(predictions)")}
+        if "image_hash" not in columns:   # 舊版資料庫
+            self._conn.execute("ALTER TABLE predictions ADD COLUMN image_hash TEXT")
+        # counters 的記憶體鏡像：dim → key → [count, conf_sum]
+        self._counters = {d: defaultdict(lambda: [0, 0.0]) for d in DIMS}
+        for dim, key, count, conf_sum in self._conn.execute("SELECT dim, key, count, conf_sum FROM counters"):
+            self._counters[dim][key] = [count, conf_sum]
+
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    # ── 寫入（request 執行緒）────────────────────────────────────────────────
+    def add(self, record: tuple) -> bool:
+        """非阻塞：佇列滿時丟棄並回傳 False"""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            metrics.inc("history.dropped")
+            return False
+        with self._lock:
+            self._pending += 1
+        return True
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """等到目前排入的紀錄都寫入為止（測試 / benchmark / 關閉前使用）"""
+        end = time.time() + timeout
+        with self._flushed:
+            while self._pending:
+                remaining = end - time.time()
+                if remaining <= 0:
+                    return False
+                self._flushed.wait(remaining)
+        return True
+
+    # ── 背景寫入 ──────────────────────────────────────────────────────────────
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.time() + FLUSH_INTERVAL
+            while len(batch) < BATCH_MAX:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except sqlite3.Error as e:   # 寫入失敗只記錄，不影響服務
+                metrics.inc("history.write_errors")
+                print(f"⚠️  辨識紀錄寫入失敗：{e}")
+            with self._flushed:
+                with self._lock:
+                    self._pending -= len(batch)
+                self._flushed.notify_all()
+
+    def _write(self, batch: list[tuple]):
+        t0    = time.perf_counter()
+        delta = defaultdict(lambda: [0, 0.0])
+        for r in batch:
+            conf = r[5] or 0.0
+            for dim, key in (("total", ""), ("class", r[4] or ""), ("day", r[2]), ("version", r[3] or "")):
+                d = delta[(dim, key)]
+                d[0] += 1
+                d[1] += conf
+
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            conn.executemany("INSERT OR IGNORE INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            conn.executemany(
+                "INSERT INTO counters VALUES (?, ?, ?, ?) ON CONFLICT (dim, key) DO UPDATE SET "
+                "count = count + excluded.count, conf_sum = conf_sum + excluded.conf_sum",
+                [(dim, key, c, s) for (dim, key), (c, s) in delta.items()])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        with self._lock:   # 交易成功後才更新鏡像
+            for (dim, key), (c, s) in delta.items():
+                m = self._counters[dim][key]
+                m[0] += c
+                m[1] += s
+            self.revision += 1
+        metrics.inc("history.rows", len(batch))
+        metrics.inc("history.batches")
+        metrics.observe("history.write_ms", (time.perf_counter() - t0) * 1000)
+
+    # ── 查詢（讀記憶體鏡像）────────────────────────────────────────────────────
+    def _dim(self, dim: str) -> dict:
+        with self._lock:
+            return {k: (c, s) for k, (c, s) in self._counters[dim].items()}
+
+    def summary(self) -> dict:
+        total, conf_sum = self._dim("total").get("", (0, 0.0))
+        today = time.strftime("%Y-%m-%d")
+        return {
+            "total_identifications": total,
+            "identifications_today": self._dim("day").get(today, (0, 0.0))[0],
+            "avg_confidence":        round(conf_sum / total, 4) if total else None,
+        }
+
+    def aggregates(self, days: int = 30) -> dict:
+        def rows(dim, sort_key):
+            items = [{"key": k, "count": c, "avg_confidence": round(s / c, 4) if c else None}
+                     for k, (c, s) in self._dim(dim).items()]
+            return sorted(items, key=sort_key)
+
+        by_day = rows("day", lambda r: r["key"])[-days:]
+        return {
+            **self.summary(),
+            "by_class":   [{"kaggle_class": r["key"], **{k: r[k] for k in ("count", "avg_confidence")}}
+                           for r in rows("class", lambda r: -r["count"])],
+            "by_day":     [{"day": r["key"], "count": r["count"]} for r in by_day],
+            "by_version": [{"model_version": r["key"], **{k: r[k] for k in ("count", "avg_confidence")}}
+                           for r in rows("version", lambda r: -r["count"])],
+        }
+
+    def get(self, prediction_id: str) -> dict | None:
+        with closing(sqlite3.connect(self.path)) as conn:
+            row = conn.execute("SELECT model_version, kaggle_class, image_hash FROM predictions WHERE id = ?",
+                               (prediction_id,)).fetchone()
+        return dict(zip(("model_version", "kaggle_class", "image_hash"), row)) if row else None
+
+    def recent(self, limit: int = 20, before: float | None = None) -> list[dict]:
+        """最近的紀錄（created_at 索引，以 before 做 keyset 分頁）"""
+        with closing(sqlite3.connect(self.path)) as conn:   # 讀取另開連線，WAL 下不會被寫入擋住
+            rows = conn.execute(
+                "SELECT id, created_at, model_version, kaggle_class, confidence, stage, source, top3, image_hash "
+                "FROM predictions WHERE created_at < ? ORDER BY created_at DESC LIMIT ?",
+                (before if before is not None else time.time() + 1, limit)).fetchall()
+        return [{
+            "prediction_id": r[0],
+            "created_at":    r[1],
+            "model_version": r[2],
+            "kaggle_class":  r[3],
+            "confidence":    r[4],
+            "stage":         r[5],
+            "source":        r[6],
+            "top3":          json.loads(r[7]) if r[7] else [],
+            "image_hash":    r[8],
+        } for r in rows]
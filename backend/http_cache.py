@@ -0,0 +1,178 @@
+"""
+http_cache.py
+爬蟲共用的磁碟 HTTP 回應快取
+  - 以「完整 URL（含 params）」的 SHA-256 為 key
+  - 回應內容以 gzip 壓縮存放，另存 ETag / Last-Modified 等中繼資料
+  - 過期後以條件式請求（If-None-Match / If-Modified-Since）重新驗證，304 直接沿用快取
+  - 離線重播模式（PHYTOSCAN_HTTP_OFFLINE=1）：只讀快取，不連網
+
+使用方式：
+    from http_cache import cached_get
+    r = cached_get(url, params=..., headers=HEADERS, timeout=10)
+    r.status_code / r.text / r.json() / r.from_cache
+"""
+import os
+import gzip
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+
+import requests
+
+# ─── 設定 ──────────────────────────────────────────────────────────────────────
+BASE_DIR  = Path(__file__).parent
+CACHE_DIR = Path(os.environ.get("PHYTOSCAN_HTTP_CACHE", BASE_DIR / "scraped_data" / "http_cache"))
+MAX_AGE   = int(os.environ.get("PHYTOSCAN_HTTP_MAX_AGE", 24 * 3600))   # 秒；期限內不連網直接命中
+OFFLINE   = os.environ.get("PHYTOSCAN_HTTP_OFFLINE", "") not in ("", "0", "false")
+
+network_requests = 0   # 實際連網次數（呼叫端可據此決定是否需要節流 sleep）
+_count_lock      = threading.Lock()   # run_scraper 以執行緒池平行呼叫
+
+
+class OfflineCacheMiss(requests.ConnectionError):
+    """離線模式下快取沒有該 URL"""
+
+
+class CachedResponse:
+    """requests.Response 的精簡替身，爬蟲只用到這幾個屬性"""
+
+    def __init__(self, url: str, status_code: int, content: bytes,
+                 headers: dict, from_cache: bool):
+        self.url         = url
+        self.status_code = status_code
+        self.content     = content
+        self.headers     = headers
+        self.from_cache  = from_cache
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} for url: {self.url}")
+
+
+# ─── 工具 ──────────────────────────────────────────────────────────────────────
+def set_offline(flag: bool = True):
+    """切換離線重播模式（供 CLI / pipeline 使用）"""
+    global OFFLINE
+    OFFLINE = flag
+
+
+def full_url(url: str, params: dict | None = None) -> str:
+    """把 params 併入 URL，作為快取 key 的來源（與 requests 實際送出的 URL 相同）"""
+    if not params:
+        return url
+    return requests.Request("GET", url, params=params).prepare().url
+
+
+def cache_key(url: str, params: dict | None = None) -> str:
+    return hashlib.sha256(full_url(url, params).encode("utf-8")).hexdigest()
+
+
+def _paths(key: str) -> tuple[Path, Path]:
+    sub = CACHE_DIR / key[:2]
+    return sub / f"{key}.meta.json", sub / f"{key}.body.gz"
+
+
+def _atomic_write(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # 暫存檔名唯一：多個執行緒同時寫同一個 key 時不會互相覆蓋（最後 os.replace 者勝出）
+    fd, tmp = tempfile.mkstemp(prefix=path.name + ".", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def _load(key: str) -> tuple[dict, bytes] | None:
+    meta_path, body_path = _paths(key)
+    if not (meta_path.exists() and body_path.exists()):
+        return None
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        with gzip.open(body_path, "rb") as f:
+            body = f.read()
+    except (OSError, ValueError):
+        return None   # 損毀的快取視同不存在
+    return meta, body
+
+
+def _store(key: str, meta: dict, body: bytes | None = None):
+    meta_path, body_path = _paths(key)
+    if body is not None:
+        _atomic_write(body_path, gzip.compress(body, compresslevel=6, mtime=0))
+    _atomic_write(meta_path, json.dumps(meta, ensure_ascii=False, indent=1).encode("utf-8"))
+
+
+# ─── 主要介面 ──────────────────────────────────────────────────────────────────
+def cached_get(url: str, params: dict | None = None, headers: dict | None = None,
+               timeout: float = 10, max_age: int | None = None) -> CachedResponse:
+    """
+    帶快取的 GET：
+      1. 快取未過期 → 直接回傳（不連網）
+      2. 已過期但有 ETag / Last-Modified → 條件式請求，304 沿用快取
+      3. 離線模式 → 只讀快取，沒有則丟出 OfflineCacheMiss
+    只有 200 回應會寫入快取。
+    """
+    global network_requests
+    max_age = MAX_AGE if max_age is None else max_age
+    target  = full_url(url, params)
+    key     = cache_key(url, params)
+    cached  = _load(key)
+
+    if cached:
+        meta, body = cached
+        if OFFLINE or time.time() - meta.get("fetched_at", 0) < max_age:
+            return CachedResponse(target, meta["status"], body, meta.get("headers", {}), True)
+    elif OFFLINE:
+        raise OfflineCacheMiss(f"離線模式且無快取：{target}")
+
+    req_headers = dict(headers or {})
+    if cached:
+        meta = cached[0]
+        if meta.get("etag"):
+            req_headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            req_headers["If-Modified-Since"] = meta["last_modified"]
+
+    with _count_lock:
+        network_requests += 1
+    r = requests.get(url, params=params, headers=req_headers, timeout=timeout)
+
+    if r.status_code == 304 and cached:
+        meta, body = cached
+        meta["fetched_at"] = time.time()
+        _store(key, meta)
+        return CachedResponse(target, meta["status"], body, meta.get("headers", {}), True)
+
+    resp_headers = {k: v for k, v in r.headers.items()
+                    if k.lower() in ("content-type", "etag", "last-modified")}
+    if r.status_code == 200:
+        _store(key, {
+            "url":           target,
+            "status":        r.status_code,
+            "etag":          r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+            "headers":       resp_headers,
+            "fetched_at":    time.time(),
+        }, r.content)
+    return CachedResponse(target, r.status_code, r.content, resp_headers, False)
+
+
+def cache_stats() -> dict:
+    """回傳快取檔案數與壓縮後大小（bytes）"""
+    bodies = list(CACHE_DIR.glob("*/*.body.gz")) if CACHE_DIR.exists() else []
+    return {"entries": len(bodies), "bytes": sum(p.stat().st_size for p in bodies)}
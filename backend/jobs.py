@@ -0,0 +1,293 @@
+"""
+jobs.py
+非同步辨識工作
+
+POST /api/jobs 把圖片存進本地 SQLite 後立即回傳 job id；GET /api/jobs/<id> 查進度與已完成的部分結果。
+大量圖片、TTA 或切塊這類可能超過前端 30 秒逾時的請求改走這裡，不佔住 request 執行緒。
+
+  data/jobs.sqlite3（WAL）
+    jobs       (id, created_at, updated_at, options, total)
+    job_items  (job_id, idx, status, image, result, http_status, started_at, finished_at, attempts, not_before)
+
+每張圖片是一個 item，由固定數量的背景 worker 依送出順序取用，同一個工作的多張圖可平行處理。
+item 狀態 queued → running → done / error；圖片在完成後即清掉，只留結果。
+伺服器暫時忙碌（handler 回 429 / 503）不算完成：依 Retry-After 與指數退避延後重新排隊，
+MAX_ATTEMPTS 次都忙碌才標為 error。200 與其他 4xx 是真正的結果，標為 done。
+重啟時把 running 的 item 改回 queued，排隊中的工作不會遺失；過期工作在啟動時與之後每 PURGE_INTERVAL 秒清除。
+"""
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from pathlib import Path
+
+from metrics import metrics
+
+BASE_DIR           = Path(__file__).parent
+JOBS_DB            = BASE_DIR / "data" / "jobs.sqlite3"
+WORKERS            = 2
+MAX_PENDING        = 256          # 所有工作中尚未完成的圖片總數上限
+MAX_IMAGES_PER_JOB = 64
+JOB_TTL            = 24 * 3600    # 完成超過此秒數的工作會被清掉
+PURGE_INTERVAL     = 3600         # 執行中每隔多久清一次過期工作
+MAX_ATTEMPTS       = 6            # 429 / 503 最多嘗試幾次
+RETRY_BASE         = 1.0          # 秒；第 n 次重試至少等 RETRY_BASE × 2^(n−1)
+RETRY_MAX          = 60.0
+TRANSIENT_STATUS   = (429, 503)
+IDLE_WAIT          = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id         TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    options    TEXT NOT NULL,
+    total      INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id      TEXT NOT NULL,
+    idx         INTEGER NOT NULL,
+    status      TEXT NOT NULL,
+    image       BLOB,
+    result      TEXT,
+    http_status INTEGER,
+    started_at  REAL,
+    finished_at REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    not_before  REAL,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS job_items_status ON job_items (status);
+"""
+
+
+class JobQueueFull(Exception):
+    """待處理圖片已達 MAX_PENDING"""
+
+
+class JobStore:
+    def __init__(self, path: Path = JOBS_DB):
+        self.path   = path
+        self._local = threading.local()   # sqlite3 連線不能跨執行緒共用
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+            # 舊版資料庫補上重試欄位
+            cols = {r[1] for r in conn.execute("PRAGMA table_info(job_items)")}
+            if "attempts" not in cols:
+                conn.execute("ALTER TABLE job_items ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            if "not_before" not in cols:
+                conn.execute("ALTER TABLE job_items ADD COLUMN not_before REAL")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ── 寫入 ──────────────────────────────────────────────────────────────────
+    def submit(self, images: list[bytes], options: dict) -> str:
+        job_id = uuid.uuid4().hex
+        now    = time.time()
+        conn   = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM job_items WHERE status IN ('queued', 'running')").fetchone()[0]
+            if pending + len(images) > MAX_PENDING:
+                raise JobQueueFull(pending)
+            conn.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, ?)",
+                         (job_id, now, now, json.dumps(options), len(images)))
+            conn.executemany(
+                "INSERT INTO job_items (job_id, idx, status, image) VALUES (?, ?, 'queued', ?)",
+                [(job_id, i, img) for i, img in enumerate(images)])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return job_id
+
+    def claim(self) -> tuple[str, int, bytes, dict, int] | None:
+        """取出最早送出、已過退避時間的 queued item 並標為 running；沒有時回傳 None"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT i.rowid, i.job_id, i.idx, i.image, j.options, i.attempts FROM job_items i "
+                "JOIN jobs j ON j.id = i.job_id WHERE i.status = 'queued' "
+                "AND (i.not_before IS NULL OR i.not_before <= ?) ORDER BY i.rowid LIMIT 1", (time.time(),)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE job_items SET status = 'running', started_at = ? WHERE rowid = ?",
+                             (time.time(), row[0]))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return None if row is None else (row[1], row[2], row[3], json.loads(row[4]), row[5])
+
+    def finish(self, job_id: str, idx: int, result: dict, http_status: int, error: bool = False):
+        now  = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "UPDATE job_items SET status = ?, image = NULL, result = ?, http_status = ?, finished_at = ? "
+            "WHERE job_id = ? AND idx = ?",
+            ("error" if error else "done", json.dumps(result, ensure_ascii=False), http_status, now,
+             job_id, idx))
+        conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+        conn.execute("COMMIT")
+
+    def retry(self, job_id: str, idx: int, delay: float):
+        """暫時性失敗：保留圖片、嘗試次數 +1，delay 秒後才能再被取出"""
+        conn = self._conn()
+        conn.execute(
+            "UPDATE job_items SET status = 'queued', started_at = NULL, attempts = attempts + 1, "
+            "not_before = ? WHERE job_id = ? AND idx = ?", (time.time() + delay, job_id, idx))
+
+    def requeue_running(self) -> int:
+        """啟動時呼叫：上次行程中斷時做到一半的 item 重新排隊"""
+        cur = self._conn().execute(
+            "UPDATE job_items SET status = 'queued', started_at = NULL WHERE status = 'running'")
+        return cur.rowcount
+
+    def purge(self, ttl: float = JOB_TTL) -> int:
+        """刪掉所有 item 都已完成、且最後更新超過 ttl 秒的工作"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        ids = [r[0] for r in conn.execute(
+            "SELECT id FROM jobs WHERE updated_at < ? AND NOT EXISTS (SELECT 1 FROM job_items "
+            "WHERE job_id = jobs.id AND status IN ('queued', 'running'))", (time.time() - ttl,))]
+        conn.executemany("DELETE FROM job_items WHERE job_id = ?", [(i,) for i in ids])
+        conn.executemany("DELETE FROM jobs WHERE id = ?", [(i,) for i in ids])
+        conn.execute("COMMIT")
+        return len(ids)
+
+    # ── 查詢 ──────────────────────────────────────────────────────────────────
+    def get(self, job_id: str) -> dict | None:
+        conn = self._conn()
+        job  = conn.execute("SELECT created_at, updated_at, options, total FROM jobs WHERE id = ?",
+                            (job_id,)).fetchone()
+        if job is None:
+            return None
+        items = conn.execute(
+            "SELECT idx, status, result, http_status, rowid FROM job_items WHERE job_id = ? ORDER BY idx",
+            (job_id,)).fetchall()
+        counts = {s: sum(1 for it in items if it[1] == s) for s in ("queued", "running", "done", "error")}
+        finished = counts["done"] + counts["error"]
+        if finished == job[3]:
+            status = "done"
+        elif counts["running"] or finished:
+            status = "running"
+        else:
+            status = "queued"
+
+        queued_rowids = [it[4] for it in items if it[1] == "queued"]
+        ahead = conn.execute(
+            "SELECT COUNT(*) FROM job_items WHERE status IN ('queued', 'running') AND rowid < ? "
+            "AND job_id != ?", (min(queued_rowids), job_id)).fetchone()[0] if queued_rowids else 0
+        return {
+            "id":         job_id,
+            "status":     status,
+            "total":      job[3],
+            "completed":  counts["done"],
+            "errors":     counts["error"],
+            "running":    counts["running"],
+            "progress":   round(finished / job[3], 4) if job[3] else 1.0,
+            "queue_ahead": ahead,
+            "options":    json.loads(job[2]),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(job[0])),
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(job[1])),
+            # 部分結果：已完成的 item 先回傳
+            "results": [
+                {"index": it[0], "status": it[1], "http_status": it[3], "result": json.loads(it[2])}
+                for it in items if it[1] in ("done", "error")
+            ],
+        }
+
+
+def retry_delay(attempts: int, retry_after: str | None = None) -> float:
+    """第 attempts + 1 次重試前的等待秒數：Retry-After 與指數退避取大者"""
+    try:
+        hinted = float(retry_after) if retry_after else 0.0
+    except ValueError:
+        hinted = 0.0
+    return min(max(hinted, RETRY_BASE * 2 ** attempts), RETRY_MAX)
+
+
+class JobRunner:
+    """
+    固定數量的背景 worker：從 JobStore 取 item，交給 handler(image_bytes, options) → (結果 dict, HTTP 狀態碼, headers)。
+    handler 走與 /api/predict 相同的推論路徑（micro-batcher 會把多個 worker 的請求疊成同一批）。
+    """
+
+    def __init__(self, store: JobStore, handler, workers: int = WORKERS):
+        self.store    = store
+        self.handler  = handler
+        self.workers  = workers
+        self._wake    = threading.Event()
+        self._threads = []
+        self._purge_lock = threading.Lock()
+        self._next_purge = time.monotonic() + PURGE_INTERVAL
+
+    def start(self):
+        requeued = self.store.requeue_running()
+        purged   = self.store.purge()
+        if requeued or purged:
+            print(f"📋 工作佇列：{requeued} 張重新排隊、清除 {purged} 個過期工作")
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def submit(self, images: list[bytes], options: dict) -> str:
+        job_id = self.store.submit(images, options)
+        metrics.inc("jobs.submitted")
+        metrics.inc("jobs.images", len(images))
+        self._wake.set()
+        return job_id
+
+    def _maybe_purge(self):
+        """到期時由其中一個 worker 清除過期工作（其他 worker 不等待）"""
+        if time.monotonic() < self._next_purge or not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_purge = time.monotonic() + PURGE_INTERVAL
+            purged = self.store.purge()
+            if purged:
+                metrics.inc("jobs.purged", purged)
+        except Exception as e:
+            print(f"⚠️  清除過期工作失敗：{e}")
+        finally:
+            self._purge_lock.release()
+
+    def _run(self):
+        while True:
+            self._maybe_purge()
+            item = self.store.claim()
+            if item is None:
+                self._wake.wait(IDLE_WAIT)
+                self._wake.clear()
+                continue
+            job_id, idx, image, options, attempts = item
+            t0 = time.perf_counter()
+            try:
+                result, status, headers = self.handler(image, options)
+                error = False
+            except Exception as e:   # 單張失敗不影響同一工作的其他圖片
+                result, status, headers, error = {"error": f"處理失敗：{e}"}, 500, {}, True
+                metrics.inc("jobs.item_errors")
+            if status in TRANSIENT_STATUS:
+                if attempts + 1 < MAX_ATTEMPTS:   # 伺服器忙碌：稍後重試，不算完成
+                    self.store.retry(job_id, idx, retry_delay(attempts, headers.get("Retry-After")))
+                    metrics.inc("jobs.item_retries")
+                    continue
+                error = True
+                metrics.inc("jobs.item_errors")
+            self.store.finish(job_id, idx, result, status, error)
+            metrics.observe("jobs.item_ms", (time.perf_counter() - t0) * 1000)
@@ -0,0 +1,167 @@
+"""
+kb_compiled.py
+編譯版病害知識庫（scraped_data/diseases.kb）：可 mmap、唯讀、多 worker 共用
+
+檔案格式（little-endian）：
+  header  : magic "PSKB" | u16 format | u16 保留 | u32 筆數 | u64 index 位移 | 16 bytes 版本
+  records : 每筆病害一段 compact UTF-8 JSON，依序串接
+  index   : JSON {"offsets": [[off, len], ...], "by_id": {id: i}, "by_class": {kaggle_class: i}}
+
+worker 只 mmap 檔案並讀取小小的 index；記錄在第一次被查詢時才解碼
+（LRU 快取少量常用記錄），頁面由 OS page cache 在各 process 間共用。
+每筆記錄只存一份，原始 / 正規化 kaggle_class 兩個 key 都指向同一個 slot。
+
+KBWatcher 監看檔案（mtime / inode / size），變動時開啟新版並呼叫 callback，
+app.py 以單一參照替換完成原子切換；進行中的請求繼續使用舊物件直到結束。
+"""
+import os
+import mmap
+import json
+import time
+import hashlib
+import struct
+import threading
+from pathlib import Path
+from functools import lru_cache
+from collections.abc import Mapping
+
+MAGIC       = b"PSKB"
+FORMAT      = 2
+HEADER      = struct.Struct("<4sHHIQ16s")
+DECODE_LRU  = 256
+
+
+class DiseaseKB(Mapping):
+    """
+    以 kaggle_class 為 key 的唯讀 Mapping（與舊 _diseases_db dict 介面相容），
+    另提供 by_id() 與不重複的 records()。
+    """
+
+    def __init__(self, version: str, by_id: dict, by_class: dict, fetch, count: int,
+                 path: Path | None = None):
+        self.version   = version
+        self.path      = path
+        self.loaded_at = time.time()
+        self._by_id    = by_id
+        self._by_class = by_class
+        self._count    = count
+        self._fetch    = lru_cache(maxsize=DECODE_LRU)(fetch)
+
+    # ── 建立 ──────────────────────────────────────────────────────────────────
+    @classmethod
+    def from_records(cls, records: list[dict], version: str | None = None) -> "DiseaseKB":
+        """記憶體內版本（沒有編譯檔時的 fallback，資料來自 diseases.json / STATIC_DISEASES）"""
+        from kb_store import normalize_kaggle_class
+        if version is None:   # 與編譯檔相同的內容雜湊版本號
+            canonical = json.dumps(records, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+            version   = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+        by_id, by_class = {}, {}
+        for i, d in enumerate(records):
+            if d.get("id"):
+                by_id[d["id"]] = i
+            key = d.get("kaggle_class", "")
+            by_class.setdefault(key, i)
+            by_class.setdefault(normalize_kaggle_class(key), i)
+        return cls(version, by_id, by_class, records.__getitem__, len(records))
+
+    @classmethod
+    def open(cls, path: Path) -> "DiseaseKB":
+        """mmap 編譯檔；格式不符時丟出 ValueError"""
+        path = Path(path)
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, _, count, index_off, version = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or fmt != FORMAT:
+            mm.close()
+            raise ValueError(f"不是有效的編譯知識庫：{path}")
+        index   = json.loads(mm[index_off:])
+        offsets = index["offsets"]
+
+        def fetch(i: int) -> dict:
+            off, length = offsets[i]
+            return json.loads(mm[off:off + length])
+
+        kb = cls(version.rstrip(b"\0").decode("ascii"), index["by_id"], index["by_class"],
+                 fetch, count, path)
+        kb._mm = mm   # 物件被回收時 mmap 才關閉，確保切換後舊請求仍可讀取
+        return kb
+
+    # ── Mapping 介面 ──────────────────────────────────────────────────────────
+    def __getitem__(self, key: str) -> dict:
+        return self._fetch(self._by_class[key])
+
+    def __iter__(self):
+        return iter(self._by_class)
+
+    def __len__(self) -> int:
+        return len(self._by_class)
+
+    # ── 其他查詢 ──────────────────────────────────────────────────────────────
+    def by_id(self, disease_id: str) -> dict | None:
+        i = self._by_id.get(disease_id)
+        return None if i is None else self._fetch(i)
+
+    def records(self) -> list[dict]:
+        """每筆病害一次（依編譯順序）"""
+        return [self._fetch(i) for i in range(self._count)]
+
+
+def write_kb(diseases: list[dict], by_id: dict, by_class: dict, version: str, path: Path):
+    """寫出編譯檔（暫存檔 + os.replace，watcher 不會看到寫一半的檔案）"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    offsets, blobs = [], []
+    pos = HEADER.size
+    for d in diseases:
+        blob = json.dumps(d, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        offsets.append([pos, len(blob)])
+        blobs.append(blob)
+        pos += len(blob)
+    index = json.dumps({"offsets": offsets, "by_id": by_id, "by_class": by_class},
+                       ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT, 0, len(diseases), pos, version.encode("ascii")[:16]))
+        for blob in blobs:
+            f.write(blob)
+        f.write(index)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class KBWatcher(threading.Thread):
+    """輪詢編譯檔，內容變動時載入新版並呼叫 on_swap(new_kb)"""
+
+    def __init__(self, path: Path, on_swap, interval: float = 2.0):
+        super().__init__(name="kb-watcher", daemon=True)
+        self.path     = Path(path)
+        self.on_swap  = on_swap
+        self.interval = interval
+        self._sig     = self._signature()
+        self._stopped = threading.Event()
+
+    def _signature(self):
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            sig = self._signature()
+            if sig is None or sig == self._sig:
+                continue
+            try:
+                kb = DiseaseKB.open(self.path)
+            except (OSError, ValueError) as e:
+                print(f"⚠️  知識庫重新載入失敗：{e}")
+                continue
+            self._sig = sig
+            self.on_swap(kb)
+            print(f"🔄 知識庫已切換至版本 {kb.version}")
+
+    def stop(self):
+        self._stopped.set()
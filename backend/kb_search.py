@@ -0,0 +1,128 @@
+"""
+kb_search.py
+病害全文檢索：每個知識庫版本建一次倒排索引
+
+  - 索引欄位（權重）：name_zh / name_en（5）、pathogen（3）、host_plants（2）、symptoms（1）
+  - 斷詞：英數字以單字為單位（小寫）；中日韓文字取相鄰二字（bigram），
+          另收單字 unigram 供一個字的查詢使用
+  - 排序：Σ 欄位權重 × idf（NumPy 向量化累加 + argpartition 取前 k）；
+          篩選後所有查詢詞都命中者優先，沒有時退回任一詞命中
+  - 篩選：category（完全相符）、severity（severity_level 數字或 severity 文字）
+"""
+import re
+import math
+from collections import defaultdict
+
+import numpy as np
+
+FIELD_WEIGHTS = {
+    "name_zh":     5.0,
+    "name_en":     5.0,
+    "pathogen":    3.0,
+    "host_plants": 2.0,
+    "symptoms":    1.0,
+}
+MAX_LIMIT = 100
+
+_CJK_RANGES = "㐀-䶿一-鿿豈-﫿"
+_TOKEN_RE   = re.compile(f"[{_CJK_RANGES}]+|[a-z0-9]+")
+_CJK_RE     = re.compile(f"[{_CJK_RANGES}]")
+
+
+def tokenize(text: str, unigrams: bool = False) -> list[str]:
+    """英數字 → 單字；中文 → bigram（unigrams=True 時另外輸出單字）"""
+    tokens = []
+    for m in _TOKEN_RE.finditer(text.lower()):
+        run = m.group()
+        if not _CJK_RE.match(run):
+            tokens.append(run)
+            continue
+        if unigrams or len(run) == 1:
+            tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _field_text(value) -> str:
+    if isinstance(value, list):
+        return " ".join(str(v) for v in value)
+    return str(value or "")
+
+
+class SearchIndex:
+    """
+    倒排索引：token → (doc 陣列, 權重陣列)，權重已乘上 idf；
+    查詢時以 NumPy 向量化累加分數，不逐筆走訪 Python dict。
+    """
+
+    def __init__(self, records: list[dict]):
+        self.records = records
+        self.n       = len(records)
+        postings     = defaultdict(lambda: defaultdict(float))
+        by_category  = defaultdict(list)
+        by_severity  = defaultdict(list)
+
+        for doc, d in enumerate(records):
+            for field, weight in FIELD_WEIGHTS.items():
+                for tok in tokenize(_field_text(d.get(field)), unigrams=True):
+                    postings[tok][doc] += weight
+            if d.get("category"):
+                by_category[d["category"]].append(doc)
+            if d.get("severity_level") is not None:
+                by_severity[str(d["severity_level"])].append(doc)
+            if d.get("severity"):
+                by_severity[d["severity"]].append(doc)
+
+        n = max(self.n, 1)
+        self.postings = {}
+        for tok, docs in postings.items():
+            idf = math.log(1 + n / len(docs))
+            self.postings[tok] = (
+                np.fromiter(docs.keys(), dtype=np.int32, count=len(docs)),
+                np.fromiter((tf * idf for tf in docs.values()), dtype=np.float32, count=len(docs)),
+            )
+        self.by_category = {k: self._mask(v) for k, v in by_category.items()}
+        self.by_severity = {k: self._mask(v) for k, v in by_severity.items()}
+
+    def _mask(self, docs: list[int]) -> np.ndarray:
+        mask = np.zeros(self.n, dtype=bool)
+        mask[docs] = True
+        return mask
+
+    def search(self, query: str, category: str | None = None, severity: str | None = None,
+               limit: int = 20) -> tuple[list[tuple[int, float]], int]:
+        """回傳（前 limit 筆 [(doc, score)]，命中總數）"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens or not self.n:
+            return [], 0
+
+        scores = np.zeros(self.n, dtype=np.float32)
+        hits   = np.zeros(self.n, dtype=np.int16)
+        for tok in tokens:
+            posting = self.postings.get(tok)
+            if posting is not None:
+                docs, weights = posting
+                scores[docs] += weights
+                hits[docs]   += 1
+
+        # 先套篩選，再取全部詞都命中者；篩選後沒有時退回任一詞命中
+        allowed = np.ones(self.n, dtype=bool)
+        if category:
+            allowed &= self.by_category.get(category, False)
+        if severity:
+            allowed &= self.by_severity.get(severity, False)
+        mask = allowed & (hits == len(tokens))
+        if not mask.any():
+            mask = allowed & (hits > 0)
+
+        cand  = np.flatnonzero(mask)
+        total = len(cand)
+        if not total:
+            return [], 0
+        k = min(max(limit, 1), MAX_LIMIT, total)
+        s = scores[cand]
+        if total > k:
+            part = np.argpartition(-s, k - 1)[:k]
+            cand, s = cand[part], s[part]
+        order = np.lexsort((cand, -s))   # 分數高者在前，同分依 doc 順序
+        return [(int(cand[i]), float(s[i])) for i in order], total
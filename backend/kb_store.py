@@ -0,0 +1,216 @@
+"""
+kb_store.py
+病害知識庫（scraped_data/diseases.json）的讀寫工具
+  - 以 id 合併更新，保留檔案中其他病害；同一筆病害逐欄位合併，已在地化的圖片不會被重新爬取的遠端網址蓋掉
+  - 原子寫入（同目錄暫存檔 + fsync + os.replace），執行中的 app.py 不會讀到寫一半的 JSON
+  - 每筆記錄帶 source_hash / fetched_at，供增量重建判斷是否過期
+  - 驗證並編譯成 diseases.kb（可 mmap 的二進位檔，見 kb_compiled.py），由 build_kb.py 產生
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+from pathlib import Path
+
+BASE_DIR     = Path(__file__).parent
+DISEASE_JSON = BASE_DIR / "scraped_data" / "diseases.json"
+
+# 爬蟲邏輯有變動時調高，讓所有記錄重新爬取
+SCRAPER_VERSION = 2
+STALE_AFTER     = 30 * 24 * 3600   # 秒；超過即視為過期
+
+
+def source_fingerprint(source: dict) -> str:
+    """靜態來源資料（STATIC_DISEASES 的一筆）+ 爬蟲版本 → SHA-256"""
+    canonical = json.dumps(
+        {"v": SCRAPER_VERSION, "source": source},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_stale(record: dict | None, fingerprint: str, max_age: float = STALE_AFTER) -> bool:
+    """記錄不存在、來源已變更或超過 max_age 秒未更新 → 需要重新爬取"""
+    if not record:
+        return True
+    if record.get("source_hash") != fingerprint:
+        return True
+    return time.time() - record.get("fetched_at", 0) > max_age
+
+
+def load_diseases(path: Path = DISEASE_JSON) -> list[dict]:
+    """讀取病害清單；檔案不存在時回傳空清單（同時接受 list 或 {"diseases": [...]}）"""
+    path = Path(path)
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return data if isinstance(data, list) else data.get("diseases", [])
+
+
+def atomic_write_json(obj, path: Path, indent: int | None = 2):
+    """寫入同目錄暫存檔 → fsync → os.replace，讀取端永遠看到完整的舊檔或新檔"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=path.name + ".", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def save_diseases(diseases: list[dict], path: Path = DISEASE_JSON):
+    """原子寫入 {"diseases": [...], "total": n}"""
+    atomic_write_json({"diseases": diseases, "total": len(diseases)}, Path(path))
+
+
+def merge_images(old: list[dict], new: list[dict]) -> list[dict]:
+    """
+    以新的 images[] 為準，但已在地化的項目（scrape_disease_images.localize_images 改寫成
+    /static/ 路徑、帶 origin_url，之後還有 thumbnails.py 補上的縮圖）在來源網址相同時沿用，
+    新資料的其他欄位（說明文字等）覆蓋上去；合併後指向同一個網址的項目只留第一個
+    """
+    local = {}
+    for img in old:
+        if isinstance(img, dict) and img.get("url", "").startswith("/static/"):
+            for key in (img.get("origin_url"), img["url"]):
+                if key:
+                    local.setdefault(key, img)
+    seen, out = set(), []
+    for img in new:
+        if not isinstance(img, dict):
+            out.append(img)
+            continue
+        prev  = local.get(img.get("url"))
+        entry = img if prev is None else {**prev, **img, "url": prev["url"]}
+        if entry.get("url") in seen:
+            continue
+        seen.add(entry.get("url"))
+        out.append(entry)
+    return out
+
+
+def _is_empty(value) -> bool:
+    return value is None or (isinstance(value, (str, list, dict)) and not value)
+
+
+def merge_record(old: dict, new: dict) -> dict:
+    """
+    逐欄位合併：新記錄的欄位覆蓋舊的，新記錄沒有或為空（None、""、[]、{}）的欄位保留舊值
+    （重新爬取時某個來源暫時抓不到，不會清掉已整理好的資料）；images 見 merge_images
+    """
+    merged = {**old, **{k: v for k, v in new.items() if not _is_empty(v)}}
+    if isinstance(old.get("images"), list) and isinstance(new.get("images"), list) and new["images"]:
+        merged["images"] = merge_images(old["images"], new["images"])
+    return merged
+
+
+def merge_diseases(existing: list[dict], updates: list[dict]) -> list[dict]:
+    """以 id 合併：已存在者原位逐欄位更新（merge_record），新的附加在後，沒有 id 的記錄原樣保留"""
+    by_id  = {d["id"]: d for d in updates if d.get("id")}
+    merged = []
+    for d in existing:
+        did = d.get("id")
+        merged.append(merge_record(d, by_id.pop(did)) if did in by_id else d)
+    merged.extend(d for d in updates if d.get("id") in by_id)
+    return merged
+
+
+def update_diseases(updates: list[dict], path: Path = DISEASE_JSON) -> list[dict]:
+    """讀取目前檔案 → 合併 updates → 原子寫回，回傳合併後清單"""
+    merged = merge_diseases(load_diseases(path), updates)
+    save_diseases(merged, path)
+    return merged
+
+
+# ─── 編譯後知識庫（app.py 直接 mmap 載入）──────────────────────────────────────
+KB_COMPILED = BASE_DIR / "scraped_data" / "diseases.kb"
+
+REQUIRED_FIELDS = ("id", "name_zh", "name_en", "category", "kaggle_class")
+LIST_FIELDS     = ("host_plants", "symptoms", "causes", "prevention", "treatment", "images")
+
+
+def normalize_kaggle_class(cls: str) -> str:
+    """
+    將各種格式統一成 diseases.json 的三底線格式
+    例如：
+      Tomato_Early_blight   → Tomato___Early_blight
+      Tomato__Early_blight  → Tomato___Early_blight
+      Tomato___Early_blight → Tomato___Early_blight（不變）
+    """
+    # 先把所有連續底線壓成單底線
+    cls = re.sub(r'_+', '_', cls)
+    # 再把「植物名_病害名」的分隔改成三底線
+    # 規則：大寫開頭的第二個單字前改成 ___
+    # 例如 Tomato_Early → Tomato___Early
+    cls = re.sub(r'_([A-Z])', r'___\1', cls)
+    return cls
+
+
+def validate_diseases(diseases: list[dict]) -> list[str]:
+    """檢查知識庫內容，回傳問題清單（空清單表示通過）"""
+    problems = []
+    seen_ids = set()
+    for i, d in enumerate(diseases):
+        tag = d.get("id") or f"#{i}"
+        for field in REQUIRED_FIELDS:
+            if not d.get(field):
+                problems.append(f"{tag}: 缺少 {field}")
+        for field in LIST_FIELDS:
+            if field in d and not isinstance(d[field], list):
+                problems.append(f"{tag}: {field} 必須是 list")
+        if not isinstance(d.get("severity_level", 0), int):
+            problems.append(f"{tag}: severity_level 必須是整數")
+        for img in d.get("images", []) if isinstance(d.get("images"), list) else []:
+            if not isinstance(img, dict) or not img.get("url"):
+                problems.append(f"{tag}: images 項目缺少 url")
+        if d.get("id") in seen_ids:
+            problems.append(f"{tag}: id 重複")
+        seen_ids.add(d.get("id"))
+    return problems
+
+
+def compile_kb(diseases: list[dict], path: Path = KB_COMPILED) -> dict:
+    """
+    驗證後輸出編譯版知識庫：內容雜湊版本號 + 預先建好的 id / kaggle_class 索引，
+    app.py 以 mmap 開啟、不需要再逐筆解析與正規化。驗證失敗丟出 ValueError。
+    回傳摘要 {"version", "total"}。
+    """
+    from kb_compiled import write_kb
+
+    problems = validate_diseases(diseases)
+    if problems:
+        raise ValueError("知識庫驗證失敗：\n  " + "\n  ".join(problems))
+
+    canonical = json.dumps(diseases, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    version   = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+    by_id, by_class = {}, {}
+    for i, d in enumerate(diseases):
+        by_id[d["id"]] = i
+        key = d["kaggle_class"]
+        by_class.setdefault(key, i)
+        by_class.setdefault(normalize_kaggle_class(key), i)
+
+    write_kb(diseases, by_id, by_class, version, Path(path))
+    return {"version": version, "total": len(diseases)}
+
+
+def load_compiled_kb(path: Path = KB_COMPILED):
+    """mmap 開啟編譯版知識庫（DiseaseKB）；不存在或格式不符時回傳 None"""
+    from kb_compiled import DiseaseKB
+
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        return DiseaseKB.open(path)
+    except ValueError as e:
+        print(f"⚠️  {e}")
+        return None
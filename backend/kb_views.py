@@ -0,0 +1,129 @@
+"""
+kb_views.py
+/api/diseases 與 /api/stats 的預先計算回應
+
+每個知識庫版本只建一次：
+  - 病害摘要清單（列表頁需要的欄位）與統計數字
+  - 序列化後的 JSON bytes、預先 gzip 的 bytes、以內容雜湊產生的強 ETag
+分頁（page / per_page）與欄位投影（fields=）都從同一份摘要清單切出，
+各組合的回應第一次被要求時建立並快取（有上限）。
+全文檢索的倒排索引（kb_search.SearchIndex）也綁定在同一版本上，第一次搜尋時建立。
+"""
+import gzip
+import json
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+
+SUMMARY_FIELDS = (
+    "id", "name_zh", "name_en", "pathogen", "category",
+    "severity", "severity_level", "host_plants", "images",
+)
+STATS_CATEGORIES = ("真菌性病害", "細菌性病害", "卵菌性病害", "健康")
+MAX_PER_PAGE     = 100
+MAX_CACHED       = 256   # 分頁 / 投影組合的快取上限
+
+
+class PrecomputedResponse:
+    """一份序列化完成的 JSON 回應（原文 + gzip + ETag）"""
+
+    __slots__ = ("body", "gzipped", "etag")
+
+    def __init__(self, payload: dict):
+        self.body    = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.etag    = hashlib.sha256(self.body).hexdigest()[:32]
+
+
+def summarize(d: dict) -> dict:
+    return {
+        "id":             d.get("id"),
+        "name_zh":        d.get("name_zh"),
+        "name_en":        d.get("name_en"),
+        "pathogen":       d.get("pathogen"),
+        "category":       d.get("category"),
+        "severity":       d.get("severity"),
+        "severity_level": d.get("severity_level"),
+        "host_plants":    d.get("host_plants", []),
+        "images":         d.get("images", [])[:1],
+    }
+
+
+class KBViews:
+    """綁定單一 DiseaseKB 版本的預先計算回應"""
+
+    def __init__(self, kb, stats_extra: dict | None = None):
+        self.kb        = kb
+        self.version   = kb.version
+        records        = kb.records()
+        self.records   = records
+        self.summaries = [summarize(d) for d in records]
+
+        counts = Counter(d.get("category") for d in records)   # 單次掃描
+        self.stats_payload = {
+            "total_diseases": len(records),
+            **(stats_extra or {}),
+            "categories": {c: counts.get(c, 0) for c in STATS_CATEGORIES},
+        }
+
+        self._lock  = threading.Lock()
+        self._cache = OrderedDict()
+        self._stats = PrecomputedResponse(self.stats_payload)
+        self._full  = PrecomputedResponse({"diseases": self.summaries, "total": len(self.summaries)})
+        self._search_index = None
+
+    @property
+    def search_index(self):
+        """本版本的倒排索引（第一次使用時建立）"""
+        if self._search_index is None:
+            from kb_search import SearchIndex
+            index = SearchIndex(self.records)
+            with self._lock:
+                if self._search_index is None:
+                    self._search_index = index
+        return self._search_index
+
+    def stats(self) -> PrecomputedResponse:
+        return self._stats
+
+    def diseases(self, page: int | None = None, per_page: int | None = None,
+                 fields: tuple[str, ...] | None = None) -> PrecomputedResponse:
+        """
+        取得（可分頁、可投影的）病害列表回應。
+        fields 含未知欄位時丟出 ValueError；per_page 上限 MAX_PER_PAGE。
+        """
+        if fields:
+            unknown = [f for f in fields if f not in SUMMARY_FIELDS]
+            if unknown:
+                raise ValueError(f"未知欄位：{', '.join(unknown)}")
+            fields = tuple(f for f in SUMMARY_FIELDS if f in fields)   # 正規化順序
+        if page is not None or per_page is not None:
+            page     = max(page or 1, 1)
+            per_page = min(max(per_page or 20, 1), MAX_PER_PAGE)
+
+        if page is None and not fields:
+            return self._full
+
+        key = (page, per_page, fields or None)
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit:
+                self._cache.move_to_end(key)
+                return hit
+
+        items = self.summaries
+        if page is not None:
+            start = (page - 1) * per_page
+            items = items[start:start + per_page]
+        if fields:
+            items = [{f: s[f] for f in fields} for s in items]
+        payload = {"diseases": items, "total": len(self.summaries)}
+        if page is not None:
+            payload.update(page=page, per_page=per_page)
+        resp = PrecomputedResponse(payload)
+
+        with self._lock:
+            self._cache[key] = resp
+            if len(self._cache) > MAX_CACHED:
+                self._cache.popitem(last=False)
+        return resp
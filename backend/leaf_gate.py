@@ -0,0 +1,142 @@
+"""
+leaf_gate.py
+推論前的「這是植物葉片嗎？」快速篩選，完全不碰模型
+
+只用已縮到 224×224 的陣列再取樣成 56×56，計算幾個顏色統計：
+  plant_frac  : 植物色像素比例（ExG = 2g − r − b 偏綠，或黃褐色病斑 / 枯葉的色相範圍）
+  skin_frac   : 膚色像素比例（YCbCr 規則，自拍 / 手部特寫）
+  flat_frac   : 量化後最常見 4 種顏色佔的比例（截圖、純色背景、文件）
+  luma_std    : 亮度標準差（空白 / 全黑 / 過曝照片）
+  sat_mean    : 平均飽和度（黑白照片）
+規則只擋「明顯不是」的輸入；有 models/leaf_gate.json（train_leaf_gate.py 產生的
+logistic regression 權重）時，規則通過的圖片再由它判斷。
+"""
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR  = Path(__file__).parent
+GATE_JSON = BASE_DIR / "models" / "leaf_gate.json"
+
+FEATURES = ("plant_frac", "skin_frac", "flat_frac", "luma_std", "sat_mean")
+
+# 規則門檻（保守設定：寧可放行，也不誤擋葉片）
+MIN_LUMA_STD   = 0.025
+MIN_PLANT_FRAC = 0.06
+MAX_SKIN_FRAC  = 0.45
+MAX_FLAT_FRAC  = 0.80
+MIN_SAT_MEAN   = 0.03   # 低於此值視為黑白照片（病徵判斷需要顏色）
+
+REASONS = {
+    "blank":      "圖片幾乎是單一顏色（空白、全黑或過曝），請重新拍攝",
+    "grayscale":  "黑白圖片無法判斷病徵顏色，請上傳彩色照片",
+    "no_plant":   "圖片中找不到植物葉片，請對準葉片拍攝",
+    "skin":       "圖片主要是人像或皮膚，請改拍植物葉片",
+    "screenshot": "圖片看起來是截圖或文件，請上傳葉片照片",
+    "classifier": "這張圖片不像植物葉片，請對準葉片重新拍攝",
+}
+
+
+class GateResult:
+    __slots__ = ("ok", "reason", "features", "score")
+
+    def __init__(self, ok: bool, reason: str | None, features: dict, score: float | None = None):
+        self.ok       = ok
+        self.reason   = reason
+        self.features = features
+        self.score    = score
+
+    @property
+    def message(self) -> str | None:
+        return REASONS.get(self.reason)
+
+
+def _plant_masks(px: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """px：(..., 3) float 0–1 → (偏綠, 黃褐色) 兩個布林遮罩"""
+    r, g, b = px[..., 0], px[..., 1], px[..., 2]
+    mx, mn  = px.max(-1), px.min(-1)
+    sat     = np.where(mx > 0, (mx - mn) / np.maximum(mx, 1e-6), 0)
+    # 色相（度）：只需要判斷黃褐 ~ 綠的範圍
+    delta   = np.maximum(mx - mn, 1e-6)
+    hue     = np.where(mx == r, ((g - b) / delta) % 6,
+              np.where(mx == g, (b - r) / delta + 2, (r - g) / delta + 4)) * 60
+
+    green    = (2 * g - r - b) > 0.05
+    brownish = (hue >= 15) & (hue <= 75) & (sat > 0.2) & (mx > 0.15)   # 黃化、褐斑、枯葉
+    return green, brownish
+
+
+def plant_mask(arr: np.ndarray) -> np.ndarray:
+    """(H, W, 3) float 0–1 → (H, W) 植物色像素遮罩（tiling.py 用來跳過背景圖塊）"""
+    green, brownish = _plant_masks(arr)
+    return green | brownish
+
+
+def extract_features(arr: np.ndarray) -> dict:
+    """arr：(H, W, 3) float32 0–1（preprocess_image 的輸出，去掉 batch 維度）"""
+    step = max(arr.shape[0] // 56, 1)
+    px   = arr[::step, ::step].reshape(-1, 3)
+    r, g, b = px[:, 0], px[:, 1], px[:, 2]
+    mx, mn  = px.max(1), px.min(1)
+    sat     = np.where(mx > 0, (mx - mn) / np.maximum(mx, 1e-6), 0)
+    green, brownish = _plant_masks(px)
+
+    y  = 0.299 * r + 0.587 * g + 0.114 * b
+    cb = 0.5 + (b - y) * 0.564
+    cr = 0.5 + (r - y) * 0.713
+    skin = (cb > 77 / 255) & (cb < 127 / 255) & (cr > 133 / 255) & (cr < 173 / 255) & ~green
+
+    q = (px * 15).astype(np.int32)   # 每通道 16 階
+    _, counts = np.unique(q[:, 0] * 256 + q[:, 1] * 16 + q[:, 2], return_counts=True)
+    top = np.sort(counts)[-4:].sum()
+
+    return {
+        "plant_frac": float((green | brownish).mean()),
+        "skin_frac":  float(skin.mean()),
+        "flat_frac":  float(top / len(px)),
+        "luma_std":   float(y.std()),
+        "sat_mean":   float(sat.mean()),
+    }
+
+
+class LeafGate:
+    def __init__(self, classifier: dict | None = None):
+        self.classifier = classifier
+
+    @classmethod
+    def load(cls, path: Path = GATE_JSON) -> "LeafGate":
+        """有訓練好的權重就一起載入，沒有時只用規則"""
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                return cls(json.load(f))
+        return cls()
+
+    def score(self, features: dict) -> float | None:
+        """logistic regression：是葉片的機率"""
+        clf = self.classifier
+        if not clf:
+            return None
+        x = np.array([features[f] for f in clf["features"]], dtype=np.float64)
+        x = (x - np.array(clf["mean"])) / np.array(clf["std"])
+        z = float(x @ np.array(clf["weights"]) + clf["bias"])
+        return 1 / (1 + math.exp(-z))
+
+    def check(self, arr: np.ndarray) -> GateResult:
+        f = extract_features(arr)
+        if f["luma_std"] < MIN_LUMA_STD:
+            return GateResult(False, "blank", f)
+        if f["flat_frac"] > MAX_FLAT_FRAC and f["plant_frac"] < 0.3:
+            return GateResult(False, "screenshot", f)
+        if f["sat_mean"] < MIN_SAT_MEAN:
+            return GateResult(False, "grayscale", f)
+        if f["skin_frac"] > MAX_SKIN_FRAC and f["plant_frac"] < 0.2:
+            return GateResult(False, "skin", f)
+        if f["plant_frac"] < MIN_PLANT_FRAC:
+            return GateResult(False, "no_plant", f)
+
+        p = self.score(f)
+        if p is not None and p < self.classifier.get("threshold", 0.5):
+            return GateResult(False, "classifier", f, p)
+        return GateResult(True, None, f, p)
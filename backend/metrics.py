@@ -0,0 +1,68 @@
+"""
+metrics.py
+行程內的輕量指標（/api/metrics）
+
+  metrics.inc("predict.stage.student")           # 計數器
+  metrics.observe("predict.latency_ms", 12.3)    # 延遲樣本（每個名稱保留最近 WINDOW 筆）
+
+snapshot() 回傳計數器與各延遲的 count / mean / p50 / p99。
+只記在記憶體，重啟歸零；多 worker 部署時每個 worker 各自一份。
+"""
+import time
+import threading
+from collections import deque, defaultdict
+
+import numpy as np
+
+WINDOW = 2048
+
+
+class Metrics:
+    def __init__(self, window: int = WINDOW):
+        self.started_at = time.time()
+        self._lock      = threading.Lock()
+        self._counters  = defaultdict(int)
+        self._totals    = defaultdict(int)      # 每個延遲名稱的累計樣本數（不受 window 限制）
+        self._samples   = defaultdict(lambda: deque(maxlen=window))
+
+    def inc(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] += n
+
+    def observe(self, name: str, value_ms: float):
+        with self._lock:
+            self._samples[name].append(value_ms)
+            self._totals[name] += 1
+
+    def counter(self, name: str) -> int:
+        return self._counters.get(name, 0)
+
+    def mean(self, name: str) -> float | None:
+        """最近 window 筆樣本的平均；沒有樣本時為 None"""
+        with self._lock:
+            samples = self._samples.get(name)
+            return sum(samples) / len(samples) if samples else None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            samples  = {k: np.fromiter(v, dtype=np.float64) for k, v in self._samples.items()}
+            totals   = dict(self._totals)
+        latency = {}
+        for name, arr in sorted(samples.items()):
+            if not len(arr):
+                continue
+            latency[name] = {
+                "count":  totals[name],
+                "mean":   round(float(arr.mean()), 3),
+                "p50":    round(float(np.percentile(arr, 50)), 3),
+                "p99":    round(float(np.percentile(arr, 99)), 3),
+            }
+        return {
+            "uptime_sec": round(time.time() - self.started_at, 1),
+            "counters":   dict(sorted(counters.items())),
+            "latency_ms": latency,
+        }
+
+
+metrics = Metrics()
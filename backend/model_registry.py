@@ -0,0 +1,245 @@
+"""
+model_registry.py
+版本化模型目錄與不停機切換
+
+目錄結構：
+  models/registry/<version>/model.keras
+                            class_names.json   {"classes": [...], "num_classes": N}
+                            metadata.json      {"version", "input_size", "val_accuracy", "dataset", ...}
+  models/registry/CURRENT                       目前上線版本（單行文字，原子寫入）
+
+registry 為空時退回舊路徑（models/plant_disease_model.keras / best_model.keras
++ data/class_names.json），版本號為檔案指紋，行為與之前相同。
+
+ModelManager 在背景執行緒載入新版本、以 dummy batch 預熱（觸發 tf.function trace），
+完成後以單一參照替換 current；進行中的請求已持有舊的 ModelHandle，會用舊版跑完。
+"""
+import os
+import json
+import time
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from kb_store import atomic_write_json
+from model_serving import ServedModel, default_model_path, file_fingerprint
+
+BASE_DIR     = Path(__file__).parent
+REGISTRY_DIR = BASE_DIR / "models" / "registry"
+CURRENT_FILE = REGISTRY_DIR / "CURRENT"
+LEGACY_CLASS = BASE_DIR / "data" / "class_names.json"
+WARMUP_BATCH = (1, 8)   # 預熱的 batch 大小
+HISTORY_LEN  = 20
+
+
+# ─── Registry ─────────────────────────────────────────────────────────────────
+def list_versions() -> list[str]:
+    if not REGISTRY_DIR.exists():
+        return []
+    return sorted(p.name for p in REGISTRY_DIR.iterdir() if (p / "model.keras").exists())
+
+
+def current_version() -> str | None:
+    try:
+        version = CURRENT_FILE.read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return version if (REGISTRY_DIR / version / "model.keras").exists() else None
+
+
+def set_current(version: str):
+    if not (REGISTRY_DIR / version / "model.keras").exists():
+        raise ValueError(f"registry 中沒有版本 {version}")
+    tmp = CURRENT_FILE.with_name(f"CURRENT.{os.getpid()}.tmp")
+    tmp.write_text(version + "\n", encoding="utf-8")
+    os.replace(tmp, CURRENT_FILE)
+
+
+def read_metadata(version: str) -> dict:
+    path = REGISTRY_DIR / version / "metadata.json"
+    if not path.exists():
+        return {"version": version}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def publish(model_path: Path, class_names: list[str], metadata: dict | None = None,
+            version: str | None = None, activate: bool = True) -> str:
+    """把訓練好的模型複製進 registry（暫存目錄 + rename，不會出現半套版本）"""
+    version = version or time.strftime("v%Y%m%d-%H%M%S")
+    target  = REGISTRY_DIR / version
+    if target.exists():
+        raise ValueError(f"版本 {version} 已存在")
+    tmp_dir = REGISTRY_DIR / f".{version}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    shutil.copy2(model_path, tmp_dir / "model.keras")
+    atomic_write_json({"classes": class_names, "num_classes": len(class_names)},
+                      tmp_dir / "class_names.json")
+    atomic_write_json({
+        "version":      version,
+        "input_size":   [224, 224],
+        "num_classes":  len(class_names),
+        "published_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        **(metadata or {}),
+    }, tmp_dir / "metadata.json")
+    os.replace(tmp_dir, target)
+    if activate:
+        set_current(version)
+    print(f"📦 模型已發佈：{version}{'（已設為 CURRENT）' if activate else ''}")
+    return version
+
+
+# ─── 載入 ──────────────────────────────────────────────────────────────────────
+class ModelHandle:
+    """一個可服務的模型版本（模型 + 類別 + metadata），切換時整組替換"""
+
+    def __init__(self, model: ServedModel, class_names: list[str], metadata: dict):
+        self.model       = model
+        self.class_names = class_names
+        self.metadata    = metadata
+        self.loaded_at   = time.time()
+
+    @property
+    def version(self) -> str:
+        return self.model.version
+
+
+def load_handle(version: str | None = None) -> ModelHandle | None:
+    """載入指定版本；未指定時用 CURRENT，registry 為空時退回舊路徑；都沒有回傳 None"""
+    version = version or current_version()
+    if version:
+        vdir = REGISTRY_DIR / version
+        with open(vdir / "class_names.json", encoding="utf-8") as f:
+            class_names = json.load(f)["classes"]
+        model = ServedModel.load(vdir / "model.keras", version=version)
+        return ModelHandle(model, class_names, read_metadata(version))
+
+    path = default_model_path()
+    if path is None:
+        return None
+    class_names = []
+    if LEGACY_CLASS.exists():
+        with open(LEGACY_CLASS, encoding="utf-8") as f:
+            class_names = json.load(f)["classes"]
+    model = ServedModel.load(path)
+    return ModelHandle(model, class_names, {"version": model.version, "source": path.name})
+
+
+def current_model_path() -> Path | None:
+    """CURRENT 版本的模型檔（registry 為空時為舊路徑），供訓練 / 校正腳本使用"""
+    version = current_version()
+    return REGISTRY_DIR / version / "model.keras" if version else default_model_path()
+
+
+def warmup(model: ServedModel):
+    """先跑幾個 dummy batch，第一個真實請求不必等 tf.function trace"""
+    for n in WARMUP_BATCH:
+        model.infer(np.zeros((n, *model.input_hw, 3), dtype=np.float32))
+
+
+class ModelManager:
+    """
+    持有目前服務中的 ModelHandle；swap() 在背景載入 + 預熱後原子替換。
+    watch_interval 不為 None 時另起執行緒輪詢 CURRENT，train_model.py 發佈新版後自動切換。
+    """
+
+    def __init__(self, on_swap=None, watch_interval: float | None = 5.0):
+        self.current  = None
+        self.initialized = False   # load_initial() 是否已執行（沒有任何模型時 current 仍為 None）
+        self.on_swap  = on_swap
+        self.status   = {"state": "idle", "target": None, "error": None}
+        self.history  = []
+        self._lock    = threading.Lock()
+        self._loading = None
+        self._watch_interval = watch_interval
+        self._watcher = None
+        self._failed  = None   # 切換失敗的版本，CURRENT 沒變前不再重試
+
+    def load_initial(self) -> ModelHandle | None:
+        """首次載入（同步，由第一個需要模型的請求觸發）"""
+        with self._lock:
+            if self.current is None:
+                t0 = time.time()
+                handle = load_handle()
+                if handle is not None:
+                    warmup(handle.model)
+                    self._record(None, handle.version, "loaded", time.time() - t0)
+                self.current = handle
+                self.initialized = True
+                self._start_watcher()
+        return self.current
+
+    def swap(self, version: str | None = None) -> bool:
+        """背景載入 version（None = CURRENT）；已有切換進行中時回傳 False"""
+        with self._lock:
+            if self._loading is not None:
+                return False
+            self.status   = {"state": "loading", "target": version or current_version(), "error": None,
+                             "started_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            self._loading = threading.Thread(target=self._swap, args=(version,),
+                                             name="model-swap", daemon=True)
+            self._loading.start()
+        return True
+
+    def _swap(self, version: str | None):
+        t0  = time.time()
+        old = self.current
+        try:
+            handle = load_handle(version)
+            if handle is None:
+                raise FileNotFoundError("找不到可載入的模型")
+            warmup(handle.model)
+        except Exception as e:   # 載入失敗時維持舊版繼續服務
+            with self._lock:
+                self.status   = {**self.status, "state": "failed", "error": str(e)}
+                self._loading = None
+            self._failed = version
+            self._record(old and old.version, version, "failed", time.time() - t0, str(e))
+            print(f"⚠️  模型切換失敗：{e}")
+            return
+
+        self.current = handle   # 單一參照替換即為原子切換
+        with self._lock:
+            self.status   = {**self.status, "state": "idle", "target": handle.version,
+                             "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            self._loading = None
+        self._record(old and old.version, handle.version, "swapped", time.time() - t0)
+        print(f"🔄 模型已切換：{old and old.version} → {handle.version}（{time.time() - t0:.1f}s）")
+        if self.on_swap:
+            self.on_swap(handle)
+
+    def _record(self, old: str | None, new: str | None, result: str, seconds: float,
+                error: str | None = None):
+        entry = {"from": old, "to": new, "result": result, "seconds": round(seconds, 2),
+                 "at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        if error:
+            entry["error"] = error
+        self.history = (self.history + [entry])[-HISTORY_LEN:]
+
+    # ── CURRENT 監看 ──────────────────────────────────────────────────────────
+    def _start_watcher(self):
+        if self._watch_interval and self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self._watch_interval)
+            version = current_version()
+            cur     = self.current
+            if version and version != self._failed and (cur is None or cur.version != version) \
+                    and self._loading is None:
+                print(f"🔔 偵測到 CURRENT → {version}")
+                self.swap(version)
+
+
+def expected_version() -> str | None:
+    """不載入模型即可得知的上線版本：CURRENT，或舊路徑模型的檔案指紋（與 ServedModel.version 一致）"""
+    version = current_version()
+    if version:
+        return version
+    path = default_model_path()
+    return file_fingerprint(path) if path else None
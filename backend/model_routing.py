@@ -0,0 +1,280 @@
+"""
+model_routing.py
+主模型與第二模型（shadow / A/B）共用的批次推論路徑
+
+MicroBatcher：每個模型版本一條有上限的佇列 + 一個 worker 執行緒，
+  在 max_wait_ms 內把同時到達的請求疊成一個 batch，一次 forward 後再拆回各請求。
+  主模型佇列滿時等待（有逾時）；shadow 佇列滿時直接丟棄，不會拖慢主模型回應。
+
+Router：
+  - primary：目前上線版本（ModelManager.current）
+  - secondary：registry 中的另一個版本，兩種模式
+      ab     : fraction 比例的請求改由 secondary 回答（回應標明版本）
+      shadow : 每個請求複製一份給 secondary，在回應送出後於背景比對，
+               記錄 top-1 一致率與各模型延遲（/api/metrics、/api/admin/secondary）；
+               主模型的單一視角可能由 cascade 的 student 回答，一致率依回答階段分開統計，
+               agreement_rate 只算主模型（full）回答的請求
+  兩者都使用請求已解碼、已前處理好的同一個陣列，不重複前處理。
+"""
+import time
+import queue
+import random
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import metrics
+from model_registry import ModelHandle, load_handle, warmup
+
+MAX_BATCH       = 16
+MAX_WAIT_MS     = 4.0
+PRIMARY_QUEUE   = 64
+SHADOW_QUEUE    = 32
+PRIMARY_TIMEOUT = 30.0
+RECENT_DIFFS    = 50     # 保留最近幾筆 shadow 不一致的樣本
+
+
+class QueueFull(Exception):
+    """佇列已滿（主模型排隊 / 等待結果逾時，或 shadow 丟棄）"""
+
+
+class MicroBatcher:
+    def __init__(self, handle: ModelHandle, max_queue: int, max_batch: int = MAX_BATCH,
+                 max_wait_ms: float = MAX_WAIT_MS):
+        self.handle      = handle
+        self.max_batch   = max_batch
+        self.max_wait    = max_wait_ms / 1000
+        self._queue      = queue.Queue(maxsize=max_queue)
+        self._stopped    = threading.Event()
+        self._closed     = False      # worker 已結束，之後放進佇列的請求不會有人處理
+        self._thread     = threading.Thread(target=self._run, name=f"batcher-{handle.version}",
+                                            daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, batch: np.ndarray, block: bool = True,
+               timeout: float | None = PRIMARY_TIMEOUT) -> Future:
+        """
+        batch：(n, H, W, 3)；回傳 Future → (機率 (n, C), embedding (n, D))。
+        已 stop 的批次器（模型切換中拿到舊 handle）直接丟出 QueueFull，不會等到結果逾時
+        """
+        if self._stopped.is_set():
+            raise QueueFull(self.handle.version)
+        fut = Future()
+        try:
+            self._queue.put((batch, fut, time.perf_counter()), block=block, timeout=timeout)
+        except queue.Full:
+            raise QueueFull(self.handle.version) from None
+        if self._closed:   # 與 stop 同時發生、worker 已先結束：自己把佇列清掉
+            self._fail_pending()
+        return fut
+
+    def stop(self):
+        """停止接收後仍會處理完佇列中剩下的請求"""
+        self._stopped.set()
+
+    def _fail_pending(self):
+        while True:
+            try:
+                _, fut, _ = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            fut.set_exception(QueueFull(self.handle.version))
+
+    def _run(self):
+        version = self.handle.version
+        while True:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stopped.is_set():
+                    # 先標記再清：之後才放進來的請求由 submit 自己清掉
+                    self._closed = True
+                    self._fail_pending()
+                    return
+                continue
+            items, rows = [first], len(first[0])
+            deadline = time.perf_counter() + self.max_wait
+            while rows < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                items.append(item)
+                rows += len(item[0])
+
+            try:
+                probs, emb = self.handle.model.infer(np.concatenate([it[0] for it in items]))
+            except Exception as e:
+                for _, fut, _ in items:
+                    fut.set_exception(e)
+                continue
+            done = time.perf_counter()
+            metrics.inc(f"model.{version}.batches")
+            metrics.inc(f"model.{version}.rows", rows)
+            start = 0
+            for batch, fut, enqueued in items:
+                n = len(batch)
+                metrics.observe(f"model.{version}.latency_ms", (done - enqueued) * 1000)
+                fut.set_result((probs[start:start + n], emb[start:start + n]))
+                start += n
+
+
+class Router:
+    def __init__(self):
+        self.secondary = None        # ModelHandle
+        self.mode      = None        # "ab" / "shadow"
+        self.fraction  = 0.0
+        self.status    = {"state": "idle", "error": None}
+        self.recent_disagreements = []
+        self._batchers = {}          # version → MicroBatcher
+        self._lock     = threading.Lock()
+
+    # ── 批次器 ────────────────────────────────────────────────────────────────
+    def batcher(self, handle: ModelHandle, shadow: bool = False) -> MicroBatcher:
+        with self._lock:
+            b = self._batchers.get(handle.version)
+            if b is None or b.handle is not handle:
+                if b is not None:
+                    b.stop()
+                b = MicroBatcher(handle, SHADOW_QUEUE if shadow else PRIMARY_QUEUE)
+                self._batchers[handle.version] = b
+            return b
+
+    def prune(self, keep: set[str]):
+        """停掉已不再服務的版本的批次器（模型切換後）"""
+        with self._lock:
+            for version in [v for v in self._batchers if v not in keep]:
+                self._batchers.pop(version).stop()
+
+    def infer(self, handle: ModelHandle, batch: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """經由批次器推論（等待結果）；排隊或等待結果逾時都丟出 QueueFull"""
+        fut = self.batcher(handle).submit(batch)
+        try:
+            return fut.result(timeout=PRIMARY_TIMEOUT)
+        except TimeoutError:
+            # 不 cancel：worker 可能已取出這筆，之後仍會 set_result
+            metrics.inc(f"model.{handle.version}.timeouts")
+            raise QueueFull(handle.version) from None
+
+    # ── secondary 設定 ────────────────────────────────────────────────────────
+    def set_secondary(self, version: str, mode: str, fraction: float = 0.0):
+        """背景載入 + 預熱 secondary 版本，完成後才開始分流"""
+        if mode not in ("ab", "shadow"):
+            raise ValueError("mode 必須是 ab 或 shadow")
+        self.status = {"state": "loading", "target": version, "mode": mode, "error": None}
+
+        def load():
+            try:
+                handle = load_handle(version)
+                if handle is None:
+                    raise FileNotFoundError(f"找不到版本 {version}")
+                warmup(handle.model)
+            except Exception as e:
+                self.status = {**self.status, "state": "failed", "error": str(e)}
+                print(f"⚠️  secondary 載入失敗：{e}")
+                return
+            self.clear_secondary()
+            self.mode, self.fraction = mode, min(max(fraction, 0.0), 1.0)
+            self.secondary = handle
+            self.status = {**self.status, "state": "active"}
+            print(f"🔀 secondary 啟用：{version}（{mode}{f' {self.fraction:.0%}' if mode == 'ab' else ''}）")
+
+        threading.Thread(target=load, name="secondary-load", daemon=True).start()
+
+    def clear_secondary(self):
+        old, self.secondary = self.secondary, None
+        self.mode, self.fraction = None, 0.0
+        self.status = {"state": "idle", "error": None}
+        self.recent_disagreements = []
+        if old is not None:
+            self.prune(keep={v for v in self._batchers if v != old.version})
+
+    # ── 分流 ──────────────────────────────────────────────────────────────────
+    def choose(self, primary: ModelHandle) -> ModelHandle:
+        """A/B 模式下依比例改由 secondary 回答"""
+        sec = self.secondary
+        if sec is not None and self.mode == "ab" and sec.version != primary.version \
+                and random.random() < self.fraction:
+            metrics.inc(f"ab.{sec.version}.requests")
+            return sec
+        metrics.inc(f"ab.{primary.version}.requests")
+        return primary
+
+    def shadow(self, primary: ModelHandle, batch: np.ndarray, primary_top1: str, stage: str = "full"):
+        """複製請求給 shadow 模型；佇列滿時丟棄，比對在批次器執行緒完成。stage：primary_top1 由哪個階段回答"""
+        sec = self.secondary
+        if sec is None or self.mode != "shadow" or sec.version == primary.version:
+            return
+        try:
+            fut = self.batcher(sec, shadow=True).submit(batch, block=False)
+        except QueueFull:
+            metrics.inc("shadow.dropped")
+            return
+        metrics.inc("shadow.submitted")
+
+        def compare(f: Future):
+            if f.exception() is not None:
+                metrics.inc("shadow.errors")
+                return
+            probs, _ = f.result()
+            i     = int(np.argsort(probs[0])[-1])   # 與 /api/predict 的排序規則一致（同分時結果相同）
+            top1  = sec.class_names[i] if i < len(sec.class_names) else str(i)
+            agree = top1 == primary_top1
+            metrics.inc("shadow.compared")
+            metrics.inc("shadow.agree" if agree else "shadow.disagree")
+            metrics.inc(f"shadow.{stage}.compared")
+            metrics.inc(f"shadow.{stage}.agree" if agree else f"shadow.{stage}.disagree")
+            if not agree:
+                self.recent_disagreements = (self.recent_disagreements + [{
+                    "primary":    primary_top1,
+                    "stage":      stage,
+                    "shadow":     top1,
+                    "confidence": round(float(probs[0, i]), 4),
+                    "at":         time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }])[-RECENT_DIFFS:]
+
+        fut.add_done_callback(compare)
+
+    def report(self, primary: ModelHandle | None) -> dict:
+        compared = metrics.counter("shadow.full.compared")
+        by_stage = {
+            st: {
+                "compared":       n,
+                "agreement_rate": round(metrics.counter(f"shadow.{st}.agree") / n, 4),
+            }
+            for st in ("full", "student") if (n := metrics.counter(f"shadow.{st}.compared"))
+        }
+        versions = [h.version for h in (primary, self.secondary) if h is not None]
+        latency  = metrics.snapshot()["latency_ms"]
+        return {
+            "secondary": self.secondary.version if self.secondary else None,
+            "mode":      self.mode,
+            "fraction":  self.fraction,
+            "status":    self.status,
+            "shadow": {
+                "submitted":      metrics.counter("shadow.submitted"),
+                "dropped":        metrics.counter("shadow.dropped"),
+                "compared":       metrics.counter("shadow.compared"),
+                # 與主模型（full）的一致率；student 回答的請求另列於 by_stage
+                "agreement_rate": round(metrics.counter("shadow.full.agree") / compared, 4) if compared else None,
+                "by_stage":       by_stage,
+                "recent_disagreements": self.recent_disagreements[-10:],
+            },
+            "models": {
+                v: {
+                    "requests":   metrics.counter(f"ab.{v}.requests"),
+                    "latency_ms": latency.get(f"model.{v}.latency_ms"),
+                    "mean_batch": round(metrics.counter(f"model.{v}.rows")
+                                        / max(metrics.counter(f"model.{v}.batches"), 1), 2),
+                    "queue":      self._batchers[v].depth if v in self._batchers else 0,
+                } for v in versions
+            },
+        }
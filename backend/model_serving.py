@@ -0,0 +1,172 @@
+"""
+model_serving.py
+推論用的模型包裝
+
+ServedModel 把訓練好的 Keras 模型改接成雙輸出：
+  - softmax 機率（原本的輸出）
+  - 分類層前的 embedding（Dense-256，推論時 Dropout 不作用）
+一次 forward pass 同時取得兩者，/api/predict 與 /api/similar 共用。
+forward 以 tf.function 包裝並固定輸入 signature（batch 維度為 None），
+不同 batch 大小不會重新 trace，也避開 model.predict 每次呼叫的額外開銷。
+
+Cascade 先跑小模型（student，train_student.py），top-1 機率或 top-1/top-2 差距
+低於門檻（calibrate_cascade.py 在 data/val 上選出，存於 models/cascade.json）
+的樣本才交給主模型。
+"""
+import io
+import json
+import hashlib
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+BASE_DIR    = Path(__file__).parent
+MODEL_PATHS = (
+    BASE_DIR / "models" / "plant_disease_model.keras",
+    BASE_DIR / "models" / "best_model.keras",
+)
+STUDENT_PATH = BASE_DIR / "models" / "student_model.keras"
+CASCADE_JSON = BASE_DIR / "models" / "cascade.json"
+
+
+def default_model_path() -> Path | None:
+    """依序找第一個存在的模型檔；都沒有時回傳 None（DEMO 模式）"""
+    return next((p for p in MODEL_PATHS if p.exists()), None)
+
+
+def image_to_uint8(img: Image.Image, size: tuple[int, int]) -> np.ndarray:
+    """PIL 圖片 → (H, W, 3) uint8（decode_pool.py 的子行程直接寫進共享記憶體）"""
+    return np.asarray(img.convert("RGB").resize(size))
+
+
+def image_to_array(img: Image.Image, size: tuple[int, int]) -> np.ndarray:
+    """PIL 圖片 → (H, W, 3) float32 0–1（與訓練時的前處理一致）"""
+    return image_to_uint8(img, size).astype(np.float32) / 255.0
+
+
+def parse_shape(header: str) -> tuple[int, ...]:
+    """「224,224,3」或「224x224x3」→ (224, 224, 3)"""
+    try:
+        shape = tuple(int(v) for v in header.lower().replace("x", ",").split(","))
+    except ValueError:
+        raise ValueError(f"無法解析圖片形狀：{header!r}") from None
+    if len(shape) != 3:
+        raise ValueError(f"圖片形狀應為 高,寬,通道：{header!r}")
+    return shape
+
+
+def compact_to_uint8(data: bytes, shape: tuple[int, ...], size: tuple[int, int]) -> tuple[np.ndarray, str]:
+    """
+    用戶端已縮成模型輸入尺寸的圖片 → ((H, W, 3) uint8, "raw" | 格式名稱)，不再縮放。
+      raw     剛好 H×W×3 位元組的 RGB uint8（row-major，與 canvas getImageData 去掉 alpha 相同）
+      其他    JPEG / WebP / PNG，解碼後尺寸必須剛好是 W×H（只讀檔頭就檢查，不符合不解碼）
+    宣告的形狀與 size 不符、位元組數或實際尺寸不符時丟出 ValueError
+    """
+    h, w = size[1], size[0]
+    if shape != (h, w, 3):
+        raise ValueError(f"圖片形狀需為 {h},{w},3（收到 {','.join(map(str, shape))}）")
+    if len(data) == h * w * 3:
+        return np.frombuffer(data, dtype=np.uint8).reshape(h, w, 3), "raw"
+    img = Image.open(io.BytesIO(data))
+    if img.size != (w, h):
+        raise ValueError(f"圖片尺寸需為 {w}×{h}（收到 {img.size[0]}×{img.size[1]}）")
+    return np.asarray(img.convert("RGB")), img.format.lower()
+
+
+_fingerprints = {}   # (路徑, 大小, mtime_ns) → 內容雜湊：同一個檔案只讀一次
+
+
+def file_fingerprint(path: Path) -> str:
+    """
+    以檔案內容的 SHA-1 產生短版本字串。cp、docker COPY、重新 checkout 只改 mtime，版本不變，
+    cascade.json、相似案例向量庫、TF.js 匯出的版本比對才不會失效。
+    檔案沒變（大小與 mtime 相同）時沿用上次的結果，只需 stat。
+    """
+    path = Path(path)
+    st   = path.stat()
+    key  = (str(path.resolve()), st.st_size, st.st_mtime_ns)
+    fp   = _fingerprints.get(key)
+    if fp is None:
+        with open(path, "rb") as f:
+            fp = _fingerprints[key] = hashlib.file_digest(f, "sha1").hexdigest()[:12]
+    return fp
+
+
+class ServedModel:
+    def __init__(self, model, path: Path | None = None, version: str | None = None):
+        import tensorflow as tf
+        from tensorflow import keras
+
+        self.model   = model
+        self.path    = Path(path) if path else None
+        self.version = version or (file_fingerprint(path) if path else "memory")
+
+        head           = model.layers[-1]            # softmax Dense
+        self.dual      = keras.Model(model.inputs, [model.outputs[0], head.input])
+        self.input_hw  = tuple(model.inputs[0].shape[1:3])
+        self.embed_dim = int(head.input.shape[-1])
+
+        spec = tf.TensorSpec([None, *self.input_hw, 3], tf.float32)
+        self._forward = tf.function(lambda x: self.dual(x, training=False), input_signature=[spec])
+
+    @classmethod
+    def load(cls, path: Path, version: str | None = None) -> "ServedModel":
+        from tensorflow import keras
+        return cls(keras.models.load_model(path), path, version)
+
+    def infer(self, batch: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """batch: (N, H, W, 3) float32 0–1 → (機率 (N, C), embedding (N, D))"""
+        probs, emb = self._forward(np.asarray(batch, dtype=np.float32))
+        return probs.numpy(), emb.numpy()
+
+    def predict_probs(self, batch: np.ndarray) -> np.ndarray:
+        return self.infer(batch)[0]
+
+
+# ─── Cascade ───────────────────────────────────────────────────────────────────
+def escalate_mask(probs: np.ndarray, min_top1: float, min_margin: float) -> np.ndarray:
+    """(N, C) 機率 → 需要交給主模型的列（top-1 < min_top1 或 top-1 − top-2 < min_margin）"""
+    top2 = np.sort(probs, axis=1)[:, -2:]
+    return (top2[:, 1] < min_top1) | (top2[:, 1] - top2[:, 0] < min_margin)
+
+
+class Cascade:
+    """student 先答，信心不足的樣本再由主模型（full）重算"""
+
+    def __init__(self, student: ServedModel, full: ServedModel, min_top1: float, min_margin: float):
+        self.student    = student
+        self.full       = full
+        self.min_top1   = min_top1
+        self.min_margin = min_margin
+
+    @classmethod
+    def load(cls, full: ServedModel, config_path: Path = CASCADE_JSON) -> "Cascade | None":
+        """
+        讀取 calibrate_cascade.py 的設定；設定或 student 不存在、
+        或門檻是針對其他版本的模型校正時回傳 None（只用主模型）
+        """
+        if not config_path.exists() or not STUDENT_PATH.exists():
+            return None
+        with open(config_path, encoding="utf-8") as f:
+            cfg = json.load(f)
+        if cfg.get("model_version") != full.version \
+                or cfg.get("student_version") != file_fingerprint(STUDENT_PATH):
+            print("⚠️  cascade 門檻與目前模型版本不符，請重新執行 calibrate_cascade.py")
+            return None
+        return cls(ServedModel.load(STUDENT_PATH), full, cfg["min_top1"], cfg["min_margin"])
+
+    def classify(self, batch: np.ndarray, student=None, full=None) -> tuple[np.ndarray, list[str]]:
+        """
+        回傳（機率 (N, C)，每列由哪一階段回答："student" / "full"）。
+        student / full：batch → 機率 的推論函式（app.py 經由批次器）；未指定時直接呼叫模型
+        """
+        student  = student or self.student.predict_probs
+        full     = full or self.full.predict_probs
+        probs    = student(batch)
+        escalate = escalate_mask(probs, self.min_top1, self.min_margin)
+        stages   = ["full" if e else "student" for e in escalate]
+        if escalate.any():
+            probs = probs.copy()
+            probs[escalate] = full(batch[escalate])
+        return probs, stages
@@ -1,6 +1,6 @@
 """
 scrape_disease_images.py
-爬取植物病害圖片並更新 diseases.json
+爬取植物病害圖片並直接合併回 scraped_data/diseases.json（原子寫入，見 kb_store.py）
 執行方式：python scrape_disease_images.py
 """
 
@@ -11,10 +11,13 @@ import hashlib
 import requests
 from pathlib import Path
 
+from http_cache import cached_get
+from kb_store import DISEASE_JSON, load_diseases, update_diseases
+
 # ── 設定 ──────────────────────────────────────────────────────────────────────
-SAVE_DIR     = Path("static/disease_images")   # 圖片儲存資料夾
-DATA_FILE    = Path("diseases.json")            # 你的病害資料 JSON
-OUTPUT_FILE  = Path("diseases_updated.json")    # 更新後輸出
+BASE_DIR     = Path(__file__).parent
+SAVE_DIR     = BASE_DIR / "static" / "disease_images"   # 圖片儲存資料夾
+DATA_FILE    = DISEASE_JSON                              # 病害資料 JSON（讀取並合併寫回）
 HEADERS      = {"User-Agent": "Mozilla/5.0 (compatible; PhytoScan/1.0)"}
 TIMEOUT      = 10
 
@@ -65,7 +68,7 @@ def search_wikimedia(query: str, count: int = 3) -> list[dict]:
         "format":      "json",
     }
     try:
-        r = requests.get(api_url, params=params, headers=HEADERS, timeout=TIMEOUT)
+        r = cached_get(api_url, params=params, headers=HEADERS, timeout=TIMEOUT)
         r.raise_for_status()
         pages = r.json().get("query", {}).get("pages", {})
         results = []
@@ -91,94 +94,185 @@ def search_wikimedia(query: str, count: int = 3) -> list[dict]:
         return []
 
 # ── 下載圖片到本地 ────────────────────────────────────────────────────────────
-def download_image(url: str) -> str | None:
+# 流程：暫存檔（可續傳）→ 解碼驗證 → 以內容 SHA-256 命名 → os.replace 到最終位置
+# 同一張圖經不同縮圖 URL 取得時只會存一份；中斷的下載不會留下殘缺的 JPEG。
+PARTIAL_DIR      = SAVE_DIR / ".partial"
+URL_INDEX        = SAVE_DIR / "url_index.json"   # url → 檔名，避免重複下載
+DOWNLOAD_WORKERS = int(os.environ.get("PHYTOSCAN_DOWNLOAD_WORKERS", 6))
+FORMAT_EXTS      = {"JPEG": "jpg", "MPO": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+
+
+def load_url_index() -> dict:
+    if URL_INDEX.exists():
+        with open(URL_INDEX, encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_url_index(index: dict):
+    tmp = URL_INDEX.with_name(URL_INDEX.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, URL_INDEX)
+
+
+def _fetch_to_partial(url: str, part: Path):
+    """下載到 .part 檔；已有部分內容時以 Range 續傳（伺服器不支援則重新下載）"""
+    pos     = part.stat().st_size if part.exists() else 0
+    headers = dict(HEADERS)
+    if pos:
+        headers["Range"] = f"bytes={pos}-"
+
+    with requests.get(url, headers=headers, timeout=TIMEOUT, stream=True) as r:
+        if pos and r.status_code == 416:   # 已下載完整
+            return
+        r.raise_for_status()
+        mode = "ab" if pos and r.status_code == 206 else "wb"
+        with open(part, mode) as f:
+            for chunk in r.iter_content(65536):
+                f.write(chunk)
+
+
+def _verify_image(path: Path) -> str:
+    """完整解碼一次以確認檔案未截斷，回傳副檔名；失敗丟出例外"""
+    from PIL import Image
+    with Image.open(path) as im:
+        im.verify()
+    with Image.open(path) as im:
+        im.load()
+        ext = FORMAT_EXTS.get(im.format)
+    if not ext:
+        raise ValueError("不支援的圖片格式")
+    return ext
+
+
+def download_image(url: str, url_index: dict | None = None) -> str | None:
     """下載圖片，回傳本地相對路徑（失敗回傳 None）"""
     SAVE_DIR.mkdir(parents=True, exist_ok=True)
-    ext      = url.split(".")[-1].split("?")[0].lower()
-    if ext not in ("jpg", "jpeg", "png", "webp"):
-        ext = "jpg"
-    filename = hashlib.md5(url.encode()).hexdigest() + f".{ext}"
-    filepath = SAVE_DIR / filename
-    local_path = f"/static/disease_images/{filename}"
+    PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
 
-    if filepath.exists():
-        print(f"  [快取] {filename}")
-        return local_path
+    known = (url_index or {}).get(url)
+    if known and (SAVE_DIR / known).exists():
+        print(f"  [快取] {known}")
+        return f"/static/disease_images/{known}"
 
+    part = PARTIAL_DIR / (hashlib.md5(url.encode()).hexdigest() + ".part")
     try:
-        r = requests.get(url, headers=HEADERS, timeout=TIMEOUT, stream=True)
-        r.raise_for_status()
-        with open(filepath, "wb") as f:
-            for chunk in r.iter_content(8192):
-                f.write(chunk)
-        print(f"  [下載] {filename}  ← {url[:60]}")
-        return local_path
+        _fetch_to_partial(url, part)
+        try:
+            ext = _verify_image(part)
+        except Exception:
+            part.unlink(missing_ok=True)   # 內容壞掉就不要再續傳它
+            raise
+
+        sha = hashlib.sha256()
+        with open(part, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        filename = f"{sha.hexdigest()[:32]}.{ext}"
+        filepath = SAVE_DIR / filename
+
+        if filepath.exists():
+            part.unlink()
+            print(f"  [重複] {filename}  ← {url[:60]}")
+        else:
+            os.replace(part, filepath)
+            print(f"  [下載] {filename}  ← {url[:60]}")
+        return f"/static/disease_images/{filename}"
     except Exception as e:
         print(f"  [失敗] {url[:60]} → {e}")
         return None
 
-# ── 主流程 ────────────────────────────────────────────────────────────────────
-def main():
-    # 讀取現有 diseases.json（若沒有則用空清單）
-    if DATA_FILE.exists():
-        with open(DATA_FILE, encoding="utf-8") as f:
-            data = json.load(f)
-        diseases = data if isinstance(data, list) else data.get("diseases", [])
-    else:
-        # 若沒有 JSON，直接用 DISEASE_QUERIES 的 key 建立最小骨架
-        diseases = [{"id": k} for k in DISEASE_QUERIES]
-        print(f"找不到 {DATA_FILE}，將只下載圖片並建立基本結構")
 
-    updated = []
+def download_all(urls: list[str]) -> dict:
+    """以執行緒池平行下載，回傳 url → 本地路徑（失敗者不含在內）"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    url_index = load_url_index()
+    unique    = list(dict.fromkeys(u for u in urls if u and not u.startswith("/static/")))
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+        locals_ = list(pool.map(lambda u: download_image(u, url_index), unique))
+
+    result = {u: p for u, p in zip(unique, locals_) if p}
+    url_index.update({u: p.rsplit("/", 1)[-1] for u, p in result.items()})
+    save_url_index(url_index)
+    return result
+
+
+def localize_images(images: list[dict], local_map: dict) -> list[dict]:
+    """把 images[].url 改寫成本地路徑，並移除指向同一檔案的重複項目"""
+    seen, out = set(), []
+    for img in images:
+        url   = img.get("url", "")
+        local = url if url.startswith("/static/") else local_map.get(url)
+        if not local or local in seen:
+            continue
+        seen.add(local)
+        entry = dict(img, url=local)
+        if local != url:
+            entry.setdefault("origin_url", url)
+        out.append(entry)
+    return out
+
+# ── 主流程 ────────────────────────────────────────────────────────────────────
+def localize_disease_images(diseases: list[dict]) -> tuple[list[dict], int]:
+    """搜尋 + 平行下載 + 改寫 images[].url，回傳（更新後清單, 下載張數）"""
+    # ── 1. 搜尋（走 HTTP 快取，依序執行以免觸發限流）─────────────────────────
+    candidates = {}   # did → 搜尋到的圖片
     for d in diseases:
         did     = d.get("id") or d.get("_id") or d.get("disease_id", "")
         queries = DISEASE_QUERIES.get(did)
 
         if not queries:
             print(f"[跳過] {did}（無對應搜尋關鍵字）")
-            updated.append(d)
             continue
 
         # 若已有圖片且都是本地路徑，直接跳過
         existing = d.get("images", [])
         if existing and all(img.get("url", "").startswith("/static/") for img in existing):
             print(f"[已有] {did}")
-            updated.append(d)
             continue
 
         print(f"\n── {did} ──")
-        new_images = []
-
         for query in queries:
             results = search_wikimedia(query, count=2)
-            for item in results:
-                local = download_image(item["url"])
-                if local:
-                    new_images.append({
-                        "url":     local,
-                        "caption": item["caption"],
-                        "source":  item["source"],
-                    })
-            if new_images:
-                break   # 第一個成功的關鍵字就夠了
+            if results:
+                candidates[did] = results
+                break   # 第一個有結果的關鍵字就夠了
             time.sleep(0.5)
 
-        d["images"] = new_images if new_images else existing
+    # ── 2. 平行下載（搜尋結果 + 既有的遠端圖片）────────────────────────────────
+    urls = [item["url"] for items in candidates.values() for item in items]
+    urls += [img.get("url", "") for d in diseases for img in d.get("images", [])]
+    local_map = download_all(urls)
+
+    # ── 3. 改寫 images[].url 為去重後的本地路徑 ─────────────────────────────────
+    updated = []
+    for d in diseases:
+        did = d.get("id") or d.get("_id") or d.get("disease_id", "")
+        new_images = localize_images(candidates.get(did, []), local_map)
+        d["images"] = new_images or localize_images(d.get("images", []), local_map) or d.get("images", [])
         updated.append(d)
-        time.sleep(1)   # 避免過快請求
+    return updated, len(local_map)
+
+
+def main():
+    # 讀取現有 diseases.json（若沒有則用空清單）
+    diseases = load_diseases(DATA_FILE)
+    if not diseases:
+        # 若沒有 JSON，直接用 DISEASE_QUERIES 的 key 建立最小骨架
+        diseases = [{"id": k} for k in DISEASE_QUERIES]
+        print(f"找不到 {DATA_FILE}，將只下載圖片並建立基本結構")
+
+    updated, downloaded = localize_disease_images(diseases)
 
-    # 寫出更新後的 JSON
-    output = {"diseases": updated} if not isinstance(data if DATA_FILE.exists() else [], list) else updated
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    # 以 id 合併回 diseases.json（原子寫入，執行中的 app.py 不會讀到半份檔案）
+    update_diseases(updated, DATA_FILE)
 
-    print(f"\n✅ 完成！輸出至 {OUTPUT_FILE}")
-    print(f"   共處理 {len(updated)} 筆病害")
+    print(f"\n✅ 完成！已合併至 {DATA_FILE}")
+    print(f"   共處理 {len(updated)} 筆病害，下載 {downloaded} 張圖片")
     print(f"   圖片存放於 {SAVE_DIR}/")
-    print(f"\n接下來：")
-    print(f"  1. 確認 {OUTPUT_FILE} 內容正確後，取代原本的 diseases.json")
-    print(f"  2. 確保 Flask/FastAPI 有 serve static/disease_images/ 目錄")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -9,15 +9,28 @@ scrape_diseases.py
 
 爬取內容：病害名稱、病原體、症狀、分布、圖片 URL
 結果存至 scraped_data/diseases.json
+
+增量重建：每筆記錄帶 source_hash / fetched_at（見 kb_store.py），
+只有來源變更或過期的病害會重新爬取，結果以原子寫入合併回 diseases.json
+
+HTTP 回應會快取於 scraped_data/http_cache/（見 http_cache.py）
+  python scrape_diseases.py            # 使用快取 + 條件式重新驗證
+  python scrape_diseases.py --offline  # 只用快取重建，不連網
+  python scrape_diseases.py --force    # 忽略 fingerprint，全部重新爬取
 """
 import requests
-from bs4 import BeautifulSoup
+import copy
 import json
 import os
+import sys
 import time
 import re
 
-SCRAPED_DIR = "scraped_data"
+import http_cache
+from http_cache import cached_get
+from kb_store import DISEASE_JSON, STALE_AFTER, source_fingerprint, is_stale, load_diseases, update_diseases
+
+SCRAPED_DIR = str(DISEASE_JSON.parent)
 os.makedirs(SCRAPED_DIR, exist_ok=True)
 
 HEADERS = {
@@ -480,56 +493,104 @@ STATIC_DISEASES = [
 # 爬蟲函式
 # ─────────────────────────────────────────────────────────────────────────────
 
+WIKI_MIN_PARA = 80    # 少於此字數的段落（空段落、座標等）不列入摘要
+WIKI_MAX_SUMMARY = 800
+WIKI_FEED_CHUNK = 16384
+
+
+def _wiki_img_url(raw: str) -> str:
+    if raw.startswith("//"):
+        raw = "https:" + raw
+    return re.sub(r"/\d+px-", "/640px-", raw)
+
+
+def extract_wiki_lead(html: str | bytes, max_paras: int = 2,
+                      want_text: bool = True, want_img: bool = True) -> dict:
+    """
+    以 lxml 串流解析 Wikipedia 頁面，只取需要的部分：
+      - mw-parser-output 底下前 max_paras 個長段落
+      - 第一個 infobox 表格裡的第一張圖
+    需要的東西到手就停止解析；處理完的子樹立即 clear()，記憶體不隨頁面大小成長。
+    """
+    from lxml import etree
+
+    data    = html.encode("utf-8") if isinstance(html, str) else html
+    parser  = etree.HTMLPullParser(events=("start", "end"))
+    content = None
+    paras   = []
+    img_url = ""
+    infobox_seen = not want_img
+
+    def done() -> bool:
+        return (not want_text or len(paras) >= max_paras) and infobox_seen
+
+    for i in range(0, len(data), WIKI_FEED_CHUNK):
+        parser.feed(data[i:i + WIKI_FEED_CHUNK])
+        for event, el in parser.read_events():
+            if not isinstance(el.tag, str):   # 註解、processing instruction
+                continue
+            cls = el.get("class", "")
+            if event == "start":
+                if content is None and el.tag == "div" and "mw-parser-output" in cls.split():
+                    content = el
+                continue
+
+            if el.tag == "table" and not infobox_seen and "infobox" in cls:
+                infobox_seen = True
+                img = next(el.iter("img"), None)
+                if img is not None and img.get("src"):
+                    img_url = _wiki_img_url(img.get("src"))
+            elif el is content:
+                infobox_seen = True   # 內文結束，不會再有 infobox
+                want_text    = False
+            elif want_text and el.tag == "p" and content is not None and el.getparent() is content:
+                text = re.sub(r"\[.*?\]", "", "".join(el.itertext())).strip()
+                if len(text) > WIKI_MIN_PARA:
+                    paras.append(text)
+
+            if content is not None and el.getparent() is content:
+                el.clear()
+            if done():
+                return {"wiki_summary": " ".join(paras)[:WIKI_MAX_SUMMARY], "wiki_img": img_url}
+
+    return {"wiki_summary": " ".join(paras)[:WIKI_MAX_SUMMARY], "wiki_img": img_url}
+
+
 def scrape_wikipedia(disease_name_en: str, disease_id: str) -> dict:
-    """從 Wikipedia 爬取病害資訊，並用 REST API 取得高品質縮圖"""
+    """從 Wikipedia 爬取病害資訊：優先用 REST API 的摘要與縮圖，缺少時才解析頁面"""
     # ── 1. 用 REST API 取得摘要與縮圖（最穩定）──────────────────────────────
-    img_url = ""
+    img_url      = ""
+    wiki_summary = ""
     try:
         rest_url = (
             "https://en.wikipedia.org/api/rest_v1/page/summary/"
             + requests.utils.quote(disease_name_en.replace(" ", "_"))
         )
-        rr = requests.get(rest_url, headers=HEADERS, timeout=10)
+        rr = cached_get(rest_url, headers=HEADERS, timeout=10)
         if rr.status_code == 200:
             rdata = rr.json()
+            extract = (rdata.get("extract") or "").strip()
+            if len(extract) > WIKI_MIN_PARA:
+                wiki_summary = extract[:WIKI_MAX_SUMMARY]
             thumb = rdata.get("thumbnail", {}).get("source", "")
             if thumb:
                 # 把預設縮圖尺寸換成 640px
-                img_url = re.sub(r"/\d+px-", "/640px-", thumb)
+                img_url = _wiki_img_url(thumb)
                 print(f"  ✓ REST API 圖片：{img_url[:60]}...")
     except Exception as e:
         print(f"  ✗ REST API [{disease_name_en}]: {e}")
 
-    # ── 2. 爬取頁面取得文字摘要 ────────────────────────────────────────────
-    wiki_summary = ""
-    try:
-        page_url = f"https://en.wikipedia.org/wiki/{disease_name_en.replace(' ', '_')}"
-        r = requests.get(page_url, headers=HEADERS, timeout=12)
-        if r.status_code == 200:
-            soup = BeautifulSoup(r.text, "lxml")
-            content = soup.find("div", class_="mw-parser-output")
-            if content:
-                paras = []
-                for p in content.find_all("p", recursive=False):
-                    text = re.sub(r"\[.*?\]", "", p.get_text()).strip()
-                    if len(text) > 80:
-                        paras.append(text)
-                    if len(paras) >= 2:
-                        break
-                wiki_summary = " ".join(paras)[:800]
-
-                # REST API 沒取到圖時，fallback 用 infobox
-                if not img_url:
-                    infobox = soup.find("table", class_=re.compile("infobox"))
-                    if infobox:
-                        img_tag = infobox.find("img")
-                        if img_tag and img_tag.get("src"):
-                            raw = img_tag["src"]
-                            if raw.startswith("//"):
-                                raw = "https:" + raw
-                            img_url = re.sub(r"/\d+px-", "/640px-", raw)
-    except Exception as e:
-        print(f"  ✗ Wikipedia page [{disease_name_en}]: {e}")
+    # ── 2. REST API 缺摘要或圖片時，才下載頁面做局部解析 ─────────────────────
+    if not (wiki_summary and img_url):
+        try:
+            page_url = f"https://en.wikipedia.org/wiki/{disease_name_en.replace(' ', '_')}"
+            r = cached_get(page_url, headers=HEADERS, timeout=12)
+            if r.status_code == 200:
+                lead = extract_wiki_lead(r.content, want_text=not wiki_summary, want_img=not img_url)
+                wiki_summary = wiki_summary or lead["wiki_summary"]
+                img_url      = img_url or lead["wiki_img"]
+        except Exception as e:
+            print(f"  ✗ Wikipedia page [{disease_name_en}]: {e}")
 
     print(f"  ✓ Wikipedia [{disease_name_en}] - img={'有' if img_url else '無'}")
     return {"wiki_summary": wiki_summary, "wiki_img": img_url}
@@ -548,7 +609,7 @@ def scrape_additional_images(disease_name_en: str) -> list:
         "&srnamespace=6&srlimit=10&format=json"   # 多抓幾筆才能篩選
     )
     try:
-        r = requests.get(url, headers=HEADERS, timeout=10)
+        r = cached_get(url, headers=HEADERS, timeout=10)
         data = r.json()
         imgs = []
 
@@ -583,38 +644,64 @@ def scrape_additional_images(disease_name_en: str) -> list:
         return []
 
 
-def run_scraper():
+def scrape_disease(source: dict) -> dict:
+    """爬取單一病害（不改動 source），回傳帶 source_hash / fetched_at 的新記錄"""
+    disease = copy.deepcopy(source)
+    print(f"\n→ 處理：{disease['name_zh']} ({disease['name_en']})")
+    hits_before = http_cache.network_requests
+
+    # 爬取 Wikipedia
+    wiki_data = scrape_wikipedia(disease["name_en"], disease["id"])
+    if wiki_data.get("wiki_summary"):
+        disease["wiki_summary"] = wiki_data["wiki_summary"]
+    if wiki_data.get("wiki_img") and not disease["images"][0].get("url", "").startswith("http"):
+        disease["images"][0]["url"] = wiki_data["wiki_img"]
+
+    # 爬取額外圖片
+    extra_imgs = scrape_additional_images(disease["name_en"])
+    disease["images"].extend(extra_imgs)
+
+    disease["source_hash"] = source_fingerprint(source)
+    disease["fetched_at"]  = time.time()
+    if http_cache.network_requests > hits_before:
+        time.sleep(1.2)  # 避免頻繁請求（全部命中快取時不必等待）
+    return disease
+
+
+def stale_sources(max_age: float = STALE_AFTER, force: bool = False) -> list[dict]:
+    """列出需要重新爬取的 STATIC_DISEASES（來源變更、過期或尚未爬過）"""
+    if force:
+        return list(STATIC_DISEASES)
+    existing = {d.get("id"): d for d in load_diseases(DISEASE_JSON)}
+    return [s for s in STATIC_DISEASES
+            if is_stale(existing.get(s["id"]), source_fingerprint(s), max_age)]
+
+
+def run_scraper(force: bool = False, max_age: float = STALE_AFTER, workers: int = 1):
     print("=" * 60)
     print("🕷️  植物病害資訊爬蟲啟動")
     print("=" * 60)
 
-    enriched = []
-    for disease in STATIC_DISEASES:
-        print(f"\n→ 處理：{disease['name_zh']} ({disease['name_en']})")
-
-        # 爬取 Wikipedia
-        wiki_data = scrape_wikipedia(disease["name_en"], disease["id"])
-        if wiki_data.get("wiki_summary"):
-            disease["wiki_summary"] = wiki_data["wiki_summary"]
-        if wiki_data.get("wiki_img") and not disease["images"][0].get("url", "").startswith("http"):
-            disease["images"][0]["url"] = wiki_data["wiki_img"]
-
-        # 爬取額外圖片
-        extra_imgs = scrape_additional_images(disease["name_en"])
-        disease["images"].extend(extra_imgs)
+    todo    = stale_sources(max_age, force)
+    skipped = len(STATIC_DISEASES) - len(todo)
 
-        enriched.append(disease)
-        time.sleep(1.2)  # 避免頻繁請求
+    if workers > 1 and len(todo) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            enriched = list(pool.map(scrape_disease, todo))
+    else:
+        enriched = [scrape_disease(source) for source in todo]
 
-    # 儲存
-    out_path = os.path.join(SCRAPED_DIR, "diseases.json")
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump({"diseases": enriched, "total": len(enriched)}, f, ensure_ascii=False, indent=2)
+    # 合併回既有檔案（原子寫入）
+    merged = update_diseases(enriched, DISEASE_JSON) if enriched else load_diseases(DISEASE_JSON)
 
-    print(f"\n✅ 爬蟲完成！共 {len(enriched)} 筆病害資料")
-    print(f"   儲存至：{out_path}")
-    return enriched
+    print(f"\n✅ 爬蟲完成！更新 {len(enriched)} 筆、略過 {skipped} 筆（未過期），共 {len(merged)} 筆病害資料")
+    print(f"   儲存至：{DISEASE_JSON}")
+    return merged
 
 
 if __name__ == "__main__":
-    run_scraper()
\ No newline at end of file
+    if "--offline" in sys.argv:
+        http_cache.set_offline(True)
+        print("📴 離線模式：只使用 HTTP 快取")
+    run_scraper(force="--force" in sys.argv)
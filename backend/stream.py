@@ -0,0 +1,176 @@
+"""
+stream.py
+即時相機串流辨識（/api/stream WebSocket）的每連線狀態
+
+瀏覽器以 binary message 送出縮小後的相機畫面（JPEG / WebP），伺服器回傳 JSON：
+  {"type": "prediction", "frame": n, "skipped": false, "top3": [...], "stable": k, ...}
+  {"type": "no_leaf", "frame": n, "reason": ...}
+  {"type": "busy", "frame": n}          名額不足，這張沒推論（下一張再試）
+
+StreamSession：
+  - 最新畫面槽（FrameSlot）：只保留一張待處理畫面；處理中收到新畫面直接覆蓋，舊的算 dropped，
+    不會在伺服器端排隊、回傳已經過時的結果
+  - 畫面差異：每張先縮成 DIFF_SIZE 灰階，與上次推論的畫面比較平均絕對差，
+    小於 diff_threshold 時不推論，直接回傳目前的平滑結果（skipped: true）
+  - 時間平滑：機率以 EMA 累積（alpha），top-1 連續不變的次數回報為 stable
+  - 每連線推論上限：兩次推論至少間隔 1 / max_fps 秒（token bucket，容量 1），
+    推論本身由 app.py 以 batch 優先序、不排隊的流量控制名額執行，不會擠掉 /api/predict
+"""
+import io
+import time
+import threading
+
+import numpy as np
+from PIL import Image
+
+from metrics import metrics
+
+DIFF_SIZE       = (32, 32)
+DIFF_THRESHOLD  = 4.0      # 0–255 灰階的平均絕對差
+EMA_ALPHA       = 0.4
+MAX_FPS         = 4.0      # 每連線每秒最多推論幾張
+MAX_FRAME_BYTES = 512 * 1024
+
+
+class FrameSlot:
+    """容量 1 的信箱：put 覆蓋舊畫面，take 阻塞到有畫面或關閉"""
+
+    def __init__(self):
+        self._frame   = None
+        self._seq     = 0
+        self._closed  = False
+        self._cond    = threading.Condition()
+        self.dropped  = 0
+
+    def put(self, data: bytes) -> int:
+        with self._cond:
+            if self._frame is not None:
+                self.dropped += 1
+                metrics.inc("stream.frames_dropped")
+            self._seq  += 1
+            self._frame = (self._seq, data)
+            self._cond.notify()
+            return self._seq
+
+    def take(self) -> tuple[int, bytes] | None:
+        with self._cond:
+            while self._frame is None and not self._closed:
+                self._cond.wait()
+            frame, self._frame = self._frame, None
+            return frame
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+def diff_thumb(img: Image.Image) -> np.ndarray:
+    """畫面差異用的小灰階圖（JPEG 以 draft 直接縮小解碼）"""
+    img.draft("L", (DIFF_SIZE[0] * 4, DIFF_SIZE[1] * 4))
+    return np.asarray(img.convert("L").resize(DIFF_SIZE, Image.BILINEAR), dtype=np.float32)
+
+
+class StreamSession:
+    """
+    一個 WebSocket 連線。infer(img) → ("prediction", (probs, class_names)) / ("no_leaf", info) / ("busy", None)，
+    send(dict) 送出 JSON；兩者由 app.py 提供。worker 執行緒處理畫面，接收迴圈在 request 執行緒。
+    """
+
+    def __init__(self, infer, send, describe,
+                 max_fps: float = MAX_FPS, diff_threshold: float = DIFF_THRESHOLD, alpha: float = EMA_ALPHA):
+        self.infer          = infer
+        self.send           = send
+        self.class_names    = []
+        self.describe       = describe        # kaggle_class → 顯示用欄位（disease_id / 名稱 / 嚴重度）
+        self.min_interval   = 1.0 / max_fps
+        self.diff_threshold = diff_threshold
+        self.alpha          = alpha
+        self.slot           = FrameSlot()
+        self.ema            = None
+        self.stable         = 0
+        self.stats          = {"received": 0, "inferred": 0, "skipped": 0, "busy": 0, "errors": 0}
+        self._last_thumb    = None
+        self._last_top1     = None
+        self._last_no_leaf  = None    # 上一張被葉片篩選擋下時的原因（畫面沒變就沿用）
+        self._next_allowed  = 0.0
+        self._thread        = threading.Thread(target=self._run, name="stream-session", daemon=True)
+        self._thread.start()
+
+    # ── 接收（request 執行緒）────────────────────────────────────────────────
+    def feed(self, data: bytes):
+        self.stats["received"] += 1
+        metrics.inc("stream.frames_received")
+        self.slot.put(data)
+
+    def close(self):
+        self.slot.close()
+        self._thread.join(timeout=5)
+
+    # ── 處理（worker 執行緒）─────────────────────────────────────────────────
+    def _run(self):
+        while True:
+            frame = self.slot.take()
+            if frame is None:
+                return
+            seq, data = frame
+            try:
+                msg = self._process(seq, data)
+            except Exception as e:
+                self.stats["errors"] += 1
+                msg = {"type": "error", "frame": seq, "error": f"畫面解析失敗：{e}"}
+            try:
+                self.send(msg)
+            except Exception:   # 連線已關閉
+                return
+
+    def _process(self, seq: int, data: bytes) -> dict:
+        img   = Image.open(io.BytesIO(data))
+        thumb = diff_thumb(img.copy())
+        # 畫面幾乎沒變：沿用上一次的結果（平滑後的預測，或「不是葉片」）
+        if self._last_thumb is not None \
+                and float(np.abs(thumb - self._last_thumb).mean()) < self.diff_threshold:
+            self.stats["skipped"] += 1
+            metrics.inc("stream.frames_skipped")
+            if self._last_no_leaf is not None:
+                return {"type": "no_leaf", "frame": seq, "skipped": True, **self._last_no_leaf}
+            return self._prediction(seq, skipped=True)
+
+        # 每連線速率上限：還沒到下一次允許的時間就丟掉這張（不等待，下一張會更新）
+        now = time.monotonic()
+        if now < self._next_allowed:
+            self.stats["busy"] += 1
+            metrics.inc("stream.frames_rate_limited")
+            return {"type": "busy", "frame": seq, "retry_ms": round((self._next_allowed - now) * 1000)}
+        self._next_allowed = now + self.min_interval
+
+        kind, value = self.infer(Image.open(io.BytesIO(data)))
+        if kind == "busy":
+            self.stats["busy"] += 1
+            return {"type": "busy", "frame": seq}
+        if kind == "no_leaf":
+            self._last_thumb, self._last_no_leaf = thumb, value
+            return {"type": "no_leaf", "frame": seq, "skipped": False, **value}
+
+        self.stats["inferred"] += 1
+        metrics.inc("stream.frames_inferred")
+        probs, classes = np.asarray(value[0], dtype=np.float32), value[1]
+        if classes != self.class_names:   # 第一張，或串流途中模型切換成不同類別：重新累積
+            self.class_names, self.ema, self._last_top1 = classes, None, None
+        self.ema = probs if self.ema is None else self.alpha * probs + (1 - self.alpha) * self.ema
+        top1 = int(np.argmax(self.ema))
+        self.stable = self.stable + 1 if top1 == self._last_top1 else 1
+        self._last_top1, self._last_thumb, self._last_no_leaf = top1, thumb, None
+        return self._prediction(seq, skipped=False)
+
+    def _prediction(self, seq: int, skipped: bool) -> dict:
+        order = np.argsort(self.ema)[::-1][:3]
+        return {
+            "type":    "prediction",
+            "frame":   seq,
+            "skipped": skipped,
+            "stable":  self.stable,
+            "top3":    [{"kaggle_class": self.class_names[i], "confidence": round(float(self.ema[i]), 4),
+                         **self.describe(self.class_names[i])} for i in order],
+            "dropped": self.slot.dropped,
+        }
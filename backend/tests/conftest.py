@@ -0,0 +1,9 @@
+"""
+tests/conftest.py
+後端模組都在 backend/ 根目錄（沒有套件），測試直接以模組名稱 import
+執行方式（在 backend/ 下）：python -m pytest -q tests
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
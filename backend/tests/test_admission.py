@@ -0,0 +1,118 @@
+"""admission：佇列已滿 429 vs 排隊逾時 503、Retry-After 估計，以及 batch 保留名額"""
+import os
+import threading
+import time
+
+import pytest
+
+import admission
+from admission import MAX_RETRY_AFTER, AdmissionController, Overloaded
+
+
+@pytest.fixture(autouse=True)
+def fixed_service_time(monkeypatch):
+    """平均服務時間固定為 2 秒，Retry-After 不受其他測試留下的指標樣本影響"""
+    monkeypatch.setattr(admission.metrics, "mean",
+                        lambda name: 2000.0 if name == "admission.service_ms" else None)
+
+
+def hold(ctrl: AdmissionController, priority: str = "interactive", deadline=-1):
+    """在背景執行緒佔住一個名額（或排隊等名額），回傳 (釋放用 Event, 取得名額的 Event, thread)"""
+    release, entered = threading.Event(), threading.Event()
+
+    def run():
+        try:
+            with ctrl.slot(priority, deadline=deadline):
+                entered.set()
+                release.wait(5)
+        except Overloaded:
+            pass
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    return release, entered, t
+
+
+def wait_until(cond, timeout: float = 2.0):
+    end = time.perf_counter() + timeout
+    while not cond():
+        assert time.perf_counter() < end, "timeout"
+        time.sleep(0.005)
+
+
+def test_queue_full_is_429_with_retry_after():
+    ctrl = AdmissionController(max_inflight=1, max_queue=1, deadline=5)
+    rel1, in1, t1 = hold(ctrl)
+    assert in1.wait(2)
+    rel2, in2, t2 = hold(ctrl)                       # 排進唯一的佇列位置
+    wait_until(lambda: ctrl.waiting["interactive"] == 1)
+
+    t0 = time.perf_counter()
+    with pytest.raises(Overloaded) as exc:
+        with ctrl.slot("interactive"):
+            pass
+    assert time.perf_counter() - t0 < 0.5            # 立即拒絕，不排隊
+    assert exc.value.status == 429
+    assert exc.value.reason == "queue_full"
+    # 前方 1 個執行中 + 1 個排隊，每個 2 秒、並行 1 → 4 秒
+    assert exc.value.retry_after == 4
+
+    rel1.set()
+    assert in2.wait(2)                               # 排隊的請求在名額釋放後進入
+    rel2.set()
+    t1.join(2), t2.join(2)
+    assert ctrl.inflight == 0 and ctrl.waiting["interactive"] == 0
+
+
+def test_deadline_exceeded_is_503_with_retry_after():
+    ctrl = AdmissionController(max_inflight=1, max_queue=4, deadline=0.05)
+    rel, entered, t = hold(ctrl)
+    assert entered.wait(2)
+
+    with pytest.raises(Overloaded) as exc:
+        with ctrl.slot("interactive"):
+            pass
+    assert exc.value.status == 503
+    assert exc.value.reason == "deadline"
+    assert exc.value.retry_after == 4                # 1 個執行中 + 逾時時仍在佇列中的自己
+    assert ctrl.waiting["interactive"] == 0          # 逾時後離開佇列
+
+    rel.set()
+    t.join(2)
+    with ctrl.slot("interactive"):                   # 名額釋放後可正常進入
+        assert ctrl.inflight == 1
+
+
+def test_retry_after_is_clamped():
+    ctrl = AdmissionController(max_inflight=1, max_queue=16, deadline=1)
+    assert ctrl.retry_after() == 1                   # 沒有人排隊時至少 1 秒
+    ctrl.inflight, ctrl.waiting["interactive"] = 1, 100
+    assert ctrl.retry_after() == MAX_RETRY_AFTER
+
+
+def test_batch_leaves_one_slot_for_interactive():
+    ctrl = AdmissionController(max_inflight=2, max_queue=4, deadline=0.05)
+    rel, entered, t = hold(ctrl, "batch", deadline=None)
+    assert entered.wait(2)
+
+    with pytest.raises(Overloaded) as exc:           # batch 最多用 max_inflight − 1 個名額
+        with ctrl.slot("batch", deadline=0.05):
+            pass
+    assert exc.value.status == 503
+
+    with ctrl.slot("interactive"):                   # 保留的名額給互動請求
+        assert ctrl.inflight == 2
+
+    rel.set()
+    t.join(2)
+
+
+def test_overloaded_response_carries_retry_after_header():
+    os.environ.setdefault("PHYTOSCAN_KB_WATCH", "0")
+    os.environ.setdefault("PHYTOSCAN_MODEL_WATCH", "0")
+    import app as server
+
+    body, status, headers = server._overloaded_body(Overloaded(429, 7, "queue_full"))
+    assert status == 429
+    assert headers == {"Retry-After": "7"}
+    assert body["reason"] == "queue_full" and body["retry_after"] == 7
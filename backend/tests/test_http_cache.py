@@ -0,0 +1,127 @@
+"""http_cache：期限內命中不連網、過期後以 ETag / Last-Modified 條件式重新驗證（304 沿用快取）、離線重播"""
+import threading
+
+import pytest
+
+import http_cache
+from http_cache import OfflineCacheMiss, cached_get
+
+URL = "https://example.org/disease"
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, content: bytes = b"", headers: dict | None = None):
+        self.status_code = status_code
+        self.content     = content
+        self.headers     = headers or {}
+
+
+class FakeServer:
+    """取代 requests.get：依序回傳預先排好的回應，並記下每次送出的 headers"""
+
+    def __init__(self, *responses: FakeResponse):
+        self.responses = list(responses)
+        self.calls     = []
+        self._lock     = threading.Lock()
+
+    def __call__(self, url, params=None, headers=None, timeout=None):
+        with self._lock:
+            self.calls.append(dict(headers or {}))
+            return self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_cache, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(http_cache, "OFFLINE", False)
+    monkeypatch.setattr(http_cache, "network_requests", 0)
+    return tmp_path
+
+
+def serve(monkeypatch, *responses: FakeResponse) -> FakeServer:
+    server = FakeServer(*responses)
+    monkeypatch.setattr(http_cache.requests, "get", server)
+    return server
+
+
+def expire(monkeypatch, seconds: float):
+    """讓快取看起來是 seconds 秒前抓的"""
+    now = http_cache.time.time()
+    monkeypatch.setattr(http_cache.time, "time", lambda: now + seconds)
+
+
+def test_fresh_hit_skips_network(monkeypatch):
+    server = serve(monkeypatch, FakeResponse(200, b"v1", {"ETag": '"a"'}))
+    first  = cached_get(URL, max_age=60)
+    second = cached_get(URL, max_age=60)
+    assert (first.from_cache, second.from_cache) == (False, True)
+    assert second.content == b"v1"
+    assert len(server.calls) == 1
+    assert http_cache.network_requests == 1
+
+
+def test_expired_entry_revalidates_and_reuses_body_on_304(monkeypatch):
+    server = serve(monkeypatch,
+                   FakeResponse(200, b"v1", {"ETag": '"a"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}),
+                   FakeResponse(304))
+    cached_get(URL, headers={"User-Agent": "t"}, max_age=60)
+    expire(monkeypatch, 120)
+
+    r = cached_get(URL, headers={"User-Agent": "t"}, max_age=60)
+    sent = server.calls[1]
+    assert sent["If-None-Match"] == '"a"'
+    assert sent["If-Modified-Since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+    assert sent["User-Agent"] == "t"
+    assert r.status_code == 200 and r.content == b"v1" and r.from_cache
+
+    # 304 更新了 fetched_at：同一個「現在」再查一次是期限內命中，不再連網
+    cached_get(URL, max_age=60)
+    assert len(server.calls) == 2
+
+
+def test_changed_resource_replaces_cache(monkeypatch):
+    server = serve(monkeypatch,
+                   FakeResponse(200, b"v1", {"ETag": '"a"'}),
+                   FakeResponse(200, b"v2", {"ETag": '"b"'}),
+                   FakeResponse(304))
+    cached_get(URL, max_age=60)
+    expire(monkeypatch, 120)
+    assert cached_get(URL, max_age=60).content == b"v2"
+
+    expire(monkeypatch, 240)
+    r = cached_get(URL, max_age=60)
+    assert server.calls[2]["If-None-Match"] == '"b"'
+    assert r.content == b"v2"
+
+
+def test_errors_are_not_cached(monkeypatch):
+    server = serve(monkeypatch, FakeResponse(500, b"oops"), FakeResponse(200, b"ok"))
+    assert cached_get(URL).status_code == 500
+    r = cached_get(URL)
+    assert r.content == b"ok" and not r.from_cache
+    assert "If-None-Match" not in server.calls[1]
+
+
+def test_offline_replays_stale_entries_and_raises_on_miss(monkeypatch):
+    server = serve(monkeypatch, FakeResponse(200, b"v1"))
+    cached_get(URL, max_age=60)
+    expire(monkeypatch, 10 ** 6)
+    http_cache.set_offline(True)
+
+    assert cached_get(URL, max_age=60).content == b"v1"   # 過期也照樣重播
+    with pytest.raises(OfflineCacheMiss):
+        cached_get(URL + "?other=1")
+    assert len(server.calls) == 1
+
+
+def test_concurrent_writes_leave_no_temp_files(monkeypatch, cache_dir):
+    serve(monkeypatch, FakeResponse(200, b"x" * 4096, {"ETag": '"a"'}))
+    threads = [threading.Thread(target=cached_get, args=(URL,), kwargs={"max_age": 0}) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert http_cache.network_requests == 16
+    assert not list(cache_dir.glob("*/*.tmp"))
+    assert cached_get(URL, max_age=60).content == b"x" * 4096
@@ -0,0 +1,66 @@
+"""kb_search：斷詞（CJK bigram）、排序、篩選與部分命中的退回"""
+from kb_search import SearchIndex, tokenize
+
+RECORDS = [
+    {"id": "early", "name_zh": "番茄早疫病", "name_en": "Tomato Early Blight", "pathogen": "Alternaria solani",
+     "category": "真菌性病害", "severity": "中", "severity_level": 2, "host_plants": ["番茄", "馬鈴薯", "甜椒"]},
+    {"id": "late", "name_zh": "番茄晚疫病", "name_en": "Tomato Late Blight", "pathogen": "Phytophthora infestans",
+     "category": "卵菌性病害", "severity": "高", "severity_level": 3, "host_plants": ["番茄"]},
+    {"id": "spot", "name_zh": "細菌性斑點病", "name_en": "Bacterial Spot", "pathogen": "Xanthomonas",
+     "category": "細菌性病害", "severity": "中", "severity_level": 2, "host_plants": ["甜椒"],
+     "symptoms": ["葉片出現早期水浸狀小斑"]},
+]
+
+
+def ids(index, *args, **kwargs):
+    hits, total = index.search(*args, **kwargs)
+    return [RECORDS[doc]["id"] for doc, _ in hits], total
+
+
+def test_tokenize_cjk_bigrams_and_words():
+    assert tokenize("番茄早疫病") == ["番茄", "茄早", "早疫", "疫病"]
+    assert tokenize("早") == ["早"]
+    assert tokenize("Early-Blight 2") == ["early", "blight", "2"]
+    assert "番" in tokenize("番茄", unigrams=True)
+
+
+def test_cjk_bigram_query_hits():
+    index = SearchIndex(RECORDS)
+    assert ids(index, "早疫") == (["early"], 1)
+    assert ids(index, "晚疫病") == (["late"], 1)
+    assert ids(index, "疫")[0] == ["early", "late"]   # 單字查詢用 unigram
+
+
+def test_name_outranks_symptom_match():
+    index = SearchIndex(RECORDS)
+    found, _ = ids(index, "早")
+    assert found[0] == "early" and "spot" in found
+
+
+def test_all_tokens_preferred_over_partial():
+    index = SearchIndex(RECORDS)
+    assert ids(index, "tomato early") == (["early"], 1)
+    assert ids(index, "tomato xanthomonas")[1] == 3   # 沒有全部命中者：退回任一詞命中
+
+
+def test_filters():
+    index = SearchIndex(RECORDS)
+    assert ids(index, "番茄", category="卵菌性病害") == (["late"], 1)
+    assert ids(index, "blight", severity="2") == (["early"], 1)
+    assert ids(index, "blight", severity="高") == (["late"], 1)
+    assert ids(index, "番茄", category="不存在") == ([], 0)
+
+
+def test_partial_fallback_within_filter():
+    index = SearchIndex(RECORDS)
+    # 兩個詞都命中的只有 early（真菌）；篩選成細菌性病害後應退回只命中「甜椒」的 spot
+    assert ids(index, "番茄 甜椒")[0][0] == "early"
+    assert ids(index, "番茄 甜椒", category="細菌性病害") == (["spot"], 1)
+
+
+def test_limit_and_empty_query():
+    index = SearchIndex(RECORDS)
+    hits, total = index.search("番茄", limit=1)
+    assert len(hits) == 1 and total == 2
+    assert index.search("   ") == ([], 0)
+    assert SearchIndex([]).search("番茄") == ([], 0)
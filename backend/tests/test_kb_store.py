@@ -0,0 +1,82 @@
+"""kb_store：逐欄位合併、圖片在地化保留 / 去重、過期判斷、原子寫入"""
+import time
+
+import kb_store
+from kb_store import is_stale, merge_diseases, merge_images, merge_record, source_fingerprint
+
+LOCAL_X = {"url": "/static/disease_images/x.jpg", "origin_url": "https://r.example/x.jpg",
+           "sources": [{"type": "image/webp", "srcset": "/static/thumbs/x-160.webp 160w"}]}
+
+
+def test_update_overrides_and_keeps_missing_fields():
+    old = {"id": "a", "name_zh": "舊名", "pathogen": "Alternaria", "curated_note": "人工整理"}
+    merged = merge_record(old, {"id": "a", "name_zh": "新名"})
+    assert merged["name_zh"] == "新名"
+    assert merged["pathogen"] == "Alternaria"
+    assert merged["curated_note"] == "人工整理"
+
+
+def test_empty_rescraped_fields_do_not_clobber_curated_data():
+    old = {"id": "a", "wiki_summary": "整理過的摘要", "symptoms": ["葉斑"], "images": [LOCAL_X],
+           "severity_level": 2}
+    new = {"id": "a", "wiki_summary": "", "symptoms": [], "images": [], "extra": None,
+           "severity_level": 0}
+    merged = merge_record(old, new)
+    assert merged["wiki_summary"] == "整理過的摘要"
+    assert merged["symptoms"] == ["葉斑"]
+    assert merged["images"] == [LOCAL_X]
+    assert "extra" not in merged
+    assert merged["severity_level"] == 0   # 0 是有效值，不算空
+
+
+def test_localized_image_kept_when_origin_matches():
+    merged = merge_images([LOCAL_X], [{"url": "https://r.example/x.jpg", "caption": "new"},
+                                      {"url": "https://r.example/z.jpg"}])
+    assert merged[0]["url"] == LOCAL_X["url"]
+    assert merged[0]["origin_url"] == LOCAL_X["origin_url"]
+    assert merged[0]["sources"] == LOCAL_X["sources"]
+    assert merged[0]["caption"] == "new"
+    assert merged[1] == {"url": "https://r.example/z.jpg"}
+
+
+def test_localized_image_dropped_when_not_in_new_list():
+    assert merge_images([LOCAL_X], [{"url": "https://r.example/z.jpg"}]) == [{"url": "https://r.example/z.jpg"}]
+
+
+def test_images_deduplicated_by_final_url():
+    new = [{"url": "https://r.example/x.jpg"}, {"url": LOCAL_X["url"]}, {"url": "https://r.example/x.jpg"}]
+    merged = merge_images([LOCAL_X], new)
+    assert [img["url"] for img in merged] == [LOCAL_X["url"]]
+
+
+def test_merge_diseases_order_and_append():
+    existing = [{"id": "a", "v": 1}, {"name_zh": "沒有 id"}, {"id": "b", "v": 1}]
+    merged = merge_diseases(existing, [{"id": "b", "v": 2}, {"id": "c", "v": 1}])
+    assert merged == [{"id": "a", "v": 1}, {"name_zh": "沒有 id"}, {"id": "b", "v": 2}, {"id": "c", "v": 1}]
+
+
+def test_is_stale_after_source_change():
+    source = {"id": "a", "name_en": "Early blight"}
+    fp     = source_fingerprint(source)
+    record = {"id": "a", "source_hash": fp, "fetched_at": time.time()}
+    assert not is_stale(record, fp)
+    assert is_stale(record, source_fingerprint({**source, "name_en": "Late blight"}))
+    assert is_stale(None, fp)
+    assert is_stale({**record, "fetched_at": time.time() - kb_store.STALE_AFTER - 1}, fp)
+
+
+def test_fingerprint_changes_with_scraper_version(monkeypatch):
+    source = {"id": "a"}
+    fp = source_fingerprint(source)
+    monkeypatch.setattr(kb_store, "SCRAPER_VERSION", kb_store.SCRAPER_VERSION + 1)
+    assert source_fingerprint(source) != fp
+
+
+def test_update_diseases_roundtrip_leaves_no_temp_files(tmp_path):
+    path = tmp_path / "diseases.json"
+    kb_store.update_diseases([{"id": "a", "images": [LOCAL_X]}], path)
+    kb_store.update_diseases([{"id": "a", "images": [{"url": LOCAL_X["origin_url"]}]}, {"id": "b"}], path)
+    loaded = kb_store.load_diseases(path)
+    assert [d["id"] for d in loaded] == ["a", "b"]
+    assert loaded[0]["images"][0]["url"] == LOCAL_X["url"]
+    assert [p.name for p in tmp_path.iterdir()] == ["diseases.json"]
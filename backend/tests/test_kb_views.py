@@ -0,0 +1,91 @@
+"""kb_views：分頁、欄位投影、預先計算回應的 ETag / gzip，以及 /api/diseases 的條件式請求"""
+import gzip
+import json
+import os
+
+import pytest
+
+from kb_views import MAX_PER_PAGE, SUMMARY_FIELDS, KBViews, PrecomputedResponse
+
+
+class FakeKB:
+    version = "test"
+
+    def __init__(self, n: int):
+        self._records = [
+            {"id": f"d{i:02d}", "name_zh": f"病害{i}", "name_en": f"Disease {i}", "category": "真菌性病害",
+             "severity": "中", "severity_level": 2, "host_plants": ["番茄"], "symptoms": ["葉斑"],
+             "images": [{"url": f"/static/disease_images/{i}.jpg"}, {"url": "/static/disease_images/b.jpg"}]}
+            for i in range(n)
+        ]
+
+    def records(self):
+        return self._records
+
+
+def body(resp: PrecomputedResponse) -> dict:
+    return json.loads(resp.body)
+
+
+def test_full_list_is_summaries():
+    views = KBViews(FakeKB(3))
+    data  = body(views.diseases())
+    assert data["total"] == 3
+    assert set(data["diseases"][0]) == set(SUMMARY_FIELDS)
+    assert "symptoms" not in data["diseases"][0]
+    assert len(data["diseases"][0]["images"]) == 1   # 列表只帶第一張圖
+
+
+def test_pagination_slices_and_clamps():
+    views = KBViews(FakeKB(25))
+    page2 = body(views.diseases(page=2, per_page=10))
+    assert [d["id"] for d in page2["diseases"]] == [f"d{i:02d}" for i in range(10, 20)]
+    assert (page2["page"], page2["per_page"], page2["total"]) == (2, 10, 25)
+    assert body(views.diseases(page=3, per_page=10))["diseases"][-1]["id"] == "d24"
+    assert body(views.diseases(page=9, per_page=10))["diseases"] == []
+    clamped = body(views.diseases(page=0, per_page=10_000))
+    assert (clamped["page"], clamped["per_page"]) == (1, MAX_PER_PAGE)
+
+
+def test_projection_normalizes_order_and_rejects_unknown():
+    views = KBViews(FakeKB(2))
+    data  = body(views.diseases(fields=("name_zh", "id")))
+    assert list(data["diseases"][0]) == ["id", "name_zh"]
+    assert views.diseases(fields=("name_zh", "id")) is views.diseases(fields=("id", "name_zh"))
+    with pytest.raises(ValueError):
+        views.diseases(fields=("id", "password"))
+
+
+def test_precomputed_gzip_and_etag():
+    a = PrecomputedResponse({"x": "病害"})
+    assert gzip.decompress(a.gzipped) == a.body
+    assert a.etag == PrecomputedResponse({"x": "病害"}).etag
+    assert a.etag != PrecomputedResponse({"x": "other"}).etag
+
+
+@pytest.fixture(scope="module")
+def client():
+    os.environ.setdefault("PHYTOSCAN_KB_WATCH", "0")
+    os.environ.setdefault("PHYTOSCAN_MODEL_WATCH", "0")
+    import app as server
+    return server.app.test_client()
+
+
+def test_gzip_variant_has_its_own_etag(client):
+    gz    = client.get("/api/diseases", headers={"Accept-Encoding": "gzip"})
+    plain = client.get("/api/diseases", headers={"Accept-Encoding": "gzip;q=0"})
+    assert gz.headers["Content-Encoding"] == "gzip"
+    assert "Content-Encoding" not in plain.headers
+    assert gz.headers["ETag"] != plain.headers["ETag"]
+    assert gz.headers["ETag"].endswith('-gz"')
+    assert "Accept-Encoding" in gz.headers["Vary"]
+
+
+def test_if_none_match_accepts_either_variant(client):
+    plain = client.get("/api/diseases", headers={"Accept-Encoding": "identity"}).headers["ETag"]
+    gz    = client.get("/api/diseases", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    for etag in (plain, gz):
+        r = client.get("/api/diseases", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        assert r.status_code == 304
+        assert r.headers["ETag"] == gz
+    assert client.get("/api/diseases", headers={"If-None-Match": '"stale"'}).status_code == 200
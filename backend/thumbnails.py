@@ -0,0 +1,101 @@
+"""
+thumbnails.py
+病害圖片的縮圖（build_kb.py 的 thumbs 階段，離線執行）
+
+static/disease_images/ 的原圖動輒數 MB，病害列表的卡片卻只有三百多 px 寬。
+每張本地原圖產生 WIDTHS 各寬度（不放大）× WebP / AVIF（Pillow 支援時）的縮圖：
+  static/thumbs/<內容 sha256 前 16 碼>-<寬度>.<副檔名>
+檔名由內容決定，內容變了網址就變，app.py 以 immutable 長效快取送出。
+images[] 每一項補上：
+  width / height   原圖尺寸（前端保留版面空間，避免 layout shift）
+  sources          [{"type": "image/avif", "srcset": "… 160w, … 320w"}, {"type": "image/webp", …}]
+                   可直接對應 <picture><source type srcset>
+仍是遠端網址的圖片（images 階段下載失敗）不處理。
+manifest.json 記錄「原圖檔名 + 設定 → 產生的縮圖」，重跑時已處理過的原圖直接略過。
+
+執行方式：python build_kb.py --from thumbs
+"""
+import io
+import json
+import hashlib
+from pathlib import Path
+
+from PIL import Image, ImageOps, features
+
+from kb_store import atomic_write_json
+
+BASE_DIR   = Path(__file__).parent
+STATIC_DIR = BASE_DIR / "static"
+THUMB_DIR  = STATIC_DIR / "thumbs"
+MANIFEST   = THUMB_DIR / "manifest.json"
+WIDTHS     = (160, 320, 640)
+# (MIME, 副檔名, Pillow 格式, 儲存參數)；AVIF 放前面，瀏覽器取第一個支援的 <source>
+FORMATS = [
+    ("image/avif", "avif", "AVIF", {"quality": 50}),
+    ("image/webp", "webp", "WEBP", {"quality": 80, "method": 6}),
+]
+SETTINGS_KEY = hashlib.sha256(json.dumps([WIDTHS, FORMATS]).encode()).hexdigest()[:8]
+
+
+def available_formats() -> list[tuple]:
+    return [f for f in FORMATS if features.check(f[2].lower())]
+
+
+def _encode(img: Image.Image, fmt: str, params: dict) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, fmt, **params)
+    return buf.getvalue()
+
+
+def make_variants(src: Path, formats: list[tuple]) -> dict:
+    """單張原圖 → {"width", "height", "sources"}，縮圖寫入 THUMB_DIR"""
+    with Image.open(src) as im:
+        img = ImageOps.exif_transpose(im).convert("RGB")
+    w, h   = img.size
+    widths = sorted({min(t, w) for t in WIDTHS})   # 原圖比目標窄時只產生原寬一張
+    THUMB_DIR.mkdir(parents=True, exist_ok=True)
+
+    sources = []
+    for mime, ext, fmt, params in formats:
+        entries = []
+        for tw in widths:
+            resized = img if tw == w else img.resize((tw, round(h * tw / w)), Image.LANCZOS)
+            body    = _encode(resized, fmt, params)
+            name    = f"{hashlib.sha256(body).hexdigest()[:16]}-{tw}.{ext}"
+            path    = THUMB_DIR / name
+            if not path.exists():
+                tmp = path.with_suffix(".tmp")
+                tmp.write_bytes(body)
+                tmp.replace(path)
+            entries.append(f"/static/thumbs/{name} {tw}w")
+        sources.append({"type": mime, "srcset": ", ".join(entries)})
+    return {"width": w, "height": h, "sources": sources}
+
+
+def add_thumbnails(diseases: list[dict]) -> tuple[list[dict], int]:
+    """為所有本地圖片補上 width / height / sources，回傳（更新後清單, 新處理的原圖數）"""
+    formats  = available_formats()
+    manifest = json.loads(MANIFEST.read_text(encoding="utf-8")) if MANIFEST.exists() else {}
+    made     = 0
+    for d in diseases:
+        for img in d.get("images", []):
+            url = img.get("url", "")
+            if not url.startswith("/static/"):
+                continue
+            src = STATIC_DIR / url[len("/static/"):]
+            key = f"{src.name}@{SETTINGS_KEY}:{','.join(f[1] for f in formats)}"
+            if key not in manifest:
+                if not src.exists():
+                    print(f"  [缺檔] {url}")
+                    continue
+                manifest[key] = make_variants(src, formats)
+                made += 1
+                print(f"  [縮圖] {src.name}")
+            img.update(manifest[key])
+    atomic_write_json(manifest, MANIFEST)
+    return diseases, made
+
+
+if __name__ == "__main__":
+    from build_kb import build
+    build(start="thumbs")
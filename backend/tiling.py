@@ -0,0 +1,204 @@
+"""
+tiling.py
+高解析度圖塊模式（整株 / 多葉片照片）
+
+preprocess_image 會把任何尺寸的上傳壓成 224×224，4000×3000 的田間照片上病斑會消失。
+這裡改成：
+  1. 金字塔：JPEG 以 Image.draft 直接在 DCT 階段縮小解碼（不展開原尺寸），
+     縮到長邊 FINE_LONG 作為細層，再由細層縮一半作為粗層；整張只解碼一次，
+     記憶體上限固定（與原圖尺寸無關）
+  2. 每層切成 TILE×TILE、重疊 OVERLAP 的圖塊
+  3. 省運算：
+       - 背景圖塊（植物色像素比例 < MIN_TILE_PLANT，整層算一次遮罩 + 積分圖）不推論
+       - 粗到細：先推論粗層；細層圖塊只在「中心落在可疑粗層圖塊內」時才推論
+         （粗層 top-1 為病害，或信心 < REFINE_BELOW）
+       - 所有圖塊以 TILE_BATCH 為單位疊成 batch 推論
+  4. 彙總：病害類別取「植物覆蓋加權平均」與「最大值」的平均（單一病葉也不會被健康葉片稀釋），
+     健康類別只取加權平均；另回傳細層熱度格（每格 = 1 − 健康機率；沒細看的格子沿用粗層，背景為 None）
+圖塊座標（box = [x, y, w, h]）皆以細層像素為單位，細層尺寸見 stats.levels[-1]。
+"""
+import math
+
+import numpy as np
+from PIL import Image
+
+from leaf_gate import plant_mask
+
+TILE           = 224
+OVERLAP        = 0.25
+FINE_LONG      = 1344   # 細層長邊上限（6 個圖塊寬）
+MIN_FINE_LONG  = 2 * TILE   # 細層長邊小於此值時沒有切塊的意義
+MIN_TILE_PLANT = 0.15
+REFINE_BELOW   = 0.8
+TILE_BATCH     = 16
+MASK_STEP      = 4      # 植物遮罩取樣間隔（像素）
+
+
+# ─── 金字塔 ────────────────────────────────────────────────────────────────────
+class Pyramid:
+    """levels[0] = 粗層、levels[-1] = 細層，皆為 (H, W, 3) uint8"""
+
+    def __init__(self, levels: list[np.ndarray], original_size: tuple[int, int]):
+        self.levels        = levels
+        self.original_size = original_size   # (寬, 高)
+
+    @property
+    def fine(self) -> np.ndarray:
+        return self.levels[-1]
+
+    @property
+    def tileable(self) -> bool:
+        return max(self.fine.shape[:2]) >= MIN_FINE_LONG
+
+    def thumbnail(self) -> Image.Image:
+        """給 preprocess_image / 葉片篩選用的整張縮圖（不必再解碼一次原圖）"""
+        return Image.fromarray(self.levels[0])
+
+
+def build_pyramid(img: Image.Image, fine_long: int = FINE_LONG) -> Pyramid:
+    """img 需是尚未 load() 的 PIL 圖片，draft 才能在解碼時就縮小"""
+    original = img.size
+    scale    = min(fine_long / max(original), 1.0)
+    target   = (max(round(original[0] * scale), 1), max(round(original[1] * scale), 1))
+    img.draft("RGB", target)   # JPEG：解碼成 ≥ target 的 1/2、1/4、1/8 尺寸；其他格式無作用
+    img = img.convert("RGB")
+    if img.size != target:
+        img = img.resize(target, Image.BILINEAR, reducing_gap=2.0)
+    fine   = np.asarray(img)
+    levels = [fine]
+    if max(target) >= 2 * MIN_FINE_LONG:   # 細層夠大才加粗層（粗層本身也要能切塊）
+        coarse = img.resize((max(target[0] // 2, 1), max(target[1] // 2, 1)), Image.BILINEAR)
+        levels.insert(0, np.asarray(coarse))
+    return Pyramid(levels, original)
+
+
+# ─── 切塊 ──────────────────────────────────────────────────────────────────────
+def _starts(length: int, tile: int = TILE, overlap: float = OVERLAP) -> list[int]:
+    """一維上的圖塊起點：固定步長，最後一塊貼齊邊界"""
+    if length <= tile:
+        return [0]
+    stride = max(int(tile * (1 - overlap)), 1)
+    n      = math.ceil((length - tile) / stride) + 1
+    return sorted({min(i * stride, length - tile) for i in range(n)})
+
+
+def _pad(level: np.ndarray) -> np.ndarray:
+    """短邊不足一個圖塊時以邊緣像素補齊"""
+    h, w = level.shape[:2]
+    if h >= TILE and w >= TILE:
+        return level
+    return np.pad(level, ((0, max(TILE - h, 0)), (0, max(TILE - w, 0)), (0, 0)), mode="edge")
+
+
+def _plant_fraction(level: np.ndarray, boxes: list[tuple[int, int]]) -> np.ndarray:
+    """各圖塊的植物色像素比例：整層算一次遮罩，再以積分圖查每個圖塊"""
+    sub   = level[::MASK_STEP, ::MASK_STEP].astype(np.float32) / 255.0
+    mask  = plant_mask(sub).astype(np.float64)
+    integ = np.pad(mask.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+    t     = TILE // MASK_STEP
+    out   = []
+    for y, x in boxes:
+        y0, x0 = y // MASK_STEP, x // MASK_STEP
+        y1, x1 = min(y0 + t, mask.shape[0]), min(x0 + t, mask.shape[1])
+        area   = max((y1 - y0) * (x1 - x0), 1)
+        out.append((integ[y1, x1] - integ[y0, x1] - integ[y1, x0] + integ[y0, x0]) / area)
+    return np.asarray(out)
+
+
+def _infer_tiles(level: np.ndarray, boxes: list[tuple[int, int]], infer) -> np.ndarray:
+    """boxes 的圖塊以 TILE_BATCH 一批推論 → (len(boxes), C)"""
+    out = []
+    for i in range(0, len(boxes), TILE_BATCH):
+        batch = np.stack([level[y:y + TILE, x:x + TILE] for y, x in boxes[i:i + TILE_BATCH]])
+        out.append(infer(batch.astype(np.float32) / 255.0))
+    return np.concatenate(out)
+
+
+# ─── 主流程 ────────────────────────────────────────────────────────────────────
+def classify_tiles(pyramid: Pyramid, infer, class_names: list[str]) -> dict:
+    """
+    infer：(n, TILE, TILE, 3) float32 → (n, C) 機率
+    回傳 probs（整張圖的類別分數）、heat（細層熱度格）、tiles（每個推論過的圖塊）與成本統計
+    """
+    healthy = np.array(["healthy" in c.lower() for c in class_names])
+    n_cls   = len(class_names)
+
+    tiles, all_probs, weights = [], [], []
+    total = evaluated = 0
+    suspicious = None   # 粗層中需要細看的區域（細層座標）
+
+    for li, level in enumerate(pyramid.levels):
+        level   = _pad(level)
+        is_fine = li == len(pyramid.levels) - 1
+        scale   = pyramid.fine.shape[0] / pyramid.levels[li].shape[0]   # 換算到細層座標
+        ys, xs  = _starts(level.shape[0]), _starts(level.shape[1])
+        boxes   = [(y, x) for y in ys for x in xs]
+        total  += len(boxes)
+
+        plant = _plant_fraction(level, boxes)
+        keep  = plant >= MIN_TILE_PLANT
+        if is_fine and suspicious is not None:
+            centers = [((y + TILE / 2), (x + TILE / 2)) for y, x in boxes]
+            keep &= np.array([any(y0 <= cy < y1 and x0 <= cx < x1 for y0, x0, y1, x1 in suspicious)
+                              for cy, cx in centers], dtype=bool)
+        run    = [b for b, k in zip(boxes, keep) if k]
+        probs  = _infer_tiles(level, run, infer)[:, :n_cls] if run else np.zeros((0, n_cls))
+        evaluated += len(run)
+
+        level_suspicious = []
+        for (y, x), p, frac in zip(run, probs, plant[keep]):
+            top = int(np.argsort(p)[-1])
+            tiles.append({
+                "level":      "fine" if is_fine else "coarse",
+                "box":        [round(x * scale), round(y * scale), round(TILE * scale), round(TILE * scale)],
+                "class":      class_names[top],
+                "confidence": round(float(p[top]), 4),
+                "disease":    round(float(1 - p[healthy].sum()), 4),
+                "plant_frac": round(float(frac), 3),
+            })
+            all_probs.append(p)
+            weights.append(frac)
+            if not healthy[top] or p[top] < REFINE_BELOW:
+                level_suspicious.append((y * scale, x * scale, (y + TILE) * scale, (x + TILE) * scale))
+        if not is_fine:
+            suspicious = level_suspicious
+
+    if all_probs:
+        P = np.stack(all_probs)
+        w = np.asarray(weights)[:, None]
+        mean  = (P * w).sum(0) / max(w.sum(), 1e-6)
+        score = np.where(healthy, mean, (mean + P.max(0)) / 2)
+        score = score / score.sum()
+    else:
+        score = None
+
+    # 細層熱度格：細層推論過的格子用自己的結果，沒細看的格子沿用涵蓋它的粗層圖塊，背景為 None
+    fine   = _pad(pyramid.fine)
+    ys, xs = _starts(fine.shape[0]), _starts(fine.shape[1])
+    heat   = [[None] * len(xs) for _ in ys]
+    index  = {(y, x): (r, c) for r, y in enumerate(ys) for c, x in enumerate(xs)}
+    for t in tiles:
+        if t["level"] == "fine":
+            r, c = index[(t["box"][1], t["box"][0])]
+            heat[r][c] = t["disease"]
+    coarse = [t for t in tiles if t["level"] == "coarse"]
+    for r, y in enumerate(ys):
+        for c, x in enumerate(xs):
+            if heat[r][c] is None:
+                cy, cx = y + TILE / 2, x + TILE / 2
+                cover  = [t["disease"] for t in coarse
+                          if t["box"][1] <= cy < t["box"][1] + t["box"][3]
+                          and t["box"][0] <= cx < t["box"][0] + t["box"][2]]
+                heat[r][c] = max(cover) if cover else None
+
+    return {
+        "probs": score,
+        "heat":  heat,
+        "tiles": tiles,
+        "stats": {
+            "levels":          [list(lv.shape[1::-1]) for lv in pyramid.levels],
+            "original_size":   list(pyramid.original_size),
+            "tiles_total":     total,
+            "tiles_evaluated": evaluated,
+        },
+    }
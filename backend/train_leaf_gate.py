@@ -0,0 +1,109 @@
+"""
+train_leaf_gate.py
+訓練 leaf_gate 的小型二元分類器（logistic regression，純 NumPy），輸出 models/leaf_gate.json
+
+  正例：data/train/<類別>/*（每類最多 --per-class 張）
+  負例：data/non_leaf/**/*（截圖、自拍、室內照、空白照片…自行收集）
+
+  python train_leaf_gate.py [--per-class 100] [--recall 0.995]
+
+門檻選在正例（葉片）recall ≥ --recall 的最高值，優先不誤擋真正的葉片。
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from kb_store import atomic_write_json
+from leaf_gate import FEATURES, GATE_JSON, extract_features
+from model_serving import image_to_array
+
+BASE_DIR     = Path(__file__).parent
+TRAIN_DIR    = BASE_DIR / "data" / "train"
+NON_LEAF_DIR = BASE_DIR / "data" / "non_leaf"
+IMAGE_EXTS   = {".jpg", ".jpeg", ".png", ".webp"}
+IMG_SIZE     = (224, 224)
+
+
+def features_of(paths: list[Path]) -> np.ndarray:
+    rows = []
+    for p in paths:
+        try:
+            with Image.open(p) as img:
+                f = extract_features(image_to_array(img, IMG_SIZE))
+        except OSError as e:
+            print(f"  ⚠️  略過 {p.name}：{e}")
+            continue
+        rows.append([f[name] for name in FEATURES])
+    return np.asarray(rows, dtype=np.float64).reshape(-1, len(FEATURES))
+
+
+def fit_logistic(x: np.ndarray, y: np.ndarray, l2: float = 1e-3, iters: int = 2000,
+                 lr: float = 0.5) -> tuple[np.ndarray, float]:
+    """批次梯度下降（特徵只有 5 維，不需要額外套件）"""
+    w, b = np.zeros(x.shape[1]), 0.0
+    pos_weight = (y == 0).sum() / max((y == 1).sum(), 1)   # 平衡正負例
+    sample_w   = np.where(y == 1, pos_weight, 1.0)
+    sample_w  /= sample_w.mean()
+    for _ in range(iters):
+        p    = 1 / (1 + np.exp(-(x @ w + b)))
+        grad = (p - y) * sample_w
+        w   -= lr * (x.T @ grad / len(y) + l2 * w)
+        b   -= lr * grad.mean()
+    return w, b
+
+
+def train(per_class: int = 100, recall: float = 0.995) -> dict:
+    positives = []
+    if TRAIN_DIR.exists():
+        for cls_dir in sorted(p for p in TRAIN_DIR.iterdir() if p.is_dir()):
+            files = sorted(p for p in cls_dir.iterdir() if p.suffix.lower() in IMAGE_EXTS)
+            positives.extend(files[:per_class])
+    negatives = sorted(p for p in NON_LEAF_DIR.rglob("*") if p.suffix.lower() in IMAGE_EXTS) \
+        if NON_LEAF_DIR.exists() else []
+    if not positives or not negatives:
+        raise SystemExit(f"❌ 需要葉片圖片（{TRAIN_DIR}）與非葉片圖片（{NON_LEAF_DIR}）")
+    print(f"🖼️  正例 {len(positives)} 張、負例 {len(negatives)} 張")
+
+    t0 = time.time()
+    x_pos, x_neg = features_of(positives), features_of(negatives)
+    x = np.vstack([x_pos, x_neg])
+    y = np.concatenate([np.ones(len(x_pos)), np.zeros(len(x_neg))])
+    mean, std = x.mean(0), x.std(0) + 1e-9
+    w, b = fit_logistic((x - mean) / std, y)
+
+    scores    = 1 / (1 + np.exp(-(((x - mean) / std) @ w + b)))
+    pos_sc    = np.sort(scores[y == 1])
+    threshold = float(pos_sc[int((1 - recall) * len(pos_sc))])   # 葉片 recall ≥ 目標
+    rejected  = float((scores[y == 0] < threshold).mean())
+    print(f"✅ 門檻 {threshold:.3f}：葉片 recall ≥ {recall:.1%}，非葉片攔截 {rejected:.1%}"
+          f"（{time.time() - t0:.1f}s）")
+
+    model = {
+        "features":  list(FEATURES),
+        "mean":      mean.round(6).tolist(),
+        "std":       std.round(6).tolist(),
+        "weights":   w.round(6).tolist(),
+        "bias":      round(float(b), 6),
+        "threshold": round(threshold, 4),
+        "train": {"positives": int(len(x_pos)), "negatives": int(len(x_neg)),
+                  "leaf_recall": recall, "non_leaf_rejected": round(rejected, 4)},
+    }
+    atomic_write_json(model, GATE_JSON)
+    print(f"   已寫入 {GATE_JSON}")
+    return model
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="訓練 leaf_gate 二元分類器")
+    ap.add_argument("--per-class", type=int, default=100)
+    ap.add_argument("--recall", type=float, default=0.995, help="葉片最低 recall")
+    args = ap.parse_args(argv)
+    train(per_class=args.per_class, recall=args.recall)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
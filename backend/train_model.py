@@ -250,8 +250,17 @@ def train():
     # ── 最終模型 ─────────────────────────────────────────────────────────────────
     final_path = MODEL_DIR / "plant_disease_model.keras"
     model.save(final_path)
+
+    # 發佈到 registry 並設為 CURRENT；執行中的 app.py 會在背景載入、預熱後切換
+    from model_registry import publish
+    version = publish(final_path, class_names, metadata={
+        "val_accuracy": prog["best_val_acc"],
+        "dataset":      "PlantVillage (Kaggle)",
+        "base_model":   "MobileNetV2",
+        "epochs":       TOTAL_ROUNDS * EPOCHS_PER_ROUND,
+    })
     print("\n" + "=" * 62)
-    print(f"🎉 訓練全部完成！最終模型：{final_path}")
+    print(f"🎉 訓練全部完成！最終模型：{final_path}（registry 版本 {version}）")
     print(f"   最佳 val_acc：{prog['best_val_acc']:.4f}")
     print("\n  輪次摘要：")
     print(f"  {'輪':>4}  {'val_acc':>9}  {'val_loss':>9}  {'耗時(s)':>8}")
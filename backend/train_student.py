@@ -0,0 +1,141 @@
+"""
+train_student.py
+訓練 cascade 第一階段用的小模型（student）
+
+  - MobileNetV2 alpha=0.35、內部先縮到 128×128（輸入仍是 224×224，與主模型共用前處理）
+  - 分類頭只有 GlobalAveragePooling → Dense softmax
+  - 主模型存在時做知識蒸餾：標籤 = (1 - DISTILL_ALPHA) × one-hot + DISTILL_ALPHA × 主模型機率，
+    student 的信心分數因此更貼近主模型，calibrate_cascade.py 能放行更多請求
+輸出 models/student_model.keras，之後執行 calibrate_cascade.py 選門檻。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"  # 減少 TF 日誌
+
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+
+from model_registry import current_model_path
+from model_serving import STUDENT_PATH
+
+# ─── 路徑與超參數 ──────────────────────────────────────────────────────────────
+BASE_DIR      = Path(__file__).parent
+TRAIN_DIR     = BASE_DIR / "data" / "train"
+VAL_DIR       = BASE_DIR / "data" / "val"
+CLASS_JSON    = BASE_DIR / "data" / "class_names.json"
+
+IMG_SIZE      = (224, 224)
+STUDENT_SIZE  = (128, 128)
+ALPHA         = 0.35
+BATCH_SIZE    = 64
+EPOCHS        = 15
+LR            = 1e-3
+DISTILL_ALPHA = 0.5
+
+
+# ─── 資料集 ────────────────────────────────────────────────────────────────────
+def build_datasets(teacher=None):
+    if not TRAIN_DIR.exists():
+        print("❌ 找不到訓練資料，請先執行 python download_dataset.py")
+        sys.exit(1)
+
+    with open(CLASS_JSON, encoding="utf-8") as f:
+        class_names = json.load(f)["classes"]   # 與主模型相同的類別順序
+
+    augmentation = keras.Sequential([
+        layers.RandomFlip("horizontal"),
+        layers.RandomRotation(0.2),
+        layers.RandomZoom(0.15),
+    ], name="augmentation")
+    AUTOTUNE = tf.data.AUTOTUNE
+
+    def preprocess_train(x, y):
+        x = tf.cast(augmentation(x, training=True), tf.float32) / 255.0
+        if teacher is not None:
+            y = (1 - DISTILL_ALPHA) * y + DISTILL_ALPHA * teacher(x, training=False)
+        return x, y
+
+    def preprocess_val(x, y):
+        return tf.cast(x, tf.float32) / 255.0, y
+
+    common = dict(image_size=IMG_SIZE, batch_size=BATCH_SIZE, label_mode="categorical",
+                  class_names=class_names)
+    train_ds = tf.keras.utils.image_dataset_from_directory(
+        TRAIN_DIR, shuffle=True, seed=42, **common,
+    ).map(preprocess_train, num_parallel_calls=AUTOTUNE).prefetch(AUTOTUNE)
+    val_ds = tf.keras.utils.image_dataset_from_directory(
+        VAL_DIR, shuffle=False, **common,
+    ).map(preprocess_val, num_parallel_calls=AUTOTUNE).prefetch(AUTOTUNE)
+    return train_ds, val_ds, len(class_names)
+
+
+# ─── 模型建構 ──────────────────────────────────────────────────────────────────
+def build_student(num_classes):
+    base = keras.applications.MobileNetV2(
+        input_shape=(*STUDENT_SIZE, 3),
+        alpha=ALPHA,
+        include_top=False,
+        weights="imagenet",
+    )
+    inputs = keras.Input(shape=(*IMG_SIZE, 3))
+    x = layers.Resizing(*STUDENT_SIZE)(inputs)
+    x = base(x)
+    x = layers.GlobalAveragePooling2D()(x)
+    x = layers.Dropout(0.2)(x)
+    outputs = layers.Dense(num_classes, activation="softmax")(x)
+
+    model = keras.Model(inputs, outputs, name="student")
+    model.compile(
+        optimizer=keras.optimizers.Adam(LR),
+        loss="categorical_crossentropy",
+        metrics=["accuracy"],
+    )
+    return model
+
+
+# ─── 主流程 ────────────────────────────────────────────────────────────────────
+def train(epochs: int = EPOCHS, distill: bool = True):
+    teacher = None
+    teacher_path = current_model_path()
+    if distill and teacher_path:
+        teacher = keras.models.load_model(teacher_path)
+        teacher.trainable = False
+        print(f"🎓 知識蒸餾：主模型 {teacher_path.name}（α={DISTILL_ALPHA}）")
+
+    train_ds, val_ds, num_classes = build_datasets(teacher)
+    model = build_student(num_classes)
+    print(f"🆕 student：{model.count_params():,} 參數（類別：{num_classes}）")
+
+    t0 = time.time()
+    history = model.fit(
+        train_ds,
+        epochs=epochs,
+        validation_data=val_ds,
+        callbacks=[
+            keras.callbacks.EarlyStopping(monitor="val_accuracy", patience=3,
+                                          restore_best_weights=True, verbose=1),
+            keras.callbacks.ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=2,
+                                              min_lr=1e-6, verbose=1),
+        ],
+        verbose=1,
+    )
+    STUDENT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    model.save(STUDENT_PATH)
+    best = max(history.history.get("val_accuracy", [0]))
+    print(f"\n🎉 student 訓練完成：val_acc={best:.4f}  耗時={time.time() - t0:.0f}s")
+    print(f"   已存：{STUDENT_PATH}")
+    print("   下一步：python calibrate_cascade.py")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="訓練 cascade student 模型")
+    ap.add_argument("--epochs", type=int, default=EPOCHS)
+    ap.add_argument("--no-distill", action="store_true", help="不使用主模型做知識蒸餾")
+    args = ap.parse_args()
+    train(epochs=args.epochs, distill=not args.no_distill)
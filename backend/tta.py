@@ -0,0 +1,58 @@
+"""
+tta.py
+測試時增強（test-time augmentation）
+
+把一張已前處理的圖片 (1, H, W, 3) 展開成數個視角（翻轉 + 裁切後縮回原尺寸），
+疊成同一個 batch 一次 forward，再平均各視角的機率。
+batch 推論的成本遠低於逐張呼叫 N 次，延遲增加明顯小於 N 倍
+（benchmarks/bench_tta.py 在 data/val 上量測準確率提升與延遲）。
+
+/api/predict：?tta=1 強制、?tta=0 關閉；未指定時單一視角 top-1 低於
+TTA_AUTO_BELOW 才自動啟用，只有邊界案例付出額外成本。
+"""
+import numpy as np
+
+CROP_FRAC = 0.85
+
+# 視角名稱 → 裁切框 (y1, x1, y2, x2)（相對座標）與是否翻轉
+VIEWS = {
+    "identity":    ((0.0, 0.0, 1.0, 1.0), None),
+    "hflip":       ((0.0, 0.0, 1.0, 1.0), "h"),
+    "vflip":       ((0.0, 0.0, 1.0, 1.0), "v"),
+    "crop_center": (((1 - CROP_FRAC) / 2, (1 - CROP_FRAC) / 2,
+                     (1 + CROP_FRAC) / 2, (1 + CROP_FRAC) / 2), None),
+    "crop_tl":     ((0.0, 0.0, CROP_FRAC, CROP_FRAC), None),
+    "crop_br":     ((1 - CROP_FRAC, 1 - CROP_FRAC, 1.0, 1.0), "h"),
+}
+DEFAULT_VIEWS = tuple(VIEWS)
+FLIP_VIEWS    = ("identity", "hflip", "vflip")
+
+
+def tta_views(arr: np.ndarray, views: tuple[str, ...] = DEFAULT_VIEWS) -> np.ndarray:
+    """(1, H, W, 3) → (len(views), H, W, 3)；第一個視角固定為原圖，方便沿用已算好的單一視角結果"""
+    import tensorflow as tf
+
+    if views[0] != "identity":
+        raise ValueError("第一個視角必須是 identity")
+    h, w  = arr.shape[1:3]
+    boxes = np.asarray([VIEWS[v][0] for v in views], dtype=np.float32)
+    # 所有裁切一次完成（原圖的框為整張，雙線性重取樣後與原圖相同）
+    out = tf.image.crop_and_resize(arr, boxes, np.zeros(len(views), dtype=np.int32), (h, w)).numpy()
+    out[0] = arr[0]
+    for i, v in enumerate(views):
+        flip = VIEWS[v][1]
+        if flip == "h":
+            out[i] = out[i, :, ::-1]
+        elif flip == "v":
+            out[i] = out[i, ::-1]
+    return out
+
+
+def tta_average(probs: np.ndarray) -> np.ndarray:
+    """(V, C) → (C,)：各視角機率平均"""
+    return probs.mean(axis=0)
+
+
+def should_tta(probs: np.ndarray, threshold: float) -> bool:
+    """單一視角 top-1 機率低於門檻（邊界案例）時才做 TTA；threshold <= 0 表示不自動啟用"""
+    return threshold > 0 and float(np.max(probs)) < threshold
@@ -0,0 +1,173 @@
+"""
+upload_store.py
+上傳圖片的內容定址儲存（content-addressed）
+
+  uploads/ab/cd/abcd…(sha256).webp
+    - 檔名即原始位元組的 sha256，與 history.predictions.image_hash 相同，可由紀錄找回圖片
+    - 兩層目錄分散（256 × 256），單一目錄不會累積數十萬個檔案
+    - 同一張圖重複上傳不佔額外空間，只更新 mtime（保留期以最後一次上傳起算）
+request 執行緒只把位元組排入佇列（有上限，滿了就丟棄並計數）；背景執行緒負責：
+  - 重新編碼成長邊不超過 MAX_SIDE 的 WebP（PHYTOSCAN_UPLOAD_WEBP=0 時保留原始位元組）
+    用戶端送來的 224×224 raw 像素沒有檔頭，一律存成 WebP（WEBP=0 時為無損）
+  - 先寫暫存檔再 os.replace，讀取端不會看到寫一半的檔案
+  - 保留政策：超過 max_age_days 的檔案刪除；總大小超過 max_bytes 時從最舊的開始刪到 90%
+"""
+import io
+import os
+import time
+import queue
+import threading
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from metrics import metrics
+
+BASE_DIR       = Path(__file__).parent
+UPLOAD_DIR     = BASE_DIR / "uploads"
+QUEUE_MAX      = 256
+MAX_SIDE       = 1024
+WEBP_QUALITY   = 85
+SWEEP_INTERVAL = 3600    # 秒：定期依年齡清理
+SWEEP_TARGET   = 0.9     # 超過容量時刪到上限的 90%，避免每次寫入都觸發
+
+
+def fanout(root: Path, digest: str) -> Path:
+    return root / digest[:2] / digest[2:4]
+
+
+class UploadStore:
+    def __init__(self, root: Path = UPLOAD_DIR, max_bytes: int = 2 << 30,
+                 max_age_days: float = 30, reencode: bool = True):
+        self.root      = root
+        self.max_bytes = max_bytes
+        self.max_age   = max_age_days * 86400
+        self.reencode  = reencode
+        self.ext       = ".webp" if reencode else ".img"
+        self.dropped   = 0
+        self.total     = None    # 目前總位元組數（寫入執行緒第一次掃描後才有）
+        self._queue    = queue.Queue(maxsize=QUEUE_MAX)
+        self._pending  = set()   # 已排入但尚未寫入的雜湊，重複上傳不重複排隊
+        self._lock     = threading.Lock()
+        self._last_sweep = 0.0
+
+        root.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="upload-writer", daemon=True)
+        self._thread.start()
+
+    def path(self, digest: str) -> Path:
+        return fanout(self.root, digest) / f"{digest}{self.ext}"
+
+    # ── request 執行緒 ────────────────────────────────────────────────────────
+    def put(self, digest: str, data: bytes | np.ndarray) -> bool:
+        """非阻塞排入；已在佇列中的同一張圖直接略過。data 也可為 (H, W, 3) uint8 陣列"""
+        with self._lock:
+            if digest in self._pending:
+                metrics.inc("uploads.dedup")
+                return True
+            self._pending.add(digest)
+        try:
+            self._queue.put_nowait((digest, data))
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(digest)
+            self.dropped += 1
+            metrics.inc("uploads.dropped")
+            return False
+        return True
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """等到佇列清空（測試 / 關閉前使用）"""
+        end = time.time() + timeout
+        while time.time() < end:
+            with self._lock:
+                if not self._pending:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    # ── 背景寫入 ──────────────────────────────────────────────────────────────
+    def _run(self):
+        self.total = sum(size for _, size, _ in self._scan())
+        while True:
+            try:
+                digest, data = self._queue.get(timeout=SWEEP_INTERVAL)
+            except queue.Empty:
+                digest = None
+            if digest is not None:
+                try:
+                    self._write(digest, data)
+                except Exception as e:   # 壞圖或磁碟錯誤只記錄，不影響服務
+                    metrics.inc("uploads.write_errors")
+                    print(f"⚠️  上傳圖片儲存失敗（{digest[:12]}）：{e}")
+                finally:
+                    with self._lock:
+                        self._pending.discard(digest)
+            if self.total > self.max_bytes or time.time() - self._last_sweep > SWEEP_INTERVAL:
+                self.sweep()
+
+    def _encode(self, data: bytes | np.ndarray) -> bytes:
+        if isinstance(data, np.ndarray):   # 用戶端送來的 raw 像素（已是模型尺寸）
+            img = Image.fromarray(data)
+        elif not self.reencode:
+            return data
+        else:
+            img = Image.open(io.BytesIO(data))
+            img.draft("RGB", (MAX_SIDE, MAX_SIDE))   # JPEG 直接以縮小比例解碼
+            img = img.convert("RGB")
+        img.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, "WEBP", quality=WEBP_QUALITY, method=4, lossless=not self.reencode)
+        return buf.getvalue()
+
+    def _write(self, digest: str, data: bytes):
+        path = self.path(digest)
+        if path.exists():
+            os.utime(path)   # 重複上傳：只更新 mtime
+            metrics.inc("uploads.dedup")
+            return
+        body = self._encode(data)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(body)
+        os.replace(tmp, path)
+        self.total += len(body)
+        metrics.inc("uploads.stored")
+        metrics.inc("uploads.bytes_in", memoryview(data).nbytes)
+        metrics.inc("uploads.bytes_stored", len(body))
+
+    # ── 保留政策 ──────────────────────────────────────────────────────────────
+    def _scan(self):
+        """(path, size, mtime)；只走兩層 fan-out 目錄"""
+        for d1 in self.root.iterdir():
+            if not d1.is_dir() or len(d1.name) != 2:
+                continue
+            for d2 in d1.iterdir():
+                if not d2.is_dir():
+                    continue
+                for f in d2.iterdir():
+                    if f.suffix == self.ext:
+                        st = f.stat()
+                        yield f, st.st_size, st.st_mtime
+
+    def sweep(self) -> int:
+        """刪除過期檔案；仍超過容量時從最舊的刪到 SWEEP_TARGET。回傳刪除數"""
+        self._last_sweep = time.time()
+        files   = sorted(self._scan(), key=lambda x: x[2])
+        cutoff  = time.time() - self.max_age
+        total   = sum(size for _, size, _ in files)
+        limit   = self.max_bytes * SWEEP_TARGET if total > self.max_bytes else self.max_bytes
+        removed = 0
+        for path, size, mtime in files:
+            if mtime >= cutoff and total <= limit:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total   -= size
+            removed += 1
+        self.total = total
+        metrics.inc("uploads.evicted", removed)
+        return removed
@@ -0,0 +1,241 @@
+"""
+vector_index.py
+相似案例檢索用的向量索引（純 NumPy，向量皆已 L2 正規化，分數為 cosine）
+
+  BruteForceIndex : 磁碟上為 float16；第一次查詢時轉成 float32 常駐（BLAS matmul），
+                    分塊 matmul + argpartition 取 top-k，支援一次多筆查詢
+  IVFPQIndex      : IVF（k-means 粗分群）+ PQ（product quantization）壓縮碼，
+                    查詢只掃 nprobe 個群的 uint8 碼（查表加總距離），
+                    再以原始 float16 向量對前 rerank 筆精算 cosine；適合 10 萬筆以上
+  EmbeddingStore  : 載入 build_embeddings.py 的輸出（向量 + 項目 + meta + 選用 IVF-PQ）
+"""
+import numpy as np
+
+SEARCH_CHUNK = 65536   # 暴力搜尋每次 matmul 的列數，控制暫存記憶體
+
+
+def normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+def _topk(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """每列取分數最高的 k 個（已排序）"""
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+class BruteForceIndex:
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = np.asarray(vectors, dtype=np.float16)
+        self._matrix = None
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """float32 工作副本（NumPy 的 float16 matmul 沒有 BLAS，每次轉型又太慢）"""
+        if self._matrix is None:
+            self._matrix = self.vectors.astype(np.float32)
+        return self._matrix
+
+    def search(self, queries: np.ndarray, k: int = 5) -> tuple[np.ndarray, np.ndarray]:
+        """queries (Q, D) → (索引 (Q, k), cosine (Q, k))"""
+        q = normalize(np.atleast_2d(queries))
+        best_idx = best_score = None
+        matrix = self.matrix
+        for start in range(0, len(matrix), SEARCH_CHUNK):
+            idx, s = _topk(q @ matrix[start:start + SEARCH_CHUNK].T, k)
+            idx   += start
+            if best_idx is None:
+                best_idx, best_score = idx, s
+            else:
+                best_idx, best_score = np.hstack([best_idx, idx]), np.hstack([best_score, s])
+                sel = _topk(best_score, k)[0]
+                best_idx   = np.take_along_axis(best_idx, sel, axis=1)
+                best_score = np.take_along_axis(best_score, sel, axis=1)
+        return best_idx, best_score
+
+
+def kmeans(x: np.ndarray, k: int, iters: int = 20, seed: int = 0) -> np.ndarray:
+    """簡易 Lloyd k-means（L2），回傳 (k, D) 中心"""
+    rng = np.random.default_rng(seed)
+    x   = np.asarray(x, dtype=np.float32)
+    centers = x[rng.choice(len(x), size=k, replace=len(x) < k)].copy()
+    for _ in range(iters):
+        assign = _assign(x, centers)
+        sums   = np.zeros_like(centers)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=k)
+        empty  = counts == 0
+        centers[~empty] = sums[~empty] / counts[~empty, None]
+        centers[empty]  = x[rng.integers(len(x), size=int(empty.sum()))]   # 空群重新抽樣
+    return centers
+
+
+class IVFPQIndex:
+    def __init__(self, coarse: np.ndarray, codebooks: np.ndarray, codes: np.ndarray,
+                 list_offsets: np.ndarray, ids: np.ndarray, recon_sq: np.ndarray,
+                 vectors: np.ndarray | None = None):
+        self.coarse       = coarse          # (nlist, D)
+        self.codebooks    = codebooks       # (m, 256, D/m)
+        self.codes        = codes           # (N, m) uint8，依群排序
+        self.list_offsets = list_offsets    # (nlist + 1,)
+        self.ids          = ids             # (N,) 排序後位置 → 原始索引
+        self.recon_sq     = recon_sq        # (N,) 重建向量（中心 + PQ 殘差）的平方長度
+        self.vectors      = None if vectors is None else np.asarray(vectors, dtype=np.float16)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ── 建立 ──────────────────────────────────────────────────────────────────
+    @classmethod
+    def build(cls, vectors: np.ndarray, nlist: int = 256, m: int = 32,
+              train_size: int = 50000, keep_vectors: bool = True, seed: int = 0) -> "IVFPQIndex":
+        x   = normalize(vectors)
+        n, dim = x.shape
+        if dim % m:
+            raise ValueError(f"維度 {dim} 無法被 m={m} 整除")
+        rng   = np.random.default_rng(seed)
+        train = x[rng.choice(n, size=min(train_size, n), replace=False)]
+
+        coarse = kmeans(train, min(nlist, len(train)), seed=seed)
+        assign = _assign(x, coarse)
+        resid  = x - coarse[assign]
+
+        sub = dim // m
+        train_resid = resid[rng.choice(n, size=min(train_size, n), replace=False)]
+        codebooks = np.stack([
+            kmeans(train_resid[:, j * sub:(j + 1) * sub], 256, iters=15, seed=seed + j)
+            for j in range(m)
+        ])
+        codes = np.empty((n, m), dtype=np.uint8)
+        for j in range(m):
+            codes[:, j] = _assign(resid[:, j * sub:(j + 1) * sub], codebooks[j])
+
+        recon = coarse[assign] + np.concatenate(
+            [codebooks[j][codes[:, j]] for j in range(m)], axis=1)
+        recon_sq = (recon * recon).sum(1).astype(np.float32)
+
+        order   = np.argsort(assign, kind="stable")
+        counts  = np.bincount(assign, minlength=len(coarse))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return cls(coarse, codebooks, codes[order], offsets, order.astype(np.int64),
+                   recon_sq[order], x[order] if keep_vectors else None)
+
+    # ── 查詢 ──────────────────────────────────────────────────────────────────
+    def search(self, queries: np.ndarray, k: int = 5, nprobe: int = 16,
+               rerank: int = 128) -> tuple[np.ndarray, np.ndarray]:
+        """
+        近似距離 ||q - x̂||² = 1 + ||x̂||² - 2(q·c + Σ_j q_j·pq_j)：
+        q·c 來自粗分群分數，Σ_j 由每個查詢一張 (m, 256) 內積表查得，
+        ||x̂||² 建索引時已算好，所有 probe 的候選一次 gather 完成。
+        """
+        q   = normalize(np.atleast_2d(queries))
+        m, _, sub = self.codebooks.shape
+        coarse_scores = q @ self.coarse.T
+        probes = np.argpartition(-coarse_scores, min(nprobe, len(self.coarse)) - 1,
+                                 axis=1)[:, :nprobe]
+        tables = np.einsum("qms,mks->qmk", q.reshape(len(q), m, sub), self.codebooks)
+        cols   = np.arange(m)
+
+        out_idx   = np.full((len(q), k), -1, dtype=np.int64)
+        out_score = np.full((len(q), k), -np.inf, dtype=np.float32)
+        for qi, qv in enumerate(q):
+            lists = probes[qi]
+            lo, hi = self.list_offsets[lists], self.list_offsets[lists + 1]
+            sizes  = hi - lo
+            if not sizes.sum():
+                continue
+            cand = np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)])
+            qc   = np.repeat(coarse_scores[qi, lists], sizes)
+            dot  = qc + tables[qi][cols, self.codes[cand]].sum(1)
+            dist = self.recon_sq[cand] - 2 * dot
+
+            keep = min(max(rerank, k), len(cand))
+            part = np.argpartition(dist, keep - 1)[:keep]
+            sel  = cand[part]
+            if self.vectors is not None:   # 以原始向量精算 cosine
+                scores = self.vectors[sel].astype(np.float32) @ qv
+            else:                          # 由近似距離換算（單位向量：cos = 1 - d²/2）
+                scores = 1 - (1 + dist[part]) / 2
+            top = np.argsort(-scores)[:k]
+            out_idx[qi, :len(top)]   = self.ids[sel[top]]
+            out_score[qi, :len(top)] = scores[top]
+        return out_idx, out_score
+
+    # ── 存取 ──────────────────────────────────────────────────────────────────
+    def save(self, path):
+        arrays = dict(coarse=self.coarse, codebooks=self.codebooks, codes=self.codes,
+                      list_offsets=self.list_offsets, ids=self.ids, recon_sq=self.recon_sq)
+        if self.vectors is not None:
+            arrays["vectors"] = self.vectors
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path) -> "IVFPQIndex":
+        z = np.load(path)
+        return cls(z["coarse"], z["codebooks"], z["codes"], z["list_offsets"], z["ids"],
+                   z["recon_sq"], z["vectors"] if "vectors" in z.files else None)
+
+
+def _assign(x: np.ndarray, centers: np.ndarray, chunk: int = 16384) -> np.ndarray:
+    """每筆向量最近的中心（分塊計算以限制記憶體）"""
+    c_sq = (centers * centers).sum(1)
+    out  = np.empty(len(x), dtype=np.int64)
+    for s in range(0, len(x), chunk):
+        block = x[s:s + chunk]
+        out[s:s + chunk] = (c_sq[None, :] - 2 * block @ centers.T).argmin(1)
+    return out
+
+
+# ─── 相似案例向量庫 ────────────────────────────────────────────────────────────
+class EmbeddingStore:
+    """
+    build_embeddings.py 的輸出目錄：
+      vectors.npy (N, D) float16 已正規化 | items.json 每列對應的圖片資訊 |
+      meta.json（模型版本、維度…）| ivfpq.npz（選用）
+    有 IVF-PQ 索引時預設用它查詢，exact=True 時改用暴力搜尋。
+    """
+
+    def __init__(self, vectors: np.ndarray, items: list[dict], meta: dict,
+                 ivf: IVFPQIndex | None = None):
+        self.items = items
+        self.meta  = meta
+        self.brute = BruteForceIndex(vectors)
+        self.ivf   = ivf
+
+    @property
+    def model_version(self) -> str | None:
+        return self.meta.get("model_version")
+
+    @property
+    def index_type(self) -> str:
+        return "ivfpq" if self.ivf is not None else "brute"
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    @classmethod
+    def load(cls, directory) -> "EmbeddingStore":
+        import json
+        from pathlib import Path
+        directory = Path(directory)
+        with open(directory / "meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(directory / "items.json", encoding="utf-8") as f:
+            items = json.load(f)
+        vectors = np.load(directory / "vectors.npy", mmap_mode="r")
+        ivf_path = directory / "ivfpq.npz"
+        ivf = IVFPQIndex.load(ivf_path) if ivf_path.exists() else None
+        return cls(vectors, items, meta, ivf)
+
+    def search(self, queries: np.ndarray, k: int = 5,
+               exact: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        if exact or self.ivf is None:
+            return self.brute.search(queries, k)
+        return self.ivf.search(queries, k)
@@ -3,7 +3,11 @@
  * 病害資料庫卡片元件
  * 樣式請見 DiseaseCard.scss
  */
+import { useState } from 'react';
+import { assetUrl } from '../services/api';
 
+// 卡片寬度：網格 minmax(280px, 1fr)，手機單欄滿版
+const CARD_SIZES = '(max-width: 640px) 100vw, 360px';
 
 // ── 類別 → CSS modifier 對照 ──────────────────
 const CAT_CLASS = {
@@ -59,7 +63,14 @@ export function DiseaseCard({ disease, onClick }) {
         images = [],
     } = disease;
 
-    const imgUrl     = images[0]?.url ?? null;
+    const [broken, setBroken] = useState(false);
+    const img        = images[0];
+    const imgUrl     = img?.url && !broken ? assetUrl(img.url) : null;
+    // 後端縮圖（build_kb.py thumbs 階段）：AVIF / WebP 多寬度，瀏覽器依卡片寬度挑一張
+    const sources    = (img?.sources ?? []).map(s => ({
+        type:   s.type,
+        srcSet: s.srcset.split(', ').map(e => assetUrl(e)).join(', '),
+    }));
     const catMod     = CAT_CLASS[category] ?? 'other';
     const visibleHosts = host_plants.slice(0, 3);
     const extraHosts   = host_plants.length - visibleHosts.length;
@@ -71,21 +82,20 @@ export function DiseaseCard({ disease, onClick }) {
             {/* ── 圖片區 ── */}
             <div className="dc-img">
                 {imgUrl ? (
-                    <>
+                    <picture>
+                        {sources.map(s => (
+                            <source key={s.type} type={s.type} srcSet={s.srcSet} sizes={CARD_SIZES} />
+                        ))}
                         <img
                             src={imgUrl}
                             alt={name_zh}
+                            width={img.width}
+                            height={img.height}
                             loading="lazy"
-                            onError={e => {
-                                e.target.style.display = 'none';
-                                e.target.nextSibling?.style && (e.target.nextSibling.style.display = 'flex');
-                            }}
+                            decoding="async"
+                            onError={() => setBroken(true)}
                         />
-                        {/* 圖片載入失敗的備用佔位 */}
-                        <div className="dc-img-placeholder" style={{ display: 'none' }}>
-                            🌿<span>暫無圖片</span>
-                        </div>
-                    </>
+                    </picture>
                 ) : (
                     <div className="dc-img-placeholder">
                         🌿<span>暫無圖片</span>
@@ -0,0 +1,104 @@
+/**
+ * LiveCamera.jsx
+ * 即時相機辨識：相機畫面縮成 224×224 JPEG 後經 WebSocket 送出，顯示伺服器平滑後的結果
+ * 沿用 IdentifyPage 預覽區的樣式（identify__preview-*）
+ */
+import { useEffect, useRef, useState } from 'react';
+import { openIdentifyStream } from '../services/api';
+
+const FRAME_SIZE     = 224;   // 與模型輸入相同，伺服器不必再縮放
+const FRAME_INTERVAL = 250;   // ms；伺服器另有每連線上限，過快的畫面會被丟棄
+const JPEG_QUALITY   = 0.7;
+const STABLE_AFTER   = 3;     // 連續幾次推論 top-1 不變視為穩定
+
+export default function LiveCamera({ onClose }) {
+    const videoRef = useRef();
+    const [result, setResult] = useState(null);
+    const [hint, setHint]     = useState('相機啟動中…');
+
+    useEffect(() => {
+        let stream, timer, closed = false;
+        const canvas = document.createElement('canvas');
+        canvas.width = canvas.height = FRAME_SIZE;
+        const ctx = canvas.getContext('2d');
+
+        const conn = openIdentifyStream({
+            onMessage: msg => {
+                if (msg.type === 'prediction') {
+                    setResult(msg);
+                    setHint(null);
+                } else if (msg.type === 'no_leaf') {
+                    setResult(null);
+                    setHint(msg.error ?? '畫面中沒有偵測到葉片');
+                } else if (msg.type === 'error') {
+                    setHint(msg.error);
+                }
+            },
+            onClose: () => !closed && setHint('即時辨識連線已中斷'),
+        });
+
+        // 中央正方形裁切後縮到 224×224
+        const sendFrame = () => {
+            const v = videoRef.current;
+            if (!v || !v.videoWidth) return;
+            const side = Math.min(v.videoWidth, v.videoHeight);
+            ctx.drawImage(v, (v.videoWidth - side) / 2, (v.videoHeight - side) / 2, side, side,
+                0, 0, FRAME_SIZE, FRAME_SIZE);
+            canvas.toBlob(blob => blob && conn.send(blob), 'image/jpeg', JPEG_QUALITY);
+        };
+
+        navigator.mediaDevices
+            .getUserMedia({ video: { facingMode: 'environment', width: { ideal: 640 } }, audio: false })
+            .then(s => {
+                stream = s;
+                videoRef.current.srcObject = s;
+                setHint('將葉片對準畫面中央');
+                timer = setInterval(sendFrame, FRAME_INTERVAL);
+            })
+            .catch(() => setHint('無法開啟相機，請確認瀏覽器權限'));
+
+        return () => {
+            closed = true;
+            clearInterval(timer);
+            stream?.getTracks().forEach(t => t.stop());
+            conn.close();
+        };
+    }, []);
+
+    const top = result?.top3?.[0];
+    const stable = (result?.stable ?? 0) >= STABLE_AFTER;
+
+    return (
+        <div className='identify__preview anim-fade-up'>
+            <div className='identify__preview-hero'>
+                <video ref={videoRef} className='identify__preview-img' autoPlay playsInline muted />
+
+                <div className={`identify__preview-status${stable ? '' : ' identify__preview-status--scanning'}`}>
+                    <span className='identify__preview-dot' />
+                    {stable ? '結果穩定' : '即時辨識中'}
+                </div>
+
+                <div className='identify__preview-footer'>
+                    <div className='identify__progress'>
+                        <div className='identify__progress-header'>
+                            <span className='fs-4'>
+                                {top ? `${top.disease_name ?? top.kaggle_class}` : hint}
+                            </span>
+                            {top && <span className='fs-4'>{Math.round(top.confidence * 100)}%</span>}
+                        </div>
+                        {top && (
+                            <div className='identify__progress-track'>
+                                <div className='identify__progress-bar' style={{ width: `${top.confidence * 100}%` }} />
+                            </div>
+                        )}
+                        <div className='identify__preview-actions'>
+                            <button className='identify__reset-btn' onClick={onClose}>
+                                ↩ 結束即時辨識
+                            </button>
+                        </div>
+                    </div>
+                </div>
+            </div>
+        </div>
+    );
+}
@@ -64,7 +64,7 @@ const HomePage = () => {
         getStats()
             .then(r => setStats(r.data))
             .catch(() => {
-                setStats({ total_diseases: 10, total_identifications: 1389, accuracy: '94.3%', dataset: '54,305 張' });
+                setStats({ total_diseases: null, total_identifications: null, accuracy: null, dataset: null });
             });
     }, []);
 
@@ -165,8 +165,8 @@ const HomePage = () => {
                             {/* 統計 */}
                             <div className='hero-stats'>
                                 <StatBox1 value='3 秒' label='極速辨識' delay={0.35} />
-                                <StatBox1 value={stats?.accuracy ?? '95%'} label='辨識準確率' delay={0.4} />
-                                <StatBox1 value={`${stats?.total_diseases ?? '100'}+`} label='病害種類' delay={0.45} />
+                                <StatBox1 value={stats?.accuracy ?? '—'} label='辨識準確率' delay={0.4} />
+                                <StatBox1 value={stats?.total_diseases != null ? `${stats.total_diseases}+` : '—'} label='病害種類' delay={0.45} />
                             </div>
 
                             {/* 信任標語 */}
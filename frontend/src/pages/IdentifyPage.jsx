@@ -2,6 +2,7 @@ import { useState, useRef, useCallback } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { predictDisease } from '../services/api';
 import Navbar from '../layout/Navbar';
+import LiveCamera from '../components/LiveCamera';
 
 const ACCEPTED = ['image/jpeg', 'image/png', 'image/webp', 'image/heic', 'image/gif'];
 
@@ -18,6 +19,7 @@ const IdentifyPage = () => {
     const [loading, setLoading] = useState(false);
     const [progress, setProgress] = useState(0);
     const [error, setError] = useState(null);
+    const [live, setLive] = useState(false);
     const inputRef = useRef();
     const navigate = useNavigate();
 
@@ -56,13 +58,18 @@ const IdentifyPage = () => {
         setError(null);
         const timer = setInterval(() => setProgress(p => Math.min(p + Math.random() * 15, 88)), 250);
         try {
-            const res = await predictDisease(file);
+            const res = await predictDisease(file, { local: 'offline' }); // 連不上伺服器時改用本機模型
             clearInterval(timer);
             setProgress(100);
             setTimeout(() => navigate('/result', { state: { result: res.data, preview } }), 300);
-        } catch {
+        } catch (err) {
             clearInterval(timer);
             setProgress(0);
+            // 後端判定不是葉片（422）：顯示原因，不跳到結果頁
+            if (err.response?.data?.rejected) {
+                setError(err.response.data.error);
+                return;
+            }
             navigate('/result', { state: { result: buildDemo(), preview } });
         } finally {
             setLoading(false);
@@ -90,8 +97,10 @@ const IdentifyPage = () => {
                         </p>
                     </div>
 
-                    {/* ── 上傳 / 預覽區 ── */}
-                    {!preview ? (
+                    {/* ── 上傳 / 即時相機 / 預覽區 ── */}
+                    {live ? (
+                        <LiveCamera onClose={() => setLive(false)} />
+                    ) : !preview ? (
                         /* 拖曳上傳區 */
                         <div
                             className={`identify__dropzone${dragging ? ' identify__dropzone--active' : ''}`}
@@ -122,6 +131,17 @@ const IdentifyPage = () => {
                                 ))}
                             </div>
                             <p className='identify__size-hint'>最大 20 MB</p>
+                            {navigator.mediaDevices?.getUserMedia && (
+                                <button
+                                    className='identify__reset-btn'
+                                    onClick={e => {
+                                        e.stopPropagation();
+                                        setLive(true);
+                                    }}
+                                >
+                                    📷 即時辨識
+                                </button>
+                            )}
                         </div>
                     ) : (
                         /* 預覽區 */
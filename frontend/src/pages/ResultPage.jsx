@@ -161,6 +161,7 @@ const ResultPage = () => {
                     <div className='result-hero__sub'>置信度</div>
                     <div className='result-hero__time'>辨識時間：{now}</div>
                     {mode === 'DEMO' && <div className='result-hero__demo'>⚠️ DEMO 模式</div>}
+                    {mode === 'LOCAL' && <div className='result-hero__demo'>📱 本機辨識（離線模型）</div>}
                 </div>
 
                 {/* ══ 主體：左右欄 ══ */}
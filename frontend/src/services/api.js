@@ -3,6 +3,10 @@ import axios from "axios";
 
 const API_BASE = import.meta.env.VITE_API_URL || "http://localhost:5000/api";
 
+// /static/... 由後端送出（前端與 API 不同來源時需補上 API 的 origin）
+const ASSET_ORIGIN = API_BASE.replace(/\/api\/?$/, "");
+export const assetUrl = (path) => (path?.startsWith("/static/") ? ASSET_ORIGIN + path : path);
+
 const api = axios.create({
   baseURL: API_BASE,
   timeout: 30000,
@@ -28,18 +32,163 @@ export const getDiseaseById = (id) => api.get(`/diseases/${id}`);
 // ─── 系統統計 ──────────────────────────────────────────────────────────────────
 export const getStats = () => api.get("/stats");
 
+// 辨識紀錄：最近幾筆（before 往前翻頁）+ 依類別 / 日期 / 模型版本的累計
+export const getHistory = ({ limit = 20, before, days } = {}) =>
+  api.get("/history", { params: { limit, before, days } });
+
 // ─── 圖片辨識（支援 File 物件 或 base64 字串）────────────────────────────────
-export const predictDisease = (imageData) => {
-  if (imageData instanceof File) {
+// 用戶端先縮成模型輸入尺寸再上傳（X-Image-Shape）：數 MB 的手機照片變成數 KB，伺服器也不必解碼大圖
+const MODEL_SIZE = 224;
+const MODEL_SHAPE = `${MODEL_SIZE},${MODEL_SIZE},3`;
+
+// 圖片 → 模型輸入尺寸的 canvas（與伺服器的前處理相同：直接縮放，不裁切）；瀏覽器本機辨識也共用
+export const drawForModel = async (file, size = MODEL_SIZE) => {
+  const bitmap = await createImageBitmap(file);
+  const canvas = document.createElement("canvas");
+  canvas.width = canvas.height = size;
+  const ctx = canvas.getContext("2d");
+  ctx.imageSmoothingQuality = "high";
+  ctx.drawImage(bitmap, 0, 0, size, size);
+  bitmap.close();
+  return canvas;
+};
+
+// format："jpeg"（約 5–20 KB）或 "raw"（224×224×3 uint8，150 KB，無壓縮失真）
+const resizeForModel = async (file, format) => {
+  const canvas = await drawForModel(file);
+  const ctx = canvas.getContext("2d");
+  if (format === "raw") {
+    const rgba = ctx.getImageData(0, 0, MODEL_SIZE, MODEL_SIZE).data;
+    const rgb = new Uint8Array(MODEL_SIZE * MODEL_SIZE * 3);
+    for (let i = 0, j = 0; i < rgba.length; i += 4, j += 3) {
+      rgb[j] = rgba[i];
+      rgb[j + 1] = rgba[i + 1];
+      rgb[j + 2] = rgba[i + 2];
+    }
+    return new Blob([rgb], { type: "application/octet-stream" });
+  }
+  return new Promise((resolve, reject) =>
+    canvas.toBlob((b) => (b ? resolve(b) : reject(new Error("圖片縮小失敗"))), "image/jpeg", 0.85)
+  );
+};
+
+// compact："jpeg"（預設）/ "raw" / false（上傳原圖，例如要用 tiles 切塊辨識）
+const uploadForPredict = async (file, compact) => {
+  if (compact) {
+    let payload = null;
+    try {
+      payload = await resizeForModel(file, compact);
+    } catch {
+      // 瀏覽器無法解碼（例如 HEIC）：改傳原圖，由伺服器處理
+    }
+    if (payload && compact === "raw") {
+      return api.post("/predict", payload, {
+        headers: { "Content-Type": "application/octet-stream", "X-Image-Shape": MODEL_SHAPE },
+      });
+    }
+    if (payload) {
+      const formData = new FormData();
+      formData.append("image", payload, "image.jpg");
+      return api.post("/predict", formData, {
+        headers: { "Content-Type": "multipart/form-data", "X-Image-Shape": MODEL_SHAPE },
+      });
+    }
+  }
+  const formData = new FormData();
+  formData.append("image", file);
+  return api.post("/predict", formData, {
+    headers: { "Content-Type": "multipart/form-data" },
+  });
+};
+
+// 本機結果沒有葉片篩選、prediction_id（Grad-CAM）、辨識紀錄與病害詳細資料；載入失敗時回傳 null
+const predictLocal = (file, opts) =>
+  import("./localModel")
+    .then((m) => m.predictLocal(file, opts))
+    .catch(() => null);
+
+// 離線時什麼都下載不到：第一次線上辨識成功後就在背景把模組、TF.js、模型資訊與權重備妥（成功後不再重試）
+let localReady = null;
+const prefetchLocal = () => {
+  localReady ??= import("./localModel")
+    .then((m) => m.prefetchLocalModel())
+    .catch(() => false)
+    .then((ok) => ok || (localReady = null));
+};
+
+// options.local：瀏覽器本機辨識（localModel.js，需先執行 export_tfjs.py），預設關閉
+//   "offline"  照常呼叫 /predict，連不上伺服器時才在本機辨識
+//   true       另外讓校正過門檻的 student 先答，有把握的結果不上傳；其餘同 "offline"
+export const predictDisease = async (imageData, { compact = "jpeg", local = false } = {}) => {
+  if (!(imageData instanceof File)) {
+    // base64 字串
+    return api.post("/predict", { image_data: imageData });
+  }
+  if (local === true) {
+    const result = await predictLocal(imageData);
+    if (result) return { data: result }; // 與 axios 回應相同形狀，呼叫端不必區分
+  }
+  try {
+    const res = await uploadForPredict(imageData, compact);
+    if (local) prefetchLocal();
+    return res;
+  } catch (err) {
+    if (local && !err.response) {
+      // 沒有回應（離線 / 伺服器無法連線）
+      const result = await predictLocal(imageData, { offline: true });
+      if (result) return { data: result };
+    }
+    throw err;
+  }
+};
+
+// 瀏覽器本機辨識用的模型資訊（export_tfjs.py 匯出；未匯出時 404）
+export const getBrowserModel = () => api.get("/model/browser");
+
+// ─── 即時相機辨識（WebSocket /api/stream）──────────────────────────────────────
+// 送出 binary 畫面（JPEG Blob / ArrayBuffer），onMessage 收到伺服器的 JSON（prediction / no_leaf / busy / error）
+export const openIdentifyStream = ({ onMessage, onClose } = {}) => {
+  const ws = new WebSocket(API_BASE.replace(/^http/, "ws") + "/stream");
+  ws.binaryType = "arraybuffer";
+  ws.onmessage = (e) => onMessage?.(JSON.parse(e.data));
+  ws.onclose = (e) => onClose?.(e);
+  return {
+    // 上一張還沒送出去（網路慢）就跳過這張，不在用戶端堆積
+    send: (frame) => ws.readyState === WebSocket.OPEN && ws.bufferedAmount === 0 && ws.send(frame),
+    close: () => ws.close(),
+  };
+};
+
+// Grad-CAM 熱度圖（PNG）網址：prediction_id 來自 predictDisease 的回應，可直接放進 <img src>
+export const explainUrl = (predictionId, kaggleClass) =>
+  `${API_BASE}/explain/${predictionId}` + (kaggleClass ? `?class=${encodeURIComponent(kaggleClass)}` : "");
+
+// ─── 非同步辨識工作（多張圖、TTA、切塊等可能超過 30 秒的請求）────────────────────
+// options：{ tta, tiles, similar, skip_gate }，與 /predict 的查詢參數相同
+export const submitIdentifyJob = (images, options = {}) => {
+  const list = Array.isArray(images) ? images : [images];
+  if (list.every((img) => img instanceof File)) {
     const formData = new FormData();
-    formData.append("image", imageData);
-    return api.post("/predict", formData, {
+    list.forEach((img) => formData.append("image", img));
+    return api.post("/jobs", formData, {
+      params: options,
       headers: { "Content-Type": "multipart/form-data" },
     });
   }
+  return api.post("/jobs", { images: list, options });
+};
+
+export const getIdentifyJob = (jobId) => api.get(`/jobs/${jobId}`);
 
-  // base64 字串
-  return api.post("/predict", { image_data: imageData });
+// 輪詢直到完成；onProgress 每次收到進度（含部分結果）時呼叫
+export const waitForJob = async (jobId, { onProgress, interval = 1000, signal } = {}) => {
+  for (;;) {
+    const { data } = await getIdentifyJob(jobId);
+    onProgress?.(data);
+    if (data.status === "done") return data;
+    if (signal?.aborted) throw new Error("已取消");
+    await new Promise((resolve) => setTimeout(resolve, interval));
+  }
 };
 
 export default api;
\ No newline at end of file
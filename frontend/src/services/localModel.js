@@ -0,0 +1,137 @@
+// src/services/localModel.js
+// 瀏覽器本機辨識：TF.js graph model（backend/export_tfjs.py 匯出）
+//   - 模型資訊來自 /api/model/browser，連同類別 / 病害對照存在 localStorage；離線時沿用上次的
+//   - 模型存進 IndexedDB，之後不必再下載；換版後刪掉舊的
+//   - TF.js 存進 Cache Storage，離線時從快取載入
+//   - 離線時才臨時下載什麼都拿不到：api.js 在第一次線上辨識成功後呼叫 prefetchLocalModel 先備妥
+//   - 線上時只有匯出的是校正過的 student（min_top1 / min_margin 不為 0）才回答，信心不足回傳 null，
+//     由呼叫端改問 /api/predict；主模型的匯出（門檻為 0）只在離線時使用
+// 只由 api.js 以動態 import 載入
+import { assetUrl, drawForModel, getBrowserModel } from "./api";
+
+// TF.js 在第一次需要時才以 ESM 載入（不進 bundle、也不是 npm 相依）；
+// 田間離線部署可把 tf.fesm.min.js 放在自己的網域，以 VITE_TFJS_URL 指定
+const TFJS_URL =
+  import.meta.env.VITE_TFJS_URL || "https://cdn.jsdelivr.net/npm/@tensorflow/tfjs@4.22.0/dist/tf.fesm.min.js";
+const TFJS_CACHE = "phytoscan-tfjs";
+const INFO_KEY = "phytoscan.browserModel";
+const IDB_PREFIX = "indexeddb://phytoscan-";
+
+let loading = null; // 同一個分頁共用一次載入；失敗時清掉，恢復連線後可以重試
+
+// TF.js 原始碼先放進 Cache Storage，再以 blob URL import（離線時直接用快取）
+const loadTf = async () => {
+  if (!("caches" in window)) return import(/* @vite-ignore */ TFJS_URL);
+  const cache = await caches.open(TFJS_CACHE);
+  let res = await cache.match(TFJS_URL);
+  if (!res) {
+    res = await fetch(TFJS_URL);
+    if (!res.ok) throw new Error(`TF.js 下載失敗：${res.status}`);
+    await cache.put(TFJS_URL, res.clone());
+    // 換版（VITE_TFJS_URL 改變）後清掉舊的
+    (await cache.keys()).filter((req) => req.url !== TFJS_URL).forEach((req) => cache.delete(req));
+  }
+  const url = URL.createObjectURL(new Blob([await res.text()], { type: "text/javascript" }));
+  try {
+    return await import(/* @vite-ignore */ url);
+  } finally {
+    URL.revokeObjectURL(url);
+  }
+};
+
+const loadInfo = async () => {
+  const cached = JSON.parse(localStorage.getItem(INFO_KEY) || "null");
+  let info;
+  try {
+    info = (await getBrowserModel()).data;
+  } catch (err) {
+    if (cached) return cached; // 離線
+    throw err;
+  }
+  if (cached?.id === info.id) return { ...info, classes: cached.classes, diseases: cached.diseases };
+
+  const [classes, diseases] = await Promise.all([
+    fetch(assetUrl(info.classes_url)).then((r) => r.json()),
+    fetch(assetUrl(info.diseases_url)).then((r) => r.json()),
+  ]);
+  const full = { ...info, classes: classes.classes, diseases };
+  localStorage.setItem(INFO_KEY, JSON.stringify(full));
+  return full;
+};
+
+const loadModel = async (tf, info) => {
+  const key = IDB_PREFIX + info.id;
+  try {
+    return await tf.loadGraphModel(key);
+  } catch {
+    const model = await tf.loadGraphModel(assetUrl(info.model_url));
+    // 存進 IndexedDB 並清掉舊版本（失敗不影響這次辨識）
+    model
+      .save(key)
+      .then(() => tf.io.listModels())
+      .then((models) =>
+        Object.keys(models)
+          .filter((k) => k.startsWith(IDB_PREFIX) && k !== key)
+          .forEach((k) => tf.io.removeModel(k))
+      )
+      .catch(() => {});
+    return model;
+  }
+};
+
+const getLocalModel = () => {
+  loading ??= (async () => {
+    const info = await loadInfo(); // 未匯出（404）時不必下載 TF.js
+    const tf = await loadTf();
+    return { tf, info, model: await loadModel(tf, info) };
+  })().catch((err) => {
+    loading = null;
+    throw err;
+  });
+  return loading;
+};
+
+// 線上時先把離線辨識需要的東西都備妥（本模組、TF.js、模型資訊、模型權重）；回傳是否成功
+export const prefetchLocalModel = () =>
+  getLocalModel().then(
+    () => true,
+    () => false
+  );
+
+// File → 與 /api/predict 相同格式的結果（mode: "LOCAL"）；需要伺服器判斷時回傳 null
+// offline：伺服器連不上，不論門檻都回答
+export const predictLocal = async (file, { offline = false } = {}) => {
+  const { tf, info, model } = await getLocalModel();
+  const calibrated = info.min_top1 > 0 || info.min_margin > 0;
+  if (!offline && !calibrated) return null;
+  const t0 = performance.now();
+  const canvas = await drawForModel(file, info.input_size[0]);
+  const probsTensor = tf.tidy(() => model.predict(tf.browser.fromPixels(canvas).toFloat().div(255).expandDims(0)));
+  const probs = await probsTensor.data();
+  probsTensor.dispose();
+
+  const order = [...probs.keys()].sort((a, b) => probs[b] - probs[a]);
+  const [top1, top2 = 0] = [probs[order[0]], probs[order[1]]];
+  if (!offline && (top1 < info.min_top1 || top1 - top2 < info.min_margin)) return null;
+
+  const entry = (i) => {
+    const kaggleClass = info.classes[i];
+    const [diseaseId, name, severity] = info.diseases[kaggleClass] ?? [];
+    return { kaggle_class: kaggleClass, disease_id: diseaseId, disease_name: name, confidence: probs[i], severity };
+  };
+  const top3 = order.slice(0, 3).map(entry);
+  return {
+    success: true,
+    mode: "LOCAL",
+    model_version: info.model_version,
+    stage: `browser-${info.source}`,
+    elapsed_sec: +((performance.now() - t0) / 1000).toFixed(3),
+    primary: top3[0],
+    top3,
+    distribution: order.slice(0, 6).map((i) => {
+      const e = entry(i);
+      return { label: e.disease_name || e.kaggle_class, value: e.confidence * 100 };
+    }),
+    disease_detail: null, // 詳細資料需要伺服器（結果頁以 primary 顯示）
+  };
+};